@@ -13,6 +13,14 @@
 
 
 import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import queue
+import threading
+import concurrent.futures
 import pandas as pd
 from azure.identity import DefaultAzureCredential, get_bearer_token_provider
 from azure.search.documents import SearchClient
@@ -36,7 +44,7 @@ from azure.search.documents.indexes.models import (
     ExhaustiveKnnParameters,
     VectorSearchProfile,
 )
-from typing import List, Dict
+from typing import Dict, Iterable, Iterator, List
 from openai import AzureOpenAI
 from dotenv import load_dotenv
 
@@ -140,45 +148,200 @@ def create_index_definition(name: str) -> SearchIndex:
 # In[4]:
 
 
-def gen_products(
-    path: str,
-) -> List[Dict[str, any]]:
+EMBEDDING_DEPLOYMENT = "text-embedding-ada-002"
+
+
+def get_embeddings_client() -> AzureOpenAI:
     openai_service_endoint = os.environ["AZURE_OPENAI_ENDPOINT"]
-    openai_deployment = "text-embedding-ada-002"
     # openai.Embedding.create() -> client.embeddings.create()
     azure_credential = DefaultAzureCredential()
     token_provider = get_bearer_token_provider(azure_credential,"https://cognitiveservices.azure.com/.default")
-    client = AzureOpenAI(
+    return AzureOpenAI(
         api_version="2023-07-01-preview",
         azure_endpoint=openai_service_endoint,
-        azure_deployment=openai_deployment,
+        azure_deployment=EMBEDDING_DEPLOYMENT,
         azure_ad_token_provider=token_provider
     )
 
-    products = pd.read_csv(path)
-    items = []
-    for product in products.to_dict("records"):
-        content = product["description"]
-        id = str(product["id"])
-        title = product["name"]
-        url = f"/products/{title.lower().replace(' ', '-')}"
-        emb = client.embeddings.create(input=content, model=openai_deployment)
-        rec = {
-            "id": id,
-            "content": content,
-            "filepath": f"{title.lower().replace(' ', '-')}",
-            "title": title,
-            "url": url,
-            "contentVector": emb.data[0].embedding,
-        }
-        items.append(rec)
-
-    return items
+
+def read_products(path: str, chunksize: int = 500) -> Iterator[Dict[str, any]]:
+    """
+    Streams product rows from the catalog CSV without loading it all at once.
+    """
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        for product in chunk.to_dict("records"):
+            yield product
+
+
+def to_document(product: Dict[str, any]) -> Dict[str, any]:
+    title = product["name"]
+    return {
+        "id": str(product["id"]),
+        "content": product["description"],
+        "filepath": f"{title.lower().replace(' ', '-')}",
+        "title": title,
+        "url": f"/products/{title.lower().replace(' ', '-')}",
+    }
+
+
+def content_hash(doc: Dict[str, any]) -> str:
+    """
+    Hashes the indexed fields of a document, so unchanged rows can be skipped.
+    """
+    fields = {k: v for k, v in doc.items() if k != "contentVector"}
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def load_manifest(path: str) -> Dict[str, str]:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(path: str, manifest: Dict[str, str]):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def embed_documents(client: AzureOpenAI, docs: List[Dict[str, any]]) -> List[Dict[str, any]]:
+    """
+    Embeds a batch of documents with a single multi-input embeddings request.
+    """
+    emb = client.embeddings.create(input=[doc["content"] for doc in docs], model=EMBEDDING_DEPLOYMENT)
+    for item in emb.data:
+        docs[item.index]["contentVector"] = item.embedding
+    return docs
+
+
+def batched(items: Iterable, size: int) -> Iterator[List]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def index_products(
+    path: str,
+    search_client: SearchClient,
+    embed_batch_size: int = 16,
+    upload_batch_size: int = 100,
+    embed_workers: int = 4,
+    queue_size: int = 1000,
+    manifest: Dict[str, str] = None,
+) -> Dict[str, any]:
+    """
+    Streams the catalog through embedding and upload stages that run concurrently.
+
+    When a manifest of content hashes from a previous run is given, rows whose hash
+    is unchanged are skipped and the rest are written with merge-or-upload, so the
+    live index is updated in place. The hashes of every row that was written, or
+    skipped as unchanged, are returned in stats["hashes"].
+
+    Embedding requests run on a small pool and hand finished documents to a bounded
+    queue; an uploader thread drains it in batches. When uploads fall behind the
+    queue fills up, which stalls the embedders, which in turn stalls the CSV reader.
+    """
+    client = get_embeddings_client()
+    uploads = queue.Queue(maxsize=queue_size)
+    in_flight = threading.BoundedSemaphore(embed_workers * 2)
+    stats = {"documents": 0, "unchanged": 0, "embeddings": 0, "embedding_requests": 0, "upload_requests": 0}
+    stats_lock = threading.Lock()
+    hashes = {}
+    errors = []
+    write = search_client.upload_documents if manifest is None else search_client.merge_or_upload_documents
+
+    def count(**values):
+        with stats_lock:
+            for name, value in values.items():
+                stats[name] += value
+
+    def upload_worker():
+        for batch in batched(iter(uploads.get, None), upload_batch_size):
+            try:
+                results = write(batch)
+                succeeded = {r.key for r in results if r.succeeded}
+                with stats_lock:
+                    for doc in batch:
+                        if doc["id"] in succeeded:
+                            hashes[doc["id"]] = content_hash(doc)
+                count(upload_requests=1, documents=len(succeeded))
+            except Exception as e:
+                errors.append(e)
+
+    def embed_batch(docs):
+        try:
+            for doc in embed_documents(client, docs):
+                uploads.put(doc)
+            count(embedding_requests=1, embeddings=len(docs))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            in_flight.release()
+
+    def changed(docs):
+        for doc in docs:
+            digest = content_hash(doc)
+            if manifest is not None and manifest.get(doc["id"]) == digest:
+                hashes[doc["id"]] = digest
+                count(unchanged=1)
+                continue
+            yield doc
+
+    start = time.perf_counter()
+    uploader = threading.Thread(target=upload_worker)
+    uploader.start()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=embed_workers) as executor:
+        for docs in batched(changed(map(to_document, read_products(path))), embed_batch_size):
+            in_flight.acquire()
+            executor.submit(embed_batch, docs)
+    uploads.put(None)
+    uploader.join()
+    elapsed = time.perf_counter() - start
+
+    stats["seconds"] = elapsed
+    stats["failed_batches"] = len(errors)
+    stats["hashes"] = hashes
+    print(f"indexed {stats['documents']} documents in {elapsed:.1f}s ({stats['unchanged']} unchanged)")
+    print(f"  {stats['documents'] / elapsed:.1f} documents/sec over {stats['upload_requests']} upload requests")
+    print(f"  {stats['embeddings'] / elapsed:.1f} embeddings/sec over {stats['embedding_requests']} embedding requests")
+    if errors:
+        print(f"{len(errors)} batches failed during indexing, first error: {errors[0]}")
+    return stats
+
+
+def delete_removed(search_client: SearchClient, manifest: Dict[str, str], path: str) -> List[str]:
+    """
+    Deletes documents that were indexed previously but whose ids are gone from the catalog.
+    Returns the ids that could not be deleted.
+    """
+    current = {to_document(product)["id"] for product in read_products(path)}
+    removed = [id for id in manifest if id not in current]
+    failed = []
+    for batch in batched(removed, 1000):
+        results = search_client.delete_documents([{"id": id} for id in batch])
+        failed.extend(r.key for r in results if not r.succeeded)
+    print(f"deleted {len(removed) - len(failed)} documents no longer in the catalog")
+    return failed
 
 
 # In[5]:
 
 
+parser = argparse.ArgumentParser(description="Create or update the product search index")
+parser.add_argument("--incremental", action="store_true",
+                    help="update the live index in place, re-embedding only new or changed products")
+parser.add_argument("--csv", default="products.csv")
+parser.add_argument("--manifest", default="products.manifest.json",
+                    help="content hashes per product id from the last incremental run")
+args, _ = parser.parse_known_args()
+
 aisearch_endpoint = os.environ["AZURE_SEARCH_ENDPOINT"]
 index_name = "serene-key-nvrxl9mlvh"
 
@@ -186,7 +349,8 @@ search_index_client = SearchIndexClient(
     aisearch_endpoint, DefaultAzureCredential()
 )
 
-delete_index(search_index_client, index_name)
+if not args.incremental:
+    delete_index(search_index_client, index_name)
 index = create_index_definition(index_name)
 print(f"creating index {index_name}")
 search_index_client.create_or_update_index(index)
@@ -197,13 +361,26 @@ print(f"index {index_name} created")
 
 
 print(f"indexing documents")
-docs = gen_products("products.csv")
 # Upload our data to the index.
 search_client = SearchClient(
     endpoint=aisearch_endpoint,
     index_name=index_name,
     credential=DefaultAzureCredential(),
 )
-print(f"uploading {len(docs)} documents to index {index_name}")
-ds = search_client.upload_documents(docs)
-
+if args.incremental:
+    manifest = load_manifest(args.manifest)
+    if manifest and search_client.get_document_count() == 0:
+        print("index is empty, ignoring manifest and indexing every product")
+        manifest = {}
+    stats = index_products(args.csv, search_client, manifest=manifest)
+    hashes = stats["hashes"]
+    # products that failed to delete stay in the manifest so the next run retries them
+    for id in delete_removed(search_client, manifest, args.csv):
+        hashes[id] = manifest[id]
+    save_manifest(args.manifest, hashes)
+else:
+    stats = index_products(args.csv, search_client)
+    save_manifest(args.manifest, stats["hashes"])
+
+if stats["failed_batches"]:
+    sys.exit(1)
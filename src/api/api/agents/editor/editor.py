@@ -1,4 +1,4 @@
-from promptflow.core import Prompty, AzureOpenAIModelConfiguration
+from api.agents import registry
 import json
 import os 
 from dotenv import load_dotenv 
@@ -11,25 +11,17 @@ load_dotenv()
 def edit(article,feedback):
      
     
-    # Load prompty with AzureOpenAIModelConfiguration override
-    configuration = AzureOpenAIModelConfiguration(
-        azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME_4o"),
-        api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-    )
-    override_model = {
-        "configuration": configuration,
-        "parameters": {"max_tokens": 512}
-    }
-    # create path to prompty file
-    path_to_prompty = folder + "/editor.prompty"
-
-    prompty_obj = Prompty.load(path_to_prompty, model=override_model)
+    prompty_obj = registry.get_agent("editor")
     result = prompty_obj(article=article, feedback=feedback,)
     
     return result
 
 
+async def edit_async(article, feedback):
+    prompty_obj = registry.get_agent("editor", is_async=True)
+    return await prompty_obj(article=article, feedback=feedback)
+
+
 if __name__ == "__main__":
 
     result = edit(
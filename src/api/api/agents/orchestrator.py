@@ -1,28 +1,164 @@
+import os
 import json
+import time
 import logging
+import contextvars
+from concurrent import futures
 from promptflow.tracing import trace
 from api.agents.researcher import researcher
-from api.agents.writer import writer
+from api.agents.writer import writer, compaction
 from api.agents.editor import editor
 from api.agents.designer import designer
 from api.agents.product import product
 from api.logging import log_output
-from api.evaluate.evaluators import evaluate_article_in_background
+from api.metrics import timed, STAGE_SECONDS, REVISION_ITERATIONS, REVISION_STOPS
 from dotenv import load_dotenv
 load_dotenv()
 
+RESEARCH_TIMEOUT = float(os.getenv("RESEARCH_TIMEOUT_SECONDS", "90"))
+PRODUCTS_TIMEOUT = float(os.getenv("PRODUCTS_TIMEOUT_SECONDS", "30"))
+MAX_REVISIONS = int(os.getenv("MAX_REVISIONS", "2"))
+# overall latency budget for an article; 0 means revisions are only capped by MAX_REVISIONS
+LATENCY_BUDGET = float(os.getenv("ARTICLE_LATENCY_BUDGET_SECONDS", "0"))
+FAN_OUT_POLL_SECONDS = 0.05
+
+STOP_MESSAGES = {
+    "editor_done": "Editor accepted article",
+    "max_iterations": "Stopped revising after the maximum number of revisions",
+    "budget": "Stopped revising to stay within the latency budget",
+    "editor_unreadable": "Stopped revising, the editor response could not be read",
+}
+
+def needs_revision(editor_response_dict):
+    # the editor "accepts" the research feedback when the article needs more work
+    # and rejects it once the writer is done, see editor.prompty
+    return str(editor_response_dict.get("decision", "")).lower().startswith("accept")
+
+class RevisionPolicy:
+    """Decides after each editor pass whether another research, writer and editor round runs.
+
+    Revising stops when the editor is done with the article, after max_iterations
+    rounds, or when the next round is expected to overrun the latency budget. The
+    next round is estimated from the stage timings observed so far in this run, and
+    from the last round once one has run."""
+
+    def __init__(self, budget=None, max_iterations=MAX_REVISIONS):
+        self.started = time.monotonic()
+        self.budget = budget if budget and budget > 0 else None
+        self.max_iterations = max_iterations
+        self.stages = {}
+        self.iterations = 0
+        self.last_iteration = None
+
+    def observe(self, stage, seconds):
+        self.stages[stage] = seconds
+
+    def observe_iteration(self, seconds):
+        self.iterations += 1
+        self.last_iteration = seconds
+        STAGE_SECONDS.labels(stage="revision").observe(seconds)
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def estimate(self):
+        """Expected duration of the next revision round"""
+        estimate = sum(self.stages.get(stage, 0.0) for stage in ("researcher", "writer", "editor"))
+        if self.last_iteration is not None:
+            estimate = max(estimate, self.last_iteration)
+        return estimate
+
+    def stop_reason(self, editor_response_dict):
+        """None if another round should run, otherwise why revising stops"""
+        if not needs_revision(editor_response_dict):
+            return "editor_done"
+        if self.iterations >= self.max_iterations:
+            return "max_iterations"
+        if self.budget is not None and self.elapsed() + self.estimate() > self.budget:
+            return "budget"
+        return None
+
+    def stop_event(self, reason):
+        """Record why revising stopped and return it as a ("revision_stop", details) event"""
+        REVISION_ITERATIONS.observe(self.iterations)
+        REVISION_STOPS.labels(reason=reason).inc()
+        log_output("Stopped revising after %d iterations: %s", self.iterations, reason)
+        return ("revision_stop", {
+            "reason": reason,
+            "iterations": self.iterations,
+            "elapsed_seconds": round(self.elapsed(), 3),
+            "next_iteration_seconds": round(self.estimate(), 3),
+            "budget_seconds": self.budget,
+        })
+
 @trace
-def get_research(request, instructions, feedback):
+@timed(STAGE_SECONDS, stage="researcher")
+def get_research(request, instructions, feedback, memo=None):
      
     research_result = researcher.research(
         request=request,
         instructions=instructions,
-        feedback=feedback
+        feedback=feedback,
+        memo=memo
     )
     print(json.dumps(research_result, indent=2))
     return research_result
 
 @trace
+@timed(STAGE_SECONDS, stage="products")
+def get_products(request):
+    product_documenation = product.get_products(request)
+    print(json.dumps(product_documenation, indent=2))
+    return product_documenation
+
+def fan_out(branches):
+    """Run independent stages concurrently and yield (name, result) as each one finishes.
+
+    branches is a list of (name, fn, args, timeout, fallback). A branch that does
+    not finish within timeout seconds of starting yields its fallback instead so the
+    pipeline can carry on. Each call gets its own threads, one per branch, so runs
+    never queue behind each other's stages, and a timed-out branch only ties up its
+    own run's thread until it returns. Each branch runs in a copy of the caller's
+    context so the trace spans it opens are still parented under the current span."""
+    pending = {}
+    started = {}
+
+    def run_branch(name, fn, *args):
+        started[name] = time.monotonic()
+        return fn(*args)
+
+    executor = futures.ThreadPoolExecutor(max_workers=len(branches), thread_name_prefix="stage")
+    try:
+        for name, fn, args, timeout, fallback in branches:
+            ctx = contextvars.copy_context()
+            future = executor.submit(ctx.run, run_branch, name, fn, *args)
+            pending[future] = (name, timeout, fallback)
+
+        while pending:
+            now = time.monotonic()
+            # a branch's deadline starts when it starts running; until then look again shortly
+            deadlines = [
+                started[name] + timeout if name in started else now + FAN_OUT_POLL_SECONDS
+                for name, timeout, _ in pending.values()
+            ]
+            wait_for = max(0, min(deadlines) - now)
+            done, _ = futures.wait(pending, timeout=wait_for, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                name, _, _ = pending.pop(future)
+                yield (name, future.result())
+
+            now = time.monotonic()
+            for future, (name, timeout, fallback) in list(pending.items()):
+                if name in started and started[name] + timeout <= now:
+                    del pending[future]
+                    log_output("Stage %s timed out, continuing without it", name)
+                    yield (name, fallback)
+    finally:
+        # don't wait for timed-out branches; their threads exit when they return
+        executor.shutdown(wait=False, cancel_futures=True)
+
+@trace
+@timed(STAGE_SECONDS, stage="writer")
 def get_writer(request, feedback, instructions, research=[], products=[]):
     writer_reponse = writer.write(
         request=request, feedback=feedback, instructions=instructions, research=research, products=products
@@ -30,11 +166,7 @@ def get_writer(request, feedback, instructions, research=[], products=[]):
     print(json.dumps(writer_reponse, indent=2))
     return writer_reponse
 
-@trace
-def get_editor(article, feedback):
-     
-    editor_task = editor.edit(article, feedback)
-    
+def normalize_editor_response(editor_task):
     # Ensure the editor response is in JSON format
     if isinstance(editor_task, str):
         try:
@@ -47,7 +179,39 @@ def get_editor(article, feedback):
                 "editorFeedback": editor_task
             }
         editor_task = json.dumps(editor_task_json)
-    
+    return editor_task
+
+@trace
+@timed(STAGE_SECONDS, stage="writer")
+def get_writer_stream(request, feedback, instructions, research=[], products=[]):
+    """Yield ("writer_delta", text) events while the article streams in, then ("writer", response)"""
+    for kind, value in writer.write_stream(
+        request=request, feedback=feedback, instructions=instructions, research=research, products=products
+    ):
+        if kind == "delta":
+            yield ("writer_delta", value)
+        else:
+            print(json.dumps(value, indent=2))
+            yield ("writer", value)
+
+def run_writer(request, feedback, instructions, research, products, stream_writer=False):
+    """Yield the writer's events, streamed or as a single ("writer", response).
+
+    Research and products are compacted to the writer's token budget first, and what
+    that saved is reported as a ("compaction", report) event."""
+    research, products, report = compaction.compact(request, instructions, research, products)
+    log_output("Compacted writer context from %d to %d tokens", report["tokens_before"], report["tokens_after"])
+    yield ("compaction", report)
+    if stream_writer:
+        yield from get_writer_stream(request, feedback, instructions, research=research, products=products)
+    else:
+        yield ("writer", get_writer(request, feedback, instructions, research=research, products=products))
+
+@trace
+@timed(STAGE_SECONDS, stage="editor")
+def get_editor(article, feedback):
+     
+    editor_task = normalize_editor_response(editor.edit(article, feedback))
     print(json.dumps(editor_task, indent=2))
     return editor_task
 
@@ -85,35 +249,53 @@ def regenerate_process(editor_response, context, instructions, product_documenat
     return editor_response
 
 @trace
-def write_article(request, instructions, evaluate=False):
-     
-     
+def write_article(request, instructions, evaluate=False, stream_writer=False, budget=None):
+    """Run the article pipeline, yielding (type, contents) events.
+
+    budget is the latency budget in seconds for the whole run, defaulting to
+    ARTICLE_LATENCY_BUDGET_SECONDS; editor revisions stop before they would overrun it."""
     log_output("Article generation started for request: %s, instructions: %s", request, instructions)
 
+    policy = RevisionPolicy(LATENCY_BUDGET if budget is None else budget)
+    # revisions reuse the tool calls earlier rounds already made. The first round records into
+    # its own memo, kept only if it finishes in time: a timed-out branch's thread carries on and
+    # would otherwise add results to later rounds whenever its calls happened to return
+    first_memo = researcher.ResearchMemo()
+    no_research = {"web": [], "entities": [], "news": []}
     feedback = "No Feedback"
 
     yield ("message", "Starting research agent task...")
-    log_output("Getting researcher task output...")
-    research_result = get_research(request, instructions, feedback)
-    yield ("researcher", research_result)
-    # Retrieve product information relevant to the user's query
-    log_output("Product information...")
-    product_documenation = product.get_products(request)
-    # product_documenation={"id": "cHJvZHVjdHMueGxzeDQ=", "title": "", "content": "Title: products.xlsx, and peace of mind. Be wild, be free, be cooked for with the CompactCook Camping Stove!\n\n", "url": "products.xlsx"}, {"id": "cHJvZHVjdHMueGxzeDM=", "title": "", "content": "Title: products.xlsx\tStep up your hiking game with HikeMate's TrailLite Daypack. Built for comfort and efficiency, this lightweight and durable backpack offers a spacious main compartment, multiple pockets, and organization-friendly features all in one sleek package. The adjustable shoulder straps and padded back panel ensure optimal comfort during those long exhilarating treks. Course through nature without worry as the daypack's water-resistant fabric protects your essentials from unexpected showers. Plus, never run dry with the integrated hydration system. And did we mention it comes in a plethora of colors and designs? So you can choose one that truly speaks to your outdoorsy soul! Keeping your visibility in mind, we've added reflective accents that light up in low-light conditions. Don't just carry a backpack, adorn a companion that takes you a step ahead in your adventures. Trust the TrailLite Daypack for a hassle-free, enjoyable hiking experience\n\t9\tSummitClimber Backpack\t120\tBackpacks\tHikeMate\tAdventure waits for no one! Introducing the HikeMate SummitClimber Backpack, your reliable partner for every exhilarating journey. With a generous 60-liter capacity and multiple compartments and pockets, packing is a breeze. Every feature points to comfort and convenience; the ergonomic design and adjustable hip belt ensure a pleasantly personalized fit, while padded shoulder straps protect you from the burden of carrying. Venturing into wet weather? Fear not! The integrated rain cover has your back, literally. Stay hydrated thanks to the backpack's hydration system compatibility. Travelling during twilight? Reflective accents keep you visible in low-light conditions. The SummitClimber Backpack isn't merely a carrier; it's a wearable base camp constructed from ruggedly durable nylon and thoughtfully designed for the great outdoors adventurer, promising to withstand tough conditions and provide years of service. So, set off on that quest - the wild beckons! The SummitClimber Backpack - your hearty companion on every expedition!"}
-    yield ("products", product_documenation)
+    log_output("Getting researcher task output and product information...")
+    stages_started = time.monotonic()
+    stages = fan_out([
+        ("researcher", get_research, (request, instructions, feedback, first_memo), RESEARCH_TIMEOUT, no_research),
+        ("products", get_products, (request,), PRODUCTS_TIMEOUT, []),
+    ])
+    for name, result in stages:
+        policy.observe(name, time.monotonic() - stages_started)
+        if name == "researcher":
+            research_result = result
+            research_memo = first_memo if result is not no_research else researcher.ResearchMemo()
+        else:
+            product_documenation = result
+        yield (name, result)
     # Then send it to the writer, the writer writes the article
     yield ("message", "Starting writer agent task...")
     log_output("Getting writer task output...")
-    writer_response = get_writer(request, feedback, instructions, research=research_result, products=product_documenation)
-    yield ("writer", writer_response)
+    writer_started = time.monotonic()
+    for event in run_writer(request, feedback, instructions, research_result, product_documenation, stream_writer):
+        writer_response = event[1]
+        yield event
+    policy.observe("writer", time.monotonic() - writer_started)
     # Then send it to the editor, to decide if it's good or not
     yield ("message", "Starting editor agent task...")
     log_output("Getting editor task output...")
+    editor_started = time.monotonic()
     editor_response = get_editor(writer_response["article"], writer_response["feedback"])
+    policy.observe("editor", time.monotonic() - editor_started)
     log_output("Editor response: %s", editor_response)
 
     yield ("editor", editor_response)
-    retry_count = 0
 
     print(f"Editor response raw: {editor_response}")
 
@@ -121,40 +303,53 @@ def write_article(request, instructions, evaluate=False):
         editor_response_dict = json.loads(editor_response)
     except json.JSONDecodeError as e:
         log_output("Failed to parse editor response: %s", str(e))
+        yield policy.stop_event("editor_unreadable")
         return
 
-    while(str(editor_response_dict["decision"]).lower().startswith("accept")):
-        yield ("message", f"Sending editor feedback ({retry_count + 1})...")
-        log_output("Regeneration attempt %d based on editor feedback", retry_count + 1)
+    while True:
+        reason = policy.stop_reason(editor_response_dict)
+        if reason is not None:
+            break
+
+        iteration_started = time.monotonic()
+        yield ("message", f"Sending editor feedback ({policy.iterations + 1})...")
+        log_output("Regeneration attempt %d based on editor feedback", policy.iterations + 1)
 
         researchFeedback = editor_response_dict.get("researchFeedback", "No Feedback")
         editorFeedback = editor_response_dict.get("editorFeedback", "No Feedback")
-        
-        research_result = get_research(request, instructions, researchFeedback)
+
+        stage_started = time.monotonic()
+        research_result = get_research(request, instructions, researchFeedback, research_memo)
+        policy.observe("researcher", time.monotonic() - stage_started)
         yield ("researcher", research_result)
 
-        writer_response = get_writer(request, editorFeedback, instructions, research=research_result, products=product_documenation)
-        yield ("writer", writer_response)
+        stage_started = time.monotonic()
+        for event in run_writer(request, editorFeedback, instructions, research_result, product_documenation, stream_writer):
+            writer_response = event[1]
+            yield event
+        policy.observe("writer", time.monotonic() - stage_started)
 
+        stage_started = time.monotonic()
         editor_response = get_editor(writer_response["article"], writer_response["feedback"])
+        policy.observe("editor", time.monotonic() - stage_started)
+        policy.observe_iteration(time.monotonic() - iteration_started)
         try:
             editor_response_dict = json.loads(editor_response)
         except json.JSONDecodeError as e:
             log_output("Failed to parse editor response during loop: %s", str(e))
+            reason = "editor_unreadable"
             break
         yield ("editor", editor_response)
 
-        retry_count += 1
-        if retry_count >= 2:
-            break
-
-    log_output("Editor accepted article after %d iterations", retry_count)
-    yield ("message", "Editor accepted article")
+    yield policy.stop_event(reason)
+    yield ("message", STOP_MESSAGES[reason])
 
     # writer_response="**Unlock the Great Outdoors: Gear Up for Unforgettable Adventures**\n\nHello, adventurers and nature enthusiasts! Whether you're plotting your next expedition to the world's best cities or escaping to the serene tranquility of nature, gearing up with the right equipment can transform your outdoor experience from mundane to extraordinary. From the bustling streets of New York, the charming vistas of Lisbon, to the captivating allure of Paris, every journey begins with a single step\u2014and the perfect gear.\n\nMeet the **CompactCook Camping Stove** and **EcoFire's Camping Stove**, your new best friends for outdoor culinary adventures. These aren't just stoves; they're your passport to the wilderness, offering the peace of mind that comes with knowing a hot, delicious meal is just moments away. Designed to withstand the elements, they're compact, lightweight, and incredibly easy to pack, ensuring you're well-fed whether you're high in the mountains or deep in the forest.\n\nBut what's an adventure without the right pack to carry your essentials? Enter the **HikeMate's TrailLite Daypack** and **SummitClimber Backpack**. These aren't just bags; they're your trusty sidekicks ready to store all your treasures while ensuring ultimate comfort and convenience. With spacious compartments, water-resistant fabric, and integrated hydration systems, they are the perfect companions for day hikes or longer treks. Plus, with reflective accents for visibility, these backpacks ensure you're safe and seen, from dawn till dusk.\n\nLet's talk comfort. The **RainGuard Hiking Jacket** is your shield against the unpredictable whims of nature, keeping you dry and comfortable in the face of rain and wind. And when it comes to the terrain, the **TrekStar Hiking Sandals** and **TrailWalker Hiking Shoes** ensure every step is secure and comfortable, blending durability with breathability for your trekking endeavors.\n\nNow, where to rest after a day of adventure? The **Alpine Explorer Tent** offers a cozy retreat that feels like a second home under the stars, while the **CozyNights Sleeping Bag** wraps you in warmth and comfort, ensuring a restful sleep amidst the soothing sounds of nature.\n\nAnd let's not forget the **Adventure Dining Table** from CampBuddy. This isn't just a table; it's the centerpiece of your outdoor dining experience, transforming your campsite into a banquet hall under the open sky. Durable, portable, and easy to set up, it ensures your meals are just as memorable as your adventures.\n\nFrom the sleek allure of the **TrailBlaze Hiking Pants** keeping you stylish and comfortable on the trails, to the versatile companionship of the **CompactCook Camping Stove** ensuring you're well-fed on your journeys, every piece of gear is designed with your adventures in mind.\n\nSo, as you prepare to tackle the world's best cities and beyond, remember that the right gear doesn't just support your adventure\u2014it enhances it, making every moment more memorable. Gear up, step out, and let the adventures begin!"
     # research_result= {"web": [{"url": "https://www.timeout.com/things-to-do/best-cities-in-the-world", "name": "50 Best Cities in the World to Visit in 2024 - Time Out", "description": "The 50 best cities in the world for 2024. Photograph: Massimo Salesi / Shutterstock.com. 1. New York. What makes us great: You know it as \u2018the city that never sleeps\u2019 because many of its ..."}, {"url": "https://travel.usnews.com/rankings/worlds-best-cities-to-visit/", "name": "Best Cities in the World to Visit | U.S. News Travel", "description": "Lisbon. #27 in Best Cities in the World to Visit. Lisbon beckons to leisure travelers and digital nomads alike with its incredible vistas, colorful ceramic tiles and rich cultural heritage. Top ..."}, {"url": "https://travel.usnews.com/rankings/worlds-best-vacations/", "name": "30 World's Best Places to Visit for 2023-2024 | U.S. News Travel", "description": "Paris. #1 in World's Best Places to Visit for 2023-2024. France's magnetic City of Light is a perennial tourist destination, drawing visitors with its iconic attractions, like the Eiffel Tower and ..."}, {"url": "https://www.forbes.com/sites/laurabegleybloom/2023/12/14/ranked-the-100-best-cities-in-the-world-according-to-a-new-report/", "name": "Ranked: The 100 Best Cities In The World To Visit - Forbes", "description": "This was the first year that Washington D.C. made the list of 100 best places to travel. getty Trends in Travel. The report highlighted some of the big trends in travel, including sustainable tourism."}, {"url": "https://www.farandwide.com/s/best-places-visit-world-0697723328374f59", "name": "30 Best Travel Destinations in the World, Ranked | Far & Wide", "description": "Best Places to Visit in the World. The ultimate ranking of travel destinations aims to solve a serious problem: so many places to visit, so little time. But even in a world with a trillion destinations, some manage to stand out and rise to the top."}], "entities": [], "news": []}
     # product_documenation=[{"id": "cHJvZHVjdHMueGxzeDQ=", "title": "", "content": "Title: products.xlsx, and peace of mind. Be wild, be free, be cooked for with the CompactCook Camping Stove!\n\n", "url": "products.xlsx"}, {"id": "cHJvZHVjdHMueGxzeDM=", "title": "", "content": "Title: products.xlsx\tStep up your hiking game with HikeMate's TrailLite Daypack. Built for comfort and efficiency, this lightweight and durable backpack offers a spacious main compartment, multiple pockets, and organization-friendly features all in one sleek package. The adjustable shoulder straps and padded back panel ensure optimal comfort during those long exhilarating treks. Course through nature without worry as the daypack's water-resistant fabric protects your essentials from unexpected showers. Plus, never run dry with the integrated hydration system. And did we mention it comes in a plethora of colors and designs? So you can choose one that truly speaks to your outdoorsy soul! Keeping your visibility in mind, we've added reflective accents that light up in low-light conditions. Don't just carry a backpack, adorn a companion that takes you a step ahead in your adventures. Trust the TrailLite Daypack for a hassle-free, enjoyable hiking experience.\n\t17\tRainGuard Hiking Jacket\t110\tHiking Clothing\tMountainStyle\tIntroducing the MountainStyle RainGuard Hiking Jacket - the ultimate solution for weatherproof comfort during your outdoor undertakings! Designed with waterproof, breathable fabric, this jacket promises an outdoor experience that's as dry as it is comfortable. The rugged construction assures durability, while the adjustable hood provides a customizable fit against wind and rain. Featuring multiple pockets for safe, convenient storage and adjustable cuffs and hem, you can tailor the jacket to suit your needs on-the-go. And, don't worry about overheating during intense activities - it's equipped with ventilation zippers for increased airflow. Reflective details ensure visibility even during low-light conditions, making it perfect for evening treks. With its lightweight, packable design, carrying it inside your backpack requires minimal effort. With options for men and women, the RainGuard Hiking Jacket is perfect for hiking, camping, trekking and countless other outdoor adventures. Don't let the weather stand in your way - embrace the outdoors with MountainStyle RainGuard Hiking Jacket!\n\t18\tTrekStar Hiking Sandals\t70\tHiking Footwear\tTrekReady\tMeet the TrekStar Hiking Sandals from TrekReady - the ultimate trail companion for your feet. Designed for comfort and durability, these lightweight sandals are perfect for those who prefer to see the world from a hiking trail. They feature adjustable straps for a snug, secure fit, perfect for adapting to the contours of your feet. With a breathable design, your feet will stay cool and dry, escaping the discomfort of sweaty hiking boots on long summer treks. The deep tread rubber outsole ensures excellent traction on any terrain, while the cushioned footbed promises enhanced comfort with every step. For those wild and unpredictable trails, the added toe protection and shock-absorbing midsole protect your feet from rocky surprises. Ingeniously, the removable insole makes for easy cleaning and maintenance, extending the lifespan of your sandals. Available in various sizes and a handsome brown color, the versatile TrekStar Hiking Sandals are just as comfortable on a casual walk in the park as they are navigating rocky slopes. Explore more with TrekReady!\n\t19\tAdventure Dining Table\t90\tCamping Tables\tCampBuddy\tDiscover the joy of outdoor adventures with the CampBuddy Adventure Dining Table. This feature-packed camping essential brings both comfort and convenience to your memorable trips. Made from high-quality aluminum, it promises long-lasting performance, weather resistance, and easy maintenance - all key for the great outdoors! It's light, portable, and comes with adjustable height settings to suit various seating arrangements and the spacious surface comfortably accommodates meals, drinks, and other essentials. The sturdy yet lightweight frame holds food, dishes, and utensils with ease. When it's time to pack up, it fold and stows away with no fuss, ready for the next adventure!  Perfect for camping, picnics, barbecues, and beach outings - its versatility shines as brightly as the summer sun! Durable, sturdy and a breeze to set up, the Adventure Dining Table will be a loyal companion on every trip. Embark on your next adventure and make lifetime memories with CampBuddy. As with all good experiences, it'll leave you wanting more! \n\t20\tCompactCook Camping Stove\t60\tCamping Stoves\tCompactCook\tStep into the great outdoors with the CompactCook Camping Stove, a convenient, lightweight companion perfect for all your culinary camping needs. Boasting a robust design built for harsh environments, you can whip up meals anytime, anywhere. Its wind-resistant and fuel-versatile features coupled with an efficient cooking performance, ensures you won't have to worry about the elements or helpless taste buds while on adventures. The easy ignition technology and adjustable flame control make cooking as easy as a walk in the park, while its compact, foldable design makes packing a breeze. Whether you're camping with family or hiking solo, this reliable, portable stove is an essential addition to your gear. With its sturdy construction and safety-focused design, the CompactCook Camping Stove is a step above the rest, providing durability, quality", "url": "products.xlsx"}, {"id": "cHJvZHVjdHMueGxzeDE=", "title": "", "content": "Title: products.xlsx\tIntroducing EcoFire's Camping Stove, your ultimate companion for every outdoor adventure! This portable wonder is precision-engineered with a lightweight and compact design, perfect for capturing that spirit of wanderlust. Made from high-quality stainless steel, it promises durability and steadfast performance. This stove is not only fuel-efficient but also offers an easy, intuitive operation that ensures hassle-free cooking. Plus, it's flexible, accommodating a variety of cooking methods whether you're boiling, grilling, or simmering under the starry sky. Its stable construction, quick setup, and adjustable flame control make cooking a breeze, while safety features protect you from any potential mishaps. And did we mention it also includes an effective wind protector and a carry case for easy transportation? But that's not all! The EcoFire Camping Stove is eco-friendly, designed to minimize environmental impact. So get ready to enhance your camping experience and enjoy delicious outdoor feasts with this unique, versatile stove!\n\t7\tCozyNights Sleeping Bag\t100\tSleeping Bags\tCozyNights\tEmbrace the great outdoors in any season with the lightweight CozyNights Sleeping Bag! This durable three-season bag is superbly designed to give hikers, campers, and backpackers comfort and warmth during spring, summer, and fall. With a compact design that folds down into a convenient stuff sack, you can whisk it away on any adventure without a hitch. The sleeping bag takes comfort seriously, featuring a handy hood, ample room and padding, and a reliable temperature rating. Crafted from high-quality polyester, it ensures long-lasting use and can even be zipped together with another bag for shared comfort. Whether you're gazing at stars or catching a quick nap between trails, the CozyNights Sleeping Bag makes it a treat. Don't just sleep\u2014 dream with CozyNights.\n\t8\tAlpine Explorer Tent\t350\tTents\tAlpineGear\tWelcome to the joy of camping with the Alpine Explorer Tent! This robust, 8-person, 3-season marvel is from the responsible hands of the AlpineGear brand. Promising an enviable setup that is as straightforward as counting sheep, your camping experience is transformed into a breezy pastime. Looking for privacy? The detachable divider provides separate spaces at a moment's notice. Love a tent that breathes? The numerous mesh windows and adjustable vents fend off any condensation dragon trying to dampen your adventure fun. The waterproof assurance keeps you worry-free during unexpected rain dances. With a built-in gear loft to stash away your outdoor essentials, the Alpine Explorer Tent emerges as a smooth balance of privacy, comfort, and convenience. Simply put, this tent isn't just a shelter - it's your second home in the heart of nature! Whether you're a seasoned camper or a nature-loving novice, this tent makes exploring the outdoors a joyous journey.\n\t9\tSummitClimber Backpack\t120\tBackpacks\tHikeMate\tAdventure waits for no one! Introducing the HikeMate SummitClimber Backpack, your reliable partner for every exhilarating journey. With a generous 60-liter capacity and multiple compartments and pockets, packing is a breeze. Every feature points to comfort and convenience; the ergonomic design and adjustable hip belt ensure a pleasantly personalized fit, while padded shoulder straps protect you from the burden of carrying. Venturing into wet weather? Fear not! The integrated rain cover has your back, literally. Stay hydrated thanks to the backpack's hydration system compatibility. Travelling during twilight? Reflective accents keep you visible in low-light conditions. The SummitClimber Backpack isn't merely a carrier; it's a wearable base camp constructed from ruggedly durable nylon and thoughtfully designed for the great outdoors adventurer, promising to withstand tough conditions and provide years of service. So, set off on that quest - the wild beckons! The SummitClimber Backpack - your hearty companion on every expedition!\n\t10\tTrailBlaze Hiking Pants\t75\tHiking Clothing\tMountainStyle\tMeet the TrailBlaze Hiking Pants from MountainStyle, the stylish khaki champions of the trails. These are not just pants; they're your passport to outdoor adventure. Crafted from high-quality nylon fabric, these dapper troopers are lightweight and fast-drying, with a water-resistant armor that laughs off light rain. Their breathable design whisks away sweat while their articulated knees grant you the flexibility of a mountain goat. Zippered pockets guard your essentials, making them a hiker's best ally. Designed with durability for all your trekking trials, these pants come with a comfortable, ergonomic fit that will make you forget you're wearing them. Sneak a peek, and you are sure to be tempted by the sleek allure that is the TrailBlaze Hiking Pants. Your outdoors wardrobe wouldn't be quite complete without them.\n\t11\tTrailWalker Hiking Shoes\t110\tHiking Footwear\tTrekReady\tMeet the TrekReady TrailWalker Hiking Shoes, the ideal companion for all your outdoor adventures.", "url": "products.xlsx"}]
     if evaluate:
+        # promptflow.evals is slow to import, so it waits until an article is evaluated
+        from api.evaluate.evaluators import evaluate_article_in_background
         evaluate_article_in_background(
             request=request,
             instructions=instructions,
@@ -0,0 +1,203 @@
+import json
+import time
+import asyncio
+from promptflow.tracing import trace
+from api.agents.researcher import researcher
+from api.agents.writer import writer, compaction
+from api.agents.editor import editor
+from api.agents.product import product
+from api.agents.orchestrator import (
+    normalize_editor_response, RevisionPolicy, RESEARCH_TIMEOUT, PRODUCTS_TIMEOUT, LATENCY_BUDGET, STOP_MESSAGES
+)
+from api.logging import log_output
+from api.metrics import timed, STAGE_SECONDS
+from dotenv import load_dotenv
+load_dotenv()
+
+# asyncio twin of orchestrator.py: every agent call awaits instead of blocking a
+# worker thread, so one event loop can carry many article streams at once
+
+@trace
+@timed(STAGE_SECONDS, stage="researcher")
+async def get_research(request, instructions, feedback, memo=None):
+    research_result = await researcher.research_async(
+        request=request,
+        instructions=instructions,
+        feedback=feedback,
+        memo=memo
+    )
+    print(json.dumps(research_result, indent=2))
+    return research_result
+
+@trace
+@timed(STAGE_SECONDS, stage="products")
+async def get_products(request):
+    product_documenation = await product.get_products_async(request)
+    print(json.dumps(product_documenation, indent=2))
+    return product_documenation
+
+@trace
+@timed(STAGE_SECONDS, stage="writer")
+async def get_writer(request, feedback, instructions, research=[], products=[]):
+    writer_reponse = await writer.write_async(
+        request=request, feedback=feedback, instructions=instructions, research=research, products=products
+    )
+    print(json.dumps(writer_reponse, indent=2))
+    return writer_reponse
+
+@timed(STAGE_SECONDS, stage="writer")
+async def get_writer_stream(request, feedback, instructions, research=[], products=[]):
+    """Yield ("writer_delta", text) events while the article streams in, then ("writer", response)"""
+    async for kind, value in writer.write_stream_async(
+        request=request, feedback=feedback, instructions=instructions, research=research, products=products
+    ):
+        if kind == "delta":
+            yield ("writer_delta", value)
+        else:
+            print(json.dumps(value, indent=2))
+            yield ("writer", value)
+
+async def run_writer(request, feedback, instructions, research, products, stream_writer=False):
+    """Yield the writer's events, streamed or as a single ("writer", response).
+
+    Research and products are compacted to the writer's token budget first, and what
+    that saved is reported as a ("compaction", report) event."""
+    # tokenizing everything takes long enough to hold up the other streams on the loop
+    research, products, report = await asyncio.to_thread(compaction.compact, request, instructions, research, products)
+    log_output("Compacted writer context from %d to %d tokens", report["tokens_before"], report["tokens_after"])
+    yield ("compaction", report)
+    if stream_writer:
+        async for event in get_writer_stream(request, feedback, instructions, research=research, products=products):
+            yield event
+    else:
+        yield ("writer", await get_writer(request, feedback, instructions, research=research, products=products))
+
+@trace
+@timed(STAGE_SECONDS, stage="editor")
+async def get_editor(article, feedback):
+    editor_task = normalize_editor_response(await editor.edit_async(article, feedback))
+    print(json.dumps(editor_task, indent=2))
+    return editor_task
+
+async def fan_out(branches):
+    """Run independent stages concurrently and yield (name, result) as each one finishes.
+
+    branches is a list of (name, coroutine, timeout, fallback); a branch that does not
+    finish within its timeout yields its fallback instead."""
+    async def run(name, coroutine, timeout, fallback):
+        try:
+            return name, await asyncio.wait_for(coroutine, timeout)
+        except asyncio.TimeoutError:
+            log_output("Stage %s timed out, continuing without it", name)
+            return name, fallback
+
+    for next_done in asyncio.as_completed([run(*branch) for branch in branches]):
+        yield await next_done
+
+@trace
+async def write_article(request, instructions, evaluate=False, stream_writer=False, budget=None):
+    log_output("Article generation started for request: %s, instructions: %s", request, instructions)
+
+    policy = RevisionPolicy(LATENCY_BUDGET if budget is None else budget)
+    # revisions reuse the tool calls earlier rounds already made. The first round records into
+    # its own memo, kept only if it finishes in time, so nothing a timed-out branch was still
+    # doing can turn up in later rounds
+    first_memo = researcher.ResearchMemo()
+    no_research = {"web": [], "entities": [], "news": []}
+    feedback = "No Feedback"
+
+    yield ("message", "Starting research agent task...")
+    log_output("Getting researcher task output and product information...")
+    stages_started = time.monotonic()
+    stages = fan_out([
+        ("researcher", get_research(request, instructions, feedback, first_memo), RESEARCH_TIMEOUT, no_research),
+        ("products", get_products(request), PRODUCTS_TIMEOUT, []),
+    ])
+    async for name, result in stages:
+        policy.observe(name, time.monotonic() - stages_started)
+        if name == "researcher":
+            research_result = result
+            research_memo = first_memo if result is not no_research else researcher.ResearchMemo()
+        else:
+            product_documenation = result
+        yield (name, result)
+    # Then send it to the writer, the writer writes the article
+    yield ("message", "Starting writer agent task...")
+    log_output("Getting writer task output...")
+    writer_started = time.monotonic()
+    async for event in run_writer(request, feedback, instructions, research_result, product_documenation, stream_writer):
+        writer_response = event[1]
+        yield event
+    policy.observe("writer", time.monotonic() - writer_started)
+    # Then send it to the editor, to decide if it's good or not
+    yield ("message", "Starting editor agent task...")
+    log_output("Getting editor task output...")
+    editor_started = time.monotonic()
+    editor_response = await get_editor(writer_response["article"], writer_response["feedback"])
+    policy.observe("editor", time.monotonic() - editor_started)
+    log_output("Editor response: %s", editor_response)
+
+    yield ("editor", editor_response)
+
+    try:
+        editor_response_dict = json.loads(editor_response)
+    except json.JSONDecodeError as e:
+        log_output("Failed to parse editor response: %s", str(e))
+        yield policy.stop_event("editor_unreadable")
+        return
+
+    while True:
+        reason = policy.stop_reason(editor_response_dict)
+        if reason is not None:
+            break
+
+        iteration_started = time.monotonic()
+        yield ("message", f"Sending editor feedback ({policy.iterations + 1})...")
+        log_output("Regeneration attempt %d based on editor feedback", policy.iterations + 1)
+
+        researchFeedback = editor_response_dict.get("researchFeedback", "No Feedback")
+        editorFeedback = editor_response_dict.get("editorFeedback", "No Feedback")
+
+        stage_started = time.monotonic()
+        research_result = await get_research(request, instructions, researchFeedback, research_memo)
+        policy.observe("researcher", time.monotonic() - stage_started)
+        yield ("researcher", research_result)
+
+        stage_started = time.monotonic()
+        async for event in run_writer(request, editorFeedback, instructions, research_result, product_documenation, stream_writer):
+            writer_response = event[1]
+            yield event
+        policy.observe("writer", time.monotonic() - stage_started)
+
+        stage_started = time.monotonic()
+        editor_response = await get_editor(writer_response["article"], writer_response["feedback"])
+        policy.observe("editor", time.monotonic() - stage_started)
+        policy.observe_iteration(time.monotonic() - iteration_started)
+        try:
+            editor_response_dict = json.loads(editor_response)
+        except json.JSONDecodeError as e:
+            log_output("Failed to parse editor response during loop: %s", str(e))
+            reason = "editor_unreadable"
+            break
+        yield ("editor", editor_response)
+
+    yield policy.stop_event(reason)
+    yield ("message", STOP_MESSAGES[reason])
+
+    if evaluate:
+        # importing promptflow.evals is slow and, with EVAL_QUEUE_POLICY=block, submitting waits
+        # for room in the queue, so neither may hold up the other streams on the event loop
+        await asyncio.to_thread(
+            _evaluate_in_background,
+            request=request,
+            instructions=instructions,
+            research=research_result,
+            products=product_documenation,
+            article=writer_response
+        )
+
+
+def _evaluate_in_background(**kwargs):
+    # promptflow.evals is slow to import, so it waits until an article is evaluated
+    from api.evaluate.evaluators import evaluate_article_in_background
+    evaluate_article_in_background(**kwargs)
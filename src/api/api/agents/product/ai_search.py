@@ -1,16 +1,19 @@
 from typing import List
 import os
-from azure.search.documents import SearchClient
-from azure.search.documents.models import VectorizedQuery
-from azure.identity import DefaultAzureCredential
-from azure.core.credentials import AzureKeyCredential
+from api.metrics import timed, DEPENDENCY_SECONDS
 
+# azure.search is imported on first search, it is slow to import and only the product agent needs it
+
+@timed(DEPENDENCY_SECONDS, dependency="azure_search", operation="vector_search")
 def retrieve_documentation(
     request: str,
     index_name: str,
     embedding: List[float],
 ) -> List[dict]:
-    
+    from azure.search.documents import SearchClient
+    from azure.search.documents.models import VectorizedQuery
+    from azure.core.credentials import AzureKeyCredential
+
     search_client = SearchClient(
             endpoint=os.getenv("AZURE_SEARCH_ENDPOINT"),
             index_name=index_name,
@@ -39,4 +42,42 @@ def retrieve_documentation(
         for doc in results
     ]
 
-    return docs
\ No newline at end of file
+    return docs
+
+@timed(DEPENDENCY_SECONDS, dependency="azure_search", operation="vector_search")
+async def retrieve_documentation_async(
+    request: str,
+    index_name: str,
+    embedding: List[float],
+) -> List[dict]:
+    from azure.search.documents.aio import SearchClient as AsyncSearchClient
+    from azure.search.documents.models import VectorizedQuery
+    from azure.core.credentials import AzureKeyCredential
+
+    async with AsyncSearchClient(
+            endpoint=os.getenv("AZURE_SEARCH_ENDPOINT"),
+            index_name=index_name,
+            credential=AzureKeyCredential(os.getenv("AZURE_SEARCH_API")),
+        ) as search_client:
+
+        vector_query = VectorizedQuery(
+            vector=embedding, k_nearest_neighbors=3, fields="contentVector"
+        )
+
+        results = await search_client.search(
+            search_text="",  # Leave search_text empty since we're only using vector search
+            vector_queries=[vector_query],
+            top=3,
+        )
+
+        docs = [
+            {
+                "id": doc["id"],
+                "title": doc["title"],
+                "content": doc["content"],
+                "url": doc["url"],
+            }
+            async for doc in results
+        ]
+
+    return docs
@@ -0,0 +1,109 @@
+import os
+import csv
+import sys
+import json
+import threading
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from api.logging import log_output
+
+folder = Path(__file__).parent.absolute().as_posix()
+
+INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", folder + "/index")
+# catalogs whose embedding matrix is bigger than this stay on Azure AI Search
+MAX_INDEX_BYTES = int(os.getenv("LOCAL_INDEX_MAX_BYTES", str(512 * 1024 * 1024)))
+EMBEDDING_BATCH_SIZE = 16
+
+
+class LocalIndex:
+    """Brute-force cosine top-k over a memory-mapped float32 embedding matrix"""
+
+    def __init__(self, path):
+        # rows are L2-normalized at build time, so a dot product is the cosine similarity
+        self.embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+        with open(os.path.join(path, "metadata.json")) as f:
+            self.documents = json.load(f)
+        if len(self.documents) != self.embeddings.shape[0]:
+            raise ValueError(f"Local index at {path} has {self.embeddings.shape[0]} vectors but {len(self.documents)} documents")
+
+    def search(self, embedding: List[float], k: int = 3) -> List[dict]:
+        # an empty catalog or k of 0 has nothing to rank, and argpartition can't take k - 1 < 0
+        k = min(k, len(self.documents))
+        if k <= 0:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        scores = self.embeddings @ query
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [dict(self.documents[i]) for i in top]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_local_index():
+    """Return the local index, or None if it is missing or too large to hold in memory"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                matrix = os.path.join(INDEX_PATH, "embeddings.npy")
+                if not os.path.exists(matrix):
+                    log_output("No local product index at %s, using Azure AI Search", INDEX_PATH)
+                    _index = False
+                elif os.path.getsize(matrix) > MAX_INDEX_BYTES:
+                    log_output("Local product index is larger than %d bytes, using Azure AI Search", MAX_INDEX_BYTES)
+                    _index = False
+                else:
+                    _index = LocalIndex(INDEX_PATH)
+    return _index or None
+
+
+def build_index(csv_path, path=INDEX_PATH):
+    """Embed the product catalog and write the matrix and metadata for the local backend"""
+    from api.agents.product.product import get_openai_client, EMBEDDING_MODEL
+    from api.gateway import gateway, estimate_tokens, prioritized
+
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        products = list(csv.DictReader(f))
+
+    documents = []
+    for product in products:
+        title = product["name"]
+        documents.append({
+            "id": str(product["id"]),
+            "title": title,
+            "content": product["description"],
+            "url": f"/products/{title.lower().replace(' ', '-')}",
+        })
+
+    client = get_openai_client()
+    vectors = []
+    # through the gateway like every other embedding, behind interactive requests
+    with prioritized("batch"):
+        for start in range(0, len(documents), EMBEDDING_BATCH_SIZE):
+            inputs = [d["content"] for d in documents[start:start + EMBEDDING_BATCH_SIZE]]
+            response = gateway.call(
+                EMBEDDING_MODEL, estimate_tokens(inputs), client.embeddings.create, input=inputs, model=EMBEDDING_MODEL
+            )
+            vectors.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+
+    # an empty catalog still gets a two-dimensional matrix, with no rows
+    embeddings = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1 if vectors else 0)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, "embeddings.npy"), embeddings)
+    with open(os.path.join(path, "metadata.json"), "w") as f:
+        json.dump(documents, f)
+    print(f"wrote {len(documents)} products to local index at {path}")
+
+
+if __name__ == "__main__":
+    # python -m api.agents.product.local_index ../../data/products.csv
+    build_index(sys.argv[1])
@@ -1,36 +1,157 @@
 import os
 import json
+import hashlib
+import threading
 from typing import Dict
-from openai import AzureOpenAI
 
-from azure.identity import DefaultAzureCredential, get_bearer_token_provider
-from api.agents.product.ai_search import retrieve_documentation
-from openai import AzureOpenAI
+from api.agents.product.ai_search import retrieve_documentation, retrieve_documentation_async
+from api.agents.product.local_index import get_local_index
+from openai import AzureOpenAI, AsyncAzureOpenAI
 from promptflow.tracing import trace
+from api.cache import ResultCache, normalize_text
+from api.metrics import DEPENDENCY_SECONDS
+from api.gateway import gateway, estimate_tokens
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# "azure" queries Azure AI Search, "local" searches the in-process index built by local_index.py
+PRODUCT_SEARCH_BACKEND = os.getenv("PRODUCT_SEARCH_BACKEND", "azure")
+
+# set by set_search_backend to route product search somewhere else, e.g. an offline stand-in
+_search_backend = None
+
+def set_search_backend(backend):
+    """Search with backend.retrieve_documentation(request, index_name, embedding) and its
+    retrieve_documentation_async twin instead of Azure AI Search. None restores the default"""
+    global _search_backend
+    _search_backend = backend
+
 @trace
 def get_context(request, embedding):
+    if _search_backend is not None:
+        return _search_backend.retrieve_documentation(request=request, index_name="serene-key-nvrxl9mlvh", embedding=embedding)
+    if PRODUCT_SEARCH_BACKEND == "local":
+        index = get_local_index()
+        if index is not None:
+            return index.search(embedding, k=3)
     return retrieve_documentation(request=request, index_name="serene-key-nvrxl9mlvh", embedding=embedding)
 
+@trace
+async def get_context_async(request, embedding):
+    if _search_backend is not None:
+        return await _search_backend.retrieve_documentation_async(request=request, index_name="serene-key-nvrxl9mlvh", embedding=embedding)
+    if PRODUCT_SEARCH_BACKEND == "local":
+        index = get_local_index()
+        if index is not None:
+            return index.search(embedding, k=3)
+    return await retrieve_documentation_async(request=request, index_name="serene-key-nvrxl9mlvh", embedding=embedding)
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+# an ada-002 vector is ~30KB of JSON, so the default cap holds a few thousand requests
+embedding_cache = ResultCache(
+    "embeddings",
+    ttl=float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+    max_bytes=int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    path=os.getenv("EMBEDDING_CACHE_PATH"),
+    max_disk_bytes=int(os.getenv("EMBEDDING_CACHE_MAX_DISK_BYTES", "0")) or None,
+)
+
+_client = None
+_async_client = None
+_token_provider = None
+_client_lock = threading.Lock()
+
+COGNITIVE_SERVICES_SCOPE = "https://cognitiveservices.azure.com/.default"
+
+def get_openai_client():
+    """Return the process-wide Azure OpenAI client, built once with a cached token provider"""
+    global _client, _token_provider
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from azure.identity import DefaultAzureCredential, get_bearer_token_provider
+                _token_provider = get_bearer_token_provider(DefaultAzureCredential(), COGNITIVE_SERVICES_SCOPE)
+                _client = AzureOpenAI(
+                    azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT"), 
+                    api_version=os.environ["AZURE_OPENAI_API_VERSION"],
+                    azure_ad_token_provider=_token_provider
+                )
+    return _client
+
+def get_async_openai_client():
+    """Return the process-wide AsyncAzureOpenAI client used by the asyncio pipeline"""
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                from azure.identity.aio import DefaultAzureCredential as AsyncDefaultAzureCredential
+                from azure.identity.aio import get_bearer_token_provider as get_async_bearer_token_provider
+                token_provider = get_async_bearer_token_provider(AsyncDefaultAzureCredential(), COGNITIVE_SERVICES_SCOPE)
+                _async_client = AsyncAzureOpenAI(
+                    azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT"), 
+                    api_version=os.environ["AZURE_OPENAI_API_VERSION"],
+                    azure_ad_token_provider=token_provider
+                )
+    return _async_client
+
+def acquire_token():
+    """Fetch the Azure OpenAI token now, so the first embedding doesn't wait on the identity
+    endpoint. The credential caches it and refreshes it before it expires"""
+    get_openai_client()
+    if _token_provider is not None:
+        _token_provider()
+
+def set_openai_client(client, is_async=False):
+    """Replace the process-wide Azure OpenAI client used for embeddings"""
+    global _client, _async_client, _token_provider
+    with _client_lock:
+        if is_async:
+            _async_client = client
+        else:
+            _client = client
+            _token_provider = None
+
+def _embedding_key(model, text):
+    return hashlib.sha256(f"{model}\n{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+def _create_embedding(request):
+    with DEPENDENCY_SECONDS.labels(dependency="azure_openai", operation="embeddings").time():
+        return get_openai_client().embeddings.create(
+                input=request,
+                model=EMBEDDING_MODEL
+            ).data[0].embedding
+
+async def _create_embedding_async(request):
+    with DEPENDENCY_SECONDS.labels(dependency="azure_openai", operation="embeddings").time():
+        response = await get_async_openai_client().embeddings.create(
+                input=request,
+                model=EMBEDDING_MODEL
+            )
+    return response.data[0].embedding
+
+# embeddings go through the gateway under the deployment named after the model
 def get_embedding(request: str):
-    token_provider = get_bearer_token_provider(
-        DefaultAzureCredential(), "https://cognitiveservices.azure.com/.default"
-    )
+    key = _embedding_key(EMBEDDING_MODEL, request)
+    hit, embedding = embedding_cache.get(key)
+    if hit:
+        return embedding
 
-    client = AzureOpenAI(
-        azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT"), 
-        api_version=os.environ["AZURE_OPENAI_API_VERSION"],
-        azure_ad_token_provider=token_provider
-    )
+    embedding = gateway.call(EMBEDDING_MODEL, estimate_tokens(request), _create_embedding, request)
+    embedding_cache.set(key, embedding)
+    return embedding
 
-    return client.embeddings.create(
-            input=request,
-            model="text-embedding-ada-002"
-        ).data[0].embedding
+async def get_embedding_async(request: str):
+    key = _embedding_key(EMBEDDING_MODEL, request)
+    hit, embedding = embedding_cache.get(key)
+    if hit:
+        return embedding
+
+    embedding = await gateway.call_async(EMBEDDING_MODEL, estimate_tokens(request), _create_embedding_async, request)
+    embedding_cache.set(key, embedding)
+    return embedding
 
 def get_products(request: str) -> Dict[str, any]:
     print("request",request)
@@ -39,6 +160,10 @@ def get_products(request: str) -> Dict[str, any]:
     print("product result", products)
     return products
 
+async def get_products_async(request: str) -> Dict[str, any]:
+    embedding = await get_embedding_async(request)
+    return await get_context_async(request, embedding)
+
 if __name__ == "__main__":
     context = "what kind of jackets do you have?"
     answer = get_products(context)
@@ -0,0 +1,109 @@
+import os
+import threading
+from pathlib import Path
+
+from promptflow.core import Prompty, AsyncPrompty, Flow, AzureOpenAIModelConfiguration
+
+from api.logging import log_output
+from api.metrics import timed, DEPENDENCY_SECONDS
+from api.gateway import gateway
+
+folder = Path(__file__).parent.absolute().as_posix()
+
+# name -> (prompty path, loader, model parameter overrides)
+AGENTS = {
+    "researcher": (folder + "/researcher/researcher.prompty", Prompty.load, {"max_tokens": 512}),
+    "writer": (folder + "/writer/writer.prompty", Flow.load, {"max_tokens": 1400}),
+    # same prompt as the writer, returning the completion as a stream of text deltas
+    "writer_stream": (folder + "/writer/writer.prompty", Prompty.load, {"max_tokens": 1400, "stream": True}),
+    "editor": (folder + "/editor/editor.prompty", Prompty.load, {"max_tokens": 512}),
+}
+
+_configuration = None
+_loaded = {}
+_overrides = {}
+_lock = threading.Lock()
+
+
+def get_model_configuration():
+    """Build the Azure OpenAI model configuration shared by every agent"""
+    global _configuration
+    if _configuration is None:
+        missing = [
+            name for name in ("AZURE_OPENAI_DEPLOYMENT_NAME_4o", "AZURE_OPENAI_API_VERSION", "AZURE_OPENAI_ENDPOINT")
+            if not os.getenv(name)
+        ]
+        if missing:
+            raise ValueError(f"Missing Azure OpenAI settings: {', '.join(missing)}")
+        _configuration = AzureOpenAIModelConfiguration(
+            azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME_4o"),
+            api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
+            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
+        )
+    return _configuration
+
+
+def _load(name, is_async=False):
+    path, loader, parameters = AGENTS[name]
+    if is_async:
+        loader = AsyncPrompty.load
+    override_model = {
+        "configuration": get_model_configuration(),
+        "parameters": dict(parameters)
+    }
+    agent = loader(path, model=override_model)
+    if not callable(agent):
+        raise ValueError(f"Prompty for agent {name} at {path} did not load as a callable")
+    agent = timed(DEPENDENCY_SECONDS, dependency="azure_openai", operation=name)(agent)
+    # the prompty's own text counts towards the tokens each call is charged
+    return gateway.wrap(
+        agent,
+        override_model["configuration"].azure_deployment,
+        max_tokens=parameters.get("max_tokens", 0),
+        base_tokens=os.path.getsize(path) // 4,
+        is_async=is_async,
+    )
+
+
+def get_agent(name, is_async=False):
+    """Return the loaded prompty for an agent, reloading it only when the file changes.
+
+    With is_async the prompty is loaded as an AsyncPrompty, to be awaited from the
+    asyncio pipeline."""
+    if name not in AGENTS:
+        raise KeyError(f"Unknown agent: {name}")
+
+    key = (name, is_async)
+    if key in _overrides:
+        return _overrides[key]
+    mtime = os.stat(AGENTS[name][0]).st_mtime
+    entry = _loaded.get(key)
+    if entry is not None and entry[0] == mtime:
+        return entry[1]
+
+    with _lock:
+        entry = _loaded.get(key)
+        if entry is None or entry[0] != mtime:
+            log_output("Loading prompty for agent %s", name)
+            entry = (mtime, _load(name, is_async))
+            _loaded[key] = entry
+    return entry[1]
+
+
+def set_agent(name, agent, is_async=False):
+    """Serve agent in place of the prompty for name, e.g. an offline stand-in. None restores the prompty"""
+    if name not in AGENTS:
+        raise KeyError(f"Unknown agent: {name}")
+    if agent is None:
+        _overrides.pop((name, is_async), None)
+    else:
+        _overrides[(name, is_async)] = agent
+
+
+def warm_up(is_async=False):
+    """Load every agent up front so the first request does not pay for it"""
+    for name in AGENTS:
+        try:
+            get_agent(name, is_async)
+        except Exception as e:
+            log_output("Failed to warm up agent %s: %s", name, str(e))
@@ -0,0 +1,270 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+from api.metrics import DEPENDENCY_SECONDS
+
+# the S1 Bing.Search.v7 sku provisioned in infra/bing.tf allows 250 transactions per second
+DEFAULT_QPS = 250
+
+
+class TokenBucket:
+    """Token bucket rate limiter, refilled at `rate` tokens per second up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Take one token and return how long the caller must wait before using it"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self):
+        """Take one token, sleeping until it is usable. Returns the time spent waiting"""
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+        return delay
+
+    async def acquire_async(self):
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+        return delay
+
+
+class BingClient:
+    """Shared Bing Search client with keep-alive pooling, rate limiting and retries.
+
+    timeout bounds each attempt. With max_elapsed, a call gives up instead of retrying
+    once the wait for its next attempt would take it past max_elapsed seconds in all"""
+
+    def __init__(self, endpoint, key, qps=DEFAULT_QPS, max_retries=3, backoff=0.5, timeout=15, pool_size=10,
+                 max_elapsed=None):
+        self.endpoint = endpoint
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_elapsed = max_elapsed
+        self.limiter = TokenBucket(qps)
+        #bing does not currently support managed identity
+        self.headers = {"Ocp-Apim-Subscription-Key": key}
+        self.pool_size = pool_size
+        self.session = self._make_session()
+
+        self._lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "errors": 0,
+            "retries": 0,
+            "throttles": 0,
+            "limiter_wait_seconds": 0.0,
+            "latency_seconds_total": 0.0,
+            "latency_seconds_max": 0.0,
+        }
+
+    def _make_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update(self.headers)
+        return session
+
+    def _make_endpoint(self, path):
+        """Make an endpoint URL"""
+        return f"{self.endpoint}{'' if self.endpoint.endswith('/') else '/'}{path}"
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self._stats[name] += value
+
+    def _observe_latency(self, seconds, path):
+        DEPENDENCY_SECONDS.labels(dependency="bing", operation=path).observe(seconds)
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["latency_seconds_total"] += seconds
+            self._stats["latency_seconds_max"] = max(self._stats["latency_seconds_max"], seconds)
+
+    def _retry_delay(self, response, attempt):
+        """Honor Retry-After when Bing sends it, otherwise back off exponentially with full jitter"""
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                try:
+                    return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass
+        return random.uniform(0, self.backoff * (2 ** attempt))
+
+    def _can_retry(self, attempt, started, delay):
+        if attempt == self.max_retries:
+            return False
+        return self.max_elapsed is None or time.monotonic() + delay - started < self.max_elapsed
+
+    def _attempt_timeout(self, started):
+        if self.max_elapsed is None:
+            return self.timeout
+        return max(0.1, min(self.timeout, started + self.max_elapsed - time.monotonic()))
+
+    def get(self, path, params=None):
+        """Make a request to the API, retrying throttled and failed calls"""
+        url = self._make_endpoint(path)
+        started = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            self._count("limiter_wait_seconds", self.limiter.acquire())
+            start = time.monotonic()
+            try:
+                response = self.session.get(url, params=params, timeout=self._attempt_timeout(started))
+            except (requests.ConnectionError, requests.Timeout):
+                self._observe_latency(time.monotonic() - start, path)
+                self._count("errors")
+                delay = self._retry_delay(None, attempt)
+                if not self._can_retry(attempt, started, delay):
+                    raise
+                self._count("retries")
+                time.sleep(delay)
+                continue
+
+            self._observe_latency(time.monotonic() - start, path)
+            if response.status_code == 429 or response.status_code >= 500:
+                if response.status_code == 429:
+                    self._count("throttles")
+                else:
+                    self._count("errors")
+                delay = self._retry_delay(response, attempt)
+                if not self._can_retry(attempt, started, delay):
+                    response.raise_for_status()
+                self._count("retries")
+                time.sleep(delay)
+                continue
+
+            response.raise_for_status()
+            return response.json()
+
+    def stats(self):
+        """Snapshot of the request counters"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["latency_seconds_avg"] = stats["latency_seconds_total"] / stats["requests"] if stats["requests"] else 0.0
+        return stats
+
+
+class AsyncBingClient(BingClient):
+    """asyncio flavour of BingClient for the async article pipeline, sharing its limiter and counters logic"""
+
+    def _make_session(self):
+        # aiohttp sessions must be created on the running event loop, see _get_session
+        return None
+
+    def _get_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self.session
+
+    async def get(self, path, params=None):
+        """Make a request to the API, retrying throttled and failed calls"""
+        url = self._make_endpoint(path)
+        session = self._get_session()
+        started = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            self._count("limiter_wait_seconds", await self.limiter.acquire_async())
+            start = time.monotonic()
+            timeout = aiohttp.ClientTimeout(total=self._attempt_timeout(started))
+            try:
+                async with session.get(url, params=params, timeout=timeout) as response:
+                    self._observe_latency(time.monotonic() - start, path)
+                    if response.status != 429 and response.status < 500:
+                        response.raise_for_status()
+                        return await response.json(content_type=None)
+
+                    if response.status == 429:
+                        self._count("throttles")
+                    else:
+                        self._count("errors")
+                    delay = self._retry_delay(response, attempt)
+                    if not self._can_retry(attempt, started, delay):
+                        response.raise_for_status()
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                self._observe_latency(time.monotonic() - start, path)
+                self._count("errors")
+                delay = self._retry_delay(None, attempt)
+                if not self._can_retry(attempt, started, delay):
+                    raise
+
+            self._count("retries")
+            await asyncio.sleep(delay)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+
+def _client_settings():
+    return dict(
+        endpoint=os.environ["BING_SEARCH_ENDPOINT"],
+        key=os.environ["BING_SEARCH_KEY"],
+        qps=float(os.getenv("BING_SEARCH_QPS", DEFAULT_QPS)),
+        max_retries=int(os.getenv("BING_SEARCH_MAX_RETRIES", "3")),
+        # one slow attempt mustn't use up the tool call's whole budget, see RESEARCHER_TOOL_TIMEOUT_SECONDS
+        timeout=float(os.getenv("BING_SEARCH_TIMEOUT_SECONDS", "5")),
+        pool_size=int(os.getenv("BING_SEARCH_POOL_SIZE", "10")),
+        # retries stop when the tool call waiting on them would have timed out anyway
+        max_elapsed=float(os.getenv("RESEARCHER_TOOL_TIMEOUT_SECONDS", "15")),
+    )
+
+
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+
+def get_bing_client():
+    """Return the process-wide Bing client, creating it from the environment on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = BingClient(**_client_settings())
+    return _client
+
+
+def get_async_bing_client():
+    """Return the process-wide asyncio Bing client"""
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                _async_client = AsyncBingClient(**_client_settings())
+    return _async_client
+
+
+def set_bing_client(client):
+    """Replace the process-wide Bing client, e.g. with one pointed at a local stub server"""
+    global _client, _async_client
+    with _client_lock:
+        if isinstance(client, AsyncBingClient):
+            _async_client = client
+        else:
+            _client = client
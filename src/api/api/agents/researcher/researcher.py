@@ -1,11 +1,17 @@
 import json
+import math
+import time
+import asyncio
 import os
-import requests
 import sys
-import urllib.parse
+import contextvars
+from concurrent import futures
+from collections import OrderedDict
 
 from promptflow.tracing import trace
-from promptflow.core import Prompty, AzureOpenAIModelConfiguration
+from api.agents import registry
+from api.agents.researcher.bing import get_bing_client, get_async_bing_client
+from api.cache import ResultCache, cached, cached_async, normalize_text
 
 from dotenv import load_dotenv
 from pathlib import Path
@@ -15,29 +21,30 @@ import base64
 folder = Path(__file__).parent.absolute().as_posix()
 load_dotenv()
 
-#bing does not currently support managed identity
-BING_SEARCH_ENDPOINT = os.environ["BING_SEARCH_ENDPOINT"]
-BING_SEARCH_KEY = os.environ["BING_SEARCH_KEY"]
-BING_HEADERS = {"Ocp-Apim-Subscription-Key": BING_SEARCH_KEY}
+# tool calls from one research plan run side by side, bounded by this width
+TOOL_CALL_CONCURRENCY = max(1, int(os.getenv("RESEARCHER_TOOL_CONCURRENCY", "4")))
+TOOL_CALL_TIMEOUT = float(os.getenv("RESEARCHER_TOOL_TIMEOUT_SECONDS", "15"))
+TOOL_CALL_POLL_SECONDS = 0.05
 
+# repeated topics skip Bing entirely; news goes stale much faster than entities
+search_cache = ResultCache(
+    "bing",
+    max_bytes=int(os.getenv("BING_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    path=os.getenv("BING_CACHE_PATH"),
+    max_disk_bytes=int(os.getenv("BING_CACHE_MAX_DISK_BYTES", "0")) or None,
+)
+SEARCH_CACHE_TTL = float(os.getenv("BING_CACHE_TTL_SEARCH_SECONDS", "3600"))
+ENTITIES_CACHE_TTL = float(os.getenv("BING_CACHE_TTL_ENTITIES_SECONDS", "86400"))
+NEWS_CACHE_TTL = float(os.getenv("BING_CACHE_TTL_NEWS_SECONDS", "600"))
 
-def _make_endpoint(endpoint, path):
-    """Make an endpoint URL"""
-    return f"{endpoint}{'' if endpoint.endswith('/') else '/'}{path}"
 
+def _search_key(function_name):
+    def key(query, market="en-US"):
+        return f"{function_name}:{market.lower()}:{normalize_text(query)}"
+    return key
 
-def _make_request(path, params=None):
-    """Make a request to the API"""
-    endpoint = _make_endpoint(BING_SEARCH_ENDPOINT, path)
-    response = requests.get(endpoint, headers=BING_HEADERS, params=params)
-    items = response.json()
-    return items
 
-
-def find_information(query, market="en-US"):
-    """Find information using the Bing Search API"""
-    params = {"q": query, "mkt": market, "count": 5}
-    items = _make_request("v7.0/search", params)
+def _information(items):
     pages = [
         {"url": a["url"], "name": a["name"], "description": a["snippet"]}
         for a in items["webPages"]["value"]
@@ -51,10 +58,7 @@ def find_information(query, market="en-US"):
     return {"pages": pages, "related": related}
 
 
-def find_entities(query, market="en-US"):
-    """Find entities using the Bing Entity Search API"""
-    params = "?mkt=" + market + "&q=" + urllib.parse.quote(query)
-    items = _make_request(f"v7.0/entities{params}")
+def _entities(items):
     entities = []
     if "entities" in items:
         entities = [
@@ -63,10 +67,8 @@ def find_entities(query, market="en-US"):
         ]
     return entities
 
-def find_news(query, market="en-US"):
-    """Find images using the Bing News Search API"""
-    params = {"q": query, "mkt": market, "count": 5}
-    items = _make_request("v7.0/news/search", params)
+
+def _news(items):
     articles = [
         {
             "name": a["name"],
@@ -79,44 +81,74 @@ def find_news(query, market="en-US"):
     ]
     return articles
 
-@trace
-def execute(request: str, instructions: str, feedback: str = ""):
-    """Assign a research task to a researcher"""
-    functions = {
-        "find_information": find_information,
-        "find_entities": find_entities,
-        "find_news": find_news,
-    }
 
-    # create path to prompty file
-    configuration = AzureOpenAIModelConfiguration(
-        azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME_4o"),
-        api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-    )
-    override_model = {
-        "configuration": configuration,
-        "parameters": {"max_tokens": 512}
-    }
-    prompty_obj = Prompty.load(folder + "/researcher.prompty", model=override_model)
-    try:
-        results = prompty_obj(request=request, instructions=instructions, feedback=feedback)
-        print("Raw results:", results)
-        
-        # Convert string response to dictionary if necessary
-        if isinstance(results, str):
-            results = json.loads(results)
-    except Exception as e:
-        print(f"Error processing the response: {str(e)}")
-        return []
+@cached(search_cache, _search_key("find_information"), ttl=SEARCH_CACHE_TTL)
+def find_information(query, market="en-US"):
+    """Find information using the Bing Search API"""
+    params = {"q": query, "mkt": market, "count": 5}
+    return _information(get_bing_client().get("v7.0/search", params))
 
-    # Validate the result as the expected format
-    if not isinstance(results, dict) or "tool_calls" not in results:
-        feedback = "Unexpected response from the researcher. Result: " + str(results)
-        print(feedback)
-        return []
-    research = []
-    for tool in results['tool_calls']:
+
+@cached(search_cache, _search_key("find_entities"), ttl=ENTITIES_CACHE_TTL)
+def find_entities(query, market="en-US"):
+    """Find entities using the Bing Entity Search API"""
+    params = {"mkt": market, "q": query}
+    return _entities(get_bing_client().get("v7.0/entities", params))
+
+@cached(search_cache, _search_key("find_news"), ttl=NEWS_CACHE_TTL)
+def find_news(query, market="en-US"):
+    """Find images using the Bing News Search API"""
+    params = {"q": query, "mkt": market, "count": 5}
+    return _news(get_bing_client().get("v7.0/news/search", params))
+
+
+@cached_async(search_cache, _search_key("find_information"), ttl=SEARCH_CACHE_TTL)
+async def find_information_async(query, market="en-US"):
+    params = {"q": query, "mkt": market, "count": 5}
+    return _information(await get_async_bing_client().get("v7.0/search", params))
+
+
+@cached_async(search_cache, _search_key("find_entities"), ttl=ENTITIES_CACHE_TTL)
+async def find_entities_async(query, market="en-US"):
+    params = {"mkt": market, "q": query}
+    return _entities(await get_async_bing_client().get("v7.0/entities", params))
+
+
+@cached_async(search_cache, _search_key("find_news"), ttl=NEWS_CACHE_TTL)
+async def find_news_async(query, market="en-US"):
+    params = {"q": query, "mkt": market, "count": 5}
+    return _news(await get_async_bing_client().get("v7.0/news/search", params))
+
+
+class ResearchMemo:
+    """Tool call results from earlier rounds of one article run, keyed by function and canonical arguments.
+
+    Revisions re-run the researcher, but only tool calls it has not made before in
+    the run go to Bing, and research() returns everything found so far."""
+
+    def __init__(self):
+        self.results = OrderedDict()
+        self.reused = 0
+
+    @staticmethod
+    def key(function_name, args):
+        canonical = {name: normalize_text(value) if isinstance(value, str) else value for name, value in args.items()}
+        canonical.setdefault("market", "en-us")
+        return function_name, json.dumps(canonical, sort_keys=True)
+
+    def get(self, function_name, args):
+        return self.results.get(self.key(function_name, args))
+
+    def add(self, entry):
+        self.results.setdefault(self.key(entry["function"], entry["arguments"]), entry)
+
+    def entries(self):
+        return list(self.results.values())
+
+
+def _parse_tool_calls(tool_calls, functions):
+    """Yield (tool, function_name, args) for each well-formed tool call, skipping the rest"""
+    for tool in tool_calls:
         if not isinstance(tool, dict):
             print(f"Unexpected tool format: {tool}")
             continue
@@ -136,21 +168,198 @@ def execute(request: str, instructions: str, feedback: str = ""):
             print(f"Function {function_name} not found in available functions.")
             continue
 
+        yield tool, function_name, args
+
+
+def _parse_plan(results):
+    """Return the tool calls from the researcher's response, or None if it is unusable"""
+    try:
+        print("Raw results:", results)
+        
+        # Convert string response to dictionary if necessary
+        if isinstance(results, str):
+            results = json.loads(results)
+    except Exception as e:
+        print(f"Error processing the response: {str(e)}")
+        return None
+
+    # Validate the result as the expected format
+    if not isinstance(results, dict) or "tool_calls" not in results:
+        feedback = "Unexpected response from the researcher. Result: " + str(results)
+        print(feedback)
+        return None
+    return results['tool_calls']
+
+
+def execute_tool_calls(tool_calls, functions, timeout=TOOL_CALL_TIMEOUT, memo=None):
+    """Run the researcher's tool calls concurrently and return results in tool-call order.
+
+    The plan gets its own TOOL_CALL_CONCURRENCY threads, so concurrent articles don't
+    queue behind each other's calls. Each call has timeout seconds from when it starts
+    running; a call still queued once every wave of the plan has had its timeout is
+    dropped. Calls already answered in memo reuse that result, and new results are
+    added to it."""
+    parsed = [
+        (tool, function_name, args, memo.get(function_name, args) if memo is not None else None)
+        for tool, function_name, args in _parse_tool_calls(tool_calls, functions)
+    ]
+    new_calls = sum(1 for *_, previous in parsed if previous is None)
+    started = {}
+
+    def run_call(i, fn, args):
+        started[i] = time.monotonic()
+        return fn(**args)
+
+    executor = futures.ThreadPoolExecutor(
+        max_workers=max(1, min(TOOL_CALL_CONCURRENCY, new_calls)), thread_name_prefix="researcher-tool"
+    )
+    calls = []
+    for i, (tool, function_name, args, previous) in enumerate(parsed):
+        future = None
+        if previous is None:
+            ctx = contextvars.copy_context()
+            future = executor.submit(ctx.run, run_call, i, functions[function_name], args)
+        calls.append((tool, function_name, args, previous, future))
+
+    waves = math.ceil(new_calls / TOOL_CALL_CONCURRENCY)
+    queued_deadline = time.monotonic() + timeout * waves
+    pending = {i: c[4] for i, c in enumerate(calls) if c[4] is not None}
+    while True:
+        now = time.monotonic()
+        pending = {i: f for i, f in pending.items() if not f.done()}
+        deadlines = {i: started[i] + timeout if i in started else queued_deadline for i in pending}
+        waiting = [deadline for deadline in deadlines.values() if deadline > now]
+        if not waiting:
+            break
+        # queued calls may start at any moment, and their deadline with them
+        wait_for = min(waiting) - now
+        if any(i not in started for i in pending):
+            wait_for = min(wait_for, TOOL_CALL_POLL_SECONDS)
+        futures.wait(pending.values(), timeout=wait_for, return_when=futures.FIRST_COMPLETED)
+    # calls that timed out keep their thread until they return; nothing waits for them
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    research = []
+    for tool, function_name, args, previous, future in calls:
+        if previous is not None:
+            memo.reused += 1
+            research.append(previous)
+            continue
+
+        if not future.done():
+            future.cancel()
+            print(f"Timed out executing function {function_name} with arguments {args}")
+            continue
+
         try:
-            r = functions[function_name](**args)
+            r = future.result()
         except Exception as e:
             print(f"Error executing function {function_name} with arguments {args}: {str(e)}")
             continue
-        
-        research.append(
-            {"id": tool.get('id', None), "function": function_name, "arguments": args, "result": r}
-        )
+
+        entry = {"id": tool.get('id', None), "function": function_name, "arguments": args, "result": r}
+        if memo is not None:
+            memo.add(entry)
+        research.append(entry)
 
     return research
 
 
+async def execute_tool_calls_async(tool_calls, functions, timeout=TOOL_CALL_TIMEOUT, memo=None):
+    """asyncio version of execute_tool_calls, bounded by the same width and per-call timeout"""
+    semaphore = asyncio.Semaphore(TOOL_CALL_CONCURRENCY)
+
+    async def call(function_name, args):
+        async with semaphore:
+            return await asyncio.wait_for(functions[function_name](**args), timeout)
+
+    calls = [
+        (tool, function_name, args, memo.get(function_name, args) if memo is not None else None)
+        for tool, function_name, args in _parse_tool_calls(tool_calls, functions)
+    ]
+    results = iter(await asyncio.gather(
+        *[call(function_name, args) for _, function_name, args, previous in calls if previous is None],
+        return_exceptions=True
+    ))
+
+    research = []
+    for tool, function_name, args, previous in calls:
+        if previous is not None:
+            memo.reused += 1
+            research.append(previous)
+            continue
+
+        r = next(results)
+        if isinstance(r, asyncio.TimeoutError):
+            print(f"Timed out executing function {function_name} with arguments {args}")
+            continue
+        if isinstance(r, Exception):
+            print(f"Error executing function {function_name} with arguments {args}: {str(r)}")
+            continue
+
+        entry = {"id": tool.get('id', None), "function": function_name, "arguments": args, "result": r}
+        if memo is not None:
+            memo.add(entry)
+        research.append(entry)
+
+    return research
+
+@trace
+def execute(request: str, instructions: str, feedback: str = "", memo=None):
+    """Assign a research task to a researcher"""
+    functions = {
+        "find_information": find_information,
+        "find_entities": find_entities,
+        "find_news": find_news,
+    }
+
+    prompty_obj = registry.get_agent("researcher")
+    try:
+        results = prompty_obj(request=request, instructions=instructions, feedback=feedback)
+    except Exception as e:
+        print(f"Error processing the response: {str(e)}")
+        return []
+
+    tool_calls = _parse_plan(results)
+    if tool_calls is None:
+        return []
+    return execute_tool_calls(tool_calls, functions, memo=memo)
+
+
+@trace
+async def execute_async(request: str, instructions: str, feedback: str = "", memo=None):
+    """Assign a research task to a researcher from the asyncio pipeline"""
+    functions = {
+        "find_information": find_information_async,
+        "find_entities": find_entities_async,
+        "find_news": find_news_async,
+    }
+
+    prompty_obj = registry.get_agent("researcher", is_async=True)
+    try:
+        results = await prompty_obj(request=request, instructions=instructions, feedback=feedback)
+    except Exception as e:
+        print(f"Error processing the response: {str(e)}")
+        return []
+
+    tool_calls = _parse_plan(results)
+    if tool_calls is None:
+        return []
+    return await execute_tool_calls_async(tool_calls, functions, memo=memo)
+
+
+def _unique(items, key):
+    seen = set()
+    unique = []
+    for item in items:
+        if item[key] not in seen:
+            seen.add(item[key])
+            unique.append(item)
+    return unique
+
+
 def process(research):
-    """Process the research results"""
+    """Process the research results, dropping pages, entities and articles found more than once"""
     # process web searches
     web = filter(lambda r: r["function"] == "find_information", research)
     web_items = [page for web_item in web for page in web_item["result"]["pages"]]
@@ -175,16 +384,28 @@ def process(research):
         for article in news_item["result"]
     ]
     return {
-        "web": web_items,
-        "entities": entity_items,
-        "news": news_items,
+        "web": _unique(web_items, "url"),
+        "entities": _unique(entity_items, "name"),
+        "news": _unique(news_items, "url"),
     }
 
 
-def research(request, instructions, feedback: str = ""):
-    r = execute(request=request, instructions=instructions, feedback=feedback)
-    p = process(r)
-    return p
+def research(request, instructions, feedback: str = "", memo=None):
+    """Research the request. With a memo shared across an article run's rounds, tool
+    calls made in earlier rounds are not repeated and the result covers every round"""
+    r = execute(request=request, instructions=instructions, feedback=feedback, memo=memo)
+    if memo is None:
+        return process(r)
+    print(f"Reused {memo.reused} earlier tool call results")
+    return process(memo.entries())
+
+
+async def research_async(request, instructions, feedback: str = "", memo=None):
+    r = await execute_async(request=request, instructions=instructions, feedback=feedback, memo=memo)
+    if memo is None:
+        return process(r)
+    print(f"Reused {memo.reused} earlier tool call results")
+    return process(memo.entries())
 
 
 if __name__ == "__main__":
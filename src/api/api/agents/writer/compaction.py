@@ -0,0 +1,174 @@
+import os
+import re
+import json
+import math
+import threading
+
+from api.logging import log_output
+from api.metrics import WRITER_TOKENS_SAVED
+
+# research and product documents together are trimmed to this many tokens; 0 turns the cap off
+TOKEN_BUDGET = int(os.getenv("WRITER_CONTEXT_TOKEN_BUDGET", "3000"))
+SNIPPET_TOKENS = int(os.getenv("RESEARCH_SNIPPET_TOKENS", "100"))
+PRODUCT_TOKENS = int(os.getenv("PRODUCT_DOC_TOKENS", "400"))
+# descriptions sharing at least this fraction of their words count as the same item
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("RESEARCH_NEAR_DUPLICATE_THRESHOLD", "0.8"))
+ENABLED = os.getenv("WRITER_COMPACTION", "true").lower() != "false"
+# gpt-4o's tokenizer
+TOKENIZER_ENCODING = os.getenv("WRITER_TOKENIZER_ENCODING", "o200k_base")
+
+# short words that say nothing about relevance
+STOP_WORDS = {
+    "the", "and", "for", "with", "that", "this", "are", "was", "you", "your", "can", "what", "about",
+    "from", "into", "have", "how", "find", "write", "article", "include", "some", "any", "all",
+}
+
+_encoding = None
+_encoding_failed = False
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        with _encoding_lock:
+            if _encoding is None and not _encoding_failed:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+                except Exception as e:
+                    # tiktoken downloads the encoding on first use; don't hold up the writer if it can't
+                    _encoding_failed = True
+                    log_output("Could not load tokenizer %s, estimating tokens from length: %s", TOKENIZER_ENCODING, str(e))
+    return _encoding
+
+
+def count_tokens(text):
+    encoding = _get_encoding()
+    if encoding is None:
+        return math.ceil(len(text) / 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate(text, max_tokens):
+    """Cut text to at most max_tokens tokens, marking the cut with ..."""
+    encoding = _get_encoding()
+    if encoding is None:
+        limit = max_tokens * 4
+        return text if len(text) <= limit else text[:limit].rstrip() + "..."
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens]).rstrip() + "..."
+
+
+def _terms(text):
+    return {word for word in re.findall(r"\w+", str(text).lower()) if len(word) > 2 and word not in STOP_WORDS}
+
+
+def _similarity(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _dedupe(items):
+    """Drop items whose URL was already seen, or whose description nearly repeats an earlier one"""
+    seen_urls = set()
+    kept = []
+    dropped = 0
+    for item in items:
+        url = item["item"].get("url")
+        if url and url != "None Available" and url in seen_urls:
+            dropped += 1
+            continue
+        if any(_similarity(item["words"], other["words"]) >= NEAR_DUPLICATE_THRESHOLD for other in kept):
+            dropped += 1
+            continue
+        if url:
+            seen_urls.add(url)
+        kept.append(item)
+    return kept, dropped
+
+
+def _rank(items, query_terms):
+    # share of the request's terms the item mentions, with a small nudge for Bing's own order
+    for item in items:
+        text_terms = _terms(f"{item['item'].get('name', '')} {item['item'].get('description', '')}")
+        overlap = len(query_terms & text_terms) / len(query_terms) if query_terms else 0.0
+        item["score"] = overlap + 0.25 / (1 + item["position"])
+    return sorted(items, key=lambda item: item["score"], reverse=True)
+
+
+def compact(request, instructions, research, products, budget=None):
+    """Trim research and product documents for the writer's prompt.
+
+    Research items are de-duplicated by URL and near-duplicate text across web,
+    entities and news, ranked by how much of the request they cover, and their
+    descriptions truncated. Product documents are truncated and kept first, then the
+    best research items are added while they fit in the token budget. Returns
+    (research, products, report) with research and products in their original shape.
+    The report's over_budget_dropped counts research items and products left out for
+    the budget, and products_dropped the products among them."""
+    budget = TOKEN_BUDGET if budget is None else budget
+    before = count_tokens(json.dumps(research)) + count_tokens(json.dumps(products))
+    if not ENABLED:
+        return research, products, {
+            "tokens_before": before,
+            "tokens_after": before,
+            "tokens_saved": 0,
+            "duplicates_dropped": 0,
+            "over_budget_dropped": 0,
+            "products_dropped": 0,
+            "budget": budget,
+        }
+
+    items = []
+    for category in ("web", "news", "entities"):
+        for position, item in enumerate(research.get(category, [])):
+            items.append({
+                "category": category,
+                "position": position,
+                "item": item,
+                "words": _terms(item.get("description", "")),
+            })
+    items, duplicates = _dedupe(items)
+    items = _rank(items, _terms(f"{request} {instructions}"))
+
+    used = 0
+    over_budget = 0
+    products_dropped = 0
+    compacted_products = []
+    for document in products:
+        document = dict(document, content=truncate(document.get("content", ""), PRODUCT_TOKENS))
+        tokens = count_tokens(json.dumps(document))
+        # keep the top product even when the budget is tiny, the article is built around it
+        if budget > 0 and compacted_products and used + tokens > budget:
+            over_budget += 1
+            products_dropped += 1
+            continue
+        compacted_products.append(document)
+        used += tokens
+
+    compacted_research = {"web": [], "entities": [], "news": []}
+    for item in items:
+        entry = dict(item["item"], description=truncate(item["item"].get("description", ""), SNIPPET_TOKENS))
+        tokens = count_tokens(json.dumps(entry))
+        if budget > 0 and used + tokens > budget:
+            over_budget += 1
+            continue
+        compacted_research[item["category"]].append(entry)
+        used += tokens
+
+    after = count_tokens(json.dumps(compacted_research)) + count_tokens(json.dumps(compacted_products))
+    report = {
+        "tokens_before": before,
+        "tokens_after": after,
+        "tokens_saved": max(0, before - after),
+        "duplicates_dropped": duplicates,
+        "over_budget_dropped": over_budget,
+        "products_dropped": products_dropped,
+        "budget": budget,
+    }
+    WRITER_TOKENS_SAVED.inc(report["tokens_saved"])
+    return compacted_research, compacted_products, report
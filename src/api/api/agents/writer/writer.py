@@ -3,27 +3,13 @@ import json
 import jsonlines
 import os
 
-from promptflow.core import AzureOpenAIModelConfiguration
-from promptflow.core import Flow
+from api.agents import registry
 from pathlib import Path
 
 folder = Path(__file__).parent.absolute().as_posix()
 
 def execute(request, feedback, instructions, research, products):
-    # Load prompty with AzureOpenAIModelConfiguration override
-    configuration = AzureOpenAIModelConfiguration(
-        azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME_4o"),
-        api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-    )
-
-    override_model = {
-        "configuration": configuration,
-        "parameters": {"max_tokens": 1400}
-    }
-        # create path to prompty file
-    prompty_file = folder + "/writer.prompty"
-    loaded_prompty = Flow.load(prompty_file, model=override_model)
+    loaded_prompty = registry.get_agent("writer")
     result = loaded_prompty(
         request=request,
         feedback=feedback,
@@ -35,6 +21,17 @@ def execute(request, feedback, instructions, research, products):
     return result
 
 
+async def execute_async(request, feedback, instructions, research, products):
+    loaded_prompty = registry.get_agent("writer", is_async=True)
+    return await loaded_prompty(
+        request=request,
+        feedback=feedback,
+        instructions=instructions,
+        research=research,
+        products=products
+    )
+
+
 def process(writer):
     # parse string this chracter --- , article and feedback
     result = writer.split("---")
@@ -49,6 +46,36 @@ def process(writer):
         "feedback": feedback,
     }
 
+class ArticleStreamSplitter:
+    """Splits streamed writer output on the fly at the first --- separator.
+
+    feed() returns the part of each chunk that is safe to show as article text. A
+    trailing run of dashes is held back until the next chunk shows whether it starts
+    the separator, and nothing after the separator is released."""
+
+    def __init__(self):
+        self.pending = ""
+        self.separated = False
+
+    def feed(self, chunk):
+        if self.separated or not chunk:
+            return ""
+        self.pending += chunk
+        index = self.pending.find("---")
+        if index >= 0:
+            self.separated = True
+            article, self.pending = self.pending[:index], ""
+            return article
+        held = min(2, len(self.pending) - len(self.pending.rstrip("-")))
+        article = self.pending[:len(self.pending) - held]
+        self.pending = self.pending[len(self.pending) - held:]
+        return article
+
+    def finish(self):
+        article, self.pending = ("" if self.separated else self.pending), ""
+        return article
+
+
 def write(request, feedback, instructions, research, products):
     result = execute(
         request=request,
@@ -60,6 +87,61 @@ def write(request, feedback, instructions, research, products):
     processed = process(result)
     return processed
 
+async def write_async(request, feedback, instructions, research, products):
+    result = await execute_async(
+        request=request,
+        feedback=feedback,
+        instructions=instructions,
+        research=research,
+        products=products
+    )
+    return process(result)
+
+def write_stream(request, feedback, instructions, research, products):
+    """Stream the article as it is generated.
+
+    Yields ("delta", text) for each piece of article text, then ("done", processed)
+    with the same result write() would have returned."""
+    loaded_prompty = registry.get_agent("writer_stream")
+    splitter = ArticleStreamSplitter()
+    chunks = []
+    for chunk in loaded_prompty(
+        request=request,
+        feedback=feedback,
+        instructions=instructions,
+        research=research,
+        products=products
+    ):
+        chunks.append(chunk)
+        delta = splitter.feed(chunk)
+        if delta:
+            yield ("delta", delta)
+    delta = splitter.finish()
+    if delta:
+        yield ("delta", delta)
+    yield ("done", process("".join(chunks)))
+
+async def write_stream_async(request, feedback, instructions, research, products):
+    loaded_prompty = registry.get_agent("writer_stream", is_async=True)
+    splitter = ArticleStreamSplitter()
+    chunks = []
+    stream = await loaded_prompty(
+        request=request,
+        feedback=feedback,
+        instructions=instructions,
+        research=research,
+        products=products
+    )
+    async for chunk in stream:
+        chunks.append(chunk)
+        delta = splitter.feed(chunk)
+        if delta:
+            yield ("delta", delta)
+    delta = splitter.finish()
+    if delta:
+        yield ("delta", delta)
+    yield ("done", process("".join(chunks)))
+
 
 if __name__ == "__main__":
     # get args from the user
@@ -1,17 +1,29 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-# Instrument flask HTTP calls
-from opentelemetry.instrumentation.flask import FlaskInstrumentor
-FlaskInstrumentor().instrument(enable_commenter=True, commenter_options={})
-
 from flask import Flask
 import api.get_article as get_article
-from api.logging import init_logging
+import api.article_jobs as article_jobs
+import api.metrics as metrics
+import api.startup as startup
+from api.logging import init_logging, tracing_enabled
 
 app = Flask(__name__)
 app.register_blueprint(get_article.bp)
+app.register_blueprint(article_jobs.bp)
+app.register_blueprint(metrics.bp)
+app.register_blueprint(startup.bp)
+if tracing_enabled():
+    # Instrument flask HTTP calls; without a trace destination the spans would go nowhere
+    from opentelemetry.instrumentation.flask import FlaskInstrumentor
+    FlaskInstrumentor.instrument_app(app, enable_commenter=True, commenter_options={})
+metrics.watch_app_stats()
 init_logging(sampling_rate=1.0)
+# load the pipeline and every agent's prompty before serving so the first request isn't the slow one
+# under gunicorn this runs from its server hooks instead, see gunicorn.conf.py
+if startup.WARM_UP_AT_IMPORT:
+    startup.warm_up()
+    startup.start_worker()
 
 if __name__ == '__main__':
-    app.run(debug=True, port=8080)
\ No newline at end of file
+    app.run(debug=True, port=8080)
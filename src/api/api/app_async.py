@@ -0,0 +1,41 @@
+from dotenv import load_dotenv
+load_dotenv()
+
+from quart import Quart, Response, jsonify
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+import api.get_article_async as get_article
+import api.article_jobs_async as article_jobs_async
+import api.metrics as metrics
+import api.startup as startup
+from api.logging import init_logging
+
+# ASGI app serving the asyncio article pipeline, see gunicorn.conf.py (API_SERVER_MODE=async)
+app = Quart(__name__)
+app.register_blueprint(get_article.bp)
+app.register_blueprint(article_jobs_async.bp)
+metrics.watch_app_stats()
+init_logging(sampling_rate=1.0)
+# load the pipeline and the prompties before serving; under gunicorn this runs from
+# its server hooks instead, see gunicorn.conf.py
+if startup.WARM_UP_AT_IMPORT:
+    startup.warm_up(is_async=True)
+    startup.start_worker()
+
+
+@app.route("/metrics")
+async def get_metrics():
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
+
+@app.route("/ready")
+async def ready():
+    body, status = startup.readiness()
+    return jsonify(body), status
+
+
+@app.route("/live")
+async def live():
+    return jsonify({"live": True})
+
+if __name__ == '__main__':
+    app.run(debug=True, port=8080)
@@ -0,0 +1,168 @@
+import os
+import time
+import argparse
+import threading
+
+from flask import Blueprint, request, stream_with_context, Response, jsonify, url_for
+from flask_cors import cross_origin
+from opentelemetry import trace
+from api.jobs import JobQueue, JobWorkers
+from api.get_article import _create_json_response, _create_sse_response, _wants_sse, SSE_HEADERS
+
+bp = Blueprint("article_jobs", __name__)
+
+# ARTICLE_JOB_WORKERS=0 leaves running jobs to separate `python -m api.article_jobs` processes
+JOB_WORKERS = int(os.getenv("ARTICLE_JOB_WORKERS", "2"))
+# events streams end after this long so they stay inside the server's request timeout;
+# clients carry on from the last event they saw
+EVENTS_MAX_SECONDS = float(os.getenv("ARTICLE_JOBS_EVENTS_MAX_SECONDS", "60"))
+EVENTS_POLL_SECONDS = 0.5
+
+
+def run_article_job(params):
+    from api.agents.orchestrator import write_article
+    return write_article(
+        params["context"],
+        params["instructions"],
+        params.get("evaluate", False),
+        stream_writer=params.get("stream", False),
+        budget=params.get("budget"),
+    )
+
+
+_article_jobs = None
+_job_workers = None
+_lock = threading.Lock()
+
+
+def get_article_jobs():
+    """The queue of article runs made through /jobs, shared by every process using the same
+    file. It is opened, and the file created, on first use rather than when the app is imported"""
+    global _article_jobs
+    if _article_jobs is None:
+        with _lock:
+            if _article_jobs is None:
+                _article_jobs = JobQueue(
+                    os.getenv("ARTICLE_JOBS_PATH", "article_jobs.db"),
+                    ttl=float(os.getenv("ARTICLE_JOBS_TTL_SECONDS", "86400")),
+                    stale_after=float(os.getenv("ARTICLE_JOBS_STALE_SECONDS", "600")),
+                )
+    return _article_jobs
+
+
+def get_job_workers(workers=JOB_WORKERS):
+    global _job_workers
+    jobs = get_article_jobs()
+    with _lock:
+        if _job_workers is None:
+            _job_workers = JobWorkers(jobs, run_article_job, workers=workers)
+    return _job_workers
+
+
+def job_stats():
+    """The queue's stats once it is open, {} until then"""
+    return _article_jobs.stats() if _article_jobs is not None else {}
+
+
+def _job_params(values):
+    budget = values.get("budget")
+    span = trace.get_current_span()
+    return {
+        "context": values.get("context"),
+        "instructions": values.get("instructions"),
+        "stream": str(values.get("stream", "false")).lower() == "true",
+        "budget": float(budget) if budget is not None else None,
+        "evaluate": span.is_recording(),
+    }
+
+
+def _wants_wait(args, default):
+    return args.get("wait", str(default)).lower() == "true"
+
+
+def _events_after(args, headers):
+    """Where an events request picks up: after=<seq>, or the seq in a "<job id>:<seq>" Last-Event-ID"""
+    _, _, seq = (headers.get("Last-Event-ID") or "").partition(":")
+    if seq.isdigit():
+        return int(seq)
+    return args.get("after", -1, type=int)
+
+
+@bp.route("/jobs", methods=["POST"])
+@cross_origin()
+def create_job():
+    values = request.get_json(silent=True) or request.values
+    if not values.get("context"):
+        return jsonify({"error": "context is required"}), 400
+    try:
+        params = _job_params(values)
+    except ValueError:
+        return jsonify({"error": "budget must be a number of seconds"}), 400
+    job_id = get_article_jobs().enqueue(params)
+    response = jsonify({"id": job_id, "status": "queued"})
+    response.status_code = 202
+    response.headers["Location"] = url_for("article_jobs.get_job", job_id=job_id)
+    return response
+
+
+@bp.route("/jobs/<job_id>")
+@cross_origin()
+def get_job(job_id):
+    job = get_article_jobs().get(job_id)
+    if job is None:
+        return jsonify({"error": "no such job"}), 404
+    return jsonify(job)
+
+
+@bp.route("/jobs/<job_id>/events")
+@cross_origin()
+def get_job_events(job_id):
+    """Return the job's events from the start, or after the one a reconnect last saw.
+
+    A waiting stream holds one of the sync server's threads, so by default this returns
+    what is there now and clients poll again. wait=true streams until the job finishes
+    or EVENTS_MAX_SECONDS pass"""
+    if get_article_jobs().get(job_id) is None:
+        return jsonify({"error": "no such job"}), 404
+    after = _events_after(request.args, request.headers)
+    wait = _wants_wait(request.args, False)
+    sse = _wants_sse(request.args.get("format"), request.headers.get("Accept"))
+
+    def stream():
+        nonlocal after
+        deadline = time.monotonic() + EVENTS_MAX_SECONDS
+        while True:
+            # read the status first, so a finished job's events are all there when they are read
+            job = get_article_jobs().get(job_id)
+            if job is None:
+                return
+            for seq, type, contents in get_article_jobs().events(job_id, after):
+                yield _create_sse_response(job_id, seq, type, contents) if sse else _create_json_response(type, contents)
+                after = seq
+            if job["status"] in ("succeeded", "failed"):
+                if sse:
+                    yield _create_sse_response(job_id, None, "done" if job["status"] == "succeeded" else "error", job["error"])
+                return
+            if not wait or time.monotonic() > deadline:
+                return
+            time.sleep(EVENTS_POLL_SECONDS)
+
+    if sse:
+        return Response(stream_with_context(stream()), mimetype="text/event-stream", headers=SSE_HEADERS)
+    return Response(stream_with_context(stream()), mimetype="application/json")
+
+
+if __name__ == "__main__":
+    from api.logging import init_logging
+    from api.agents import registry
+
+    parser = argparse.ArgumentParser(description="Run queued article jobs without serving HTTP")
+    parser.add_argument("--workers", type=int, default=JOB_WORKERS, help="pipeline workers in this process")
+    args = parser.parse_args()
+
+    init_logging(sampling_rate=1.0)
+    registry.warm_up()
+    job_workers = get_job_workers(args.workers)
+    job_workers.start()
+    for thread in job_workers.threads:
+        thread.join()
@@ -0,0 +1,69 @@
+import time
+import asyncio
+
+from quart import Blueprint, request, Response, jsonify, url_for
+from quart_cors import route_cors
+from api.article_jobs import get_article_jobs, _job_params, _events_after, _wants_wait, EVENTS_MAX_SECONDS, EVENTS_POLL_SECONDS
+from api.get_article import _create_json_response, _create_sse_response, _wants_sse, SSE_HEADERS
+
+bp = Blueprint("article_jobs_async", __name__)
+
+
+# Same contract as api.article_jobs; queue reads and writes run off the event loop
+@bp.route("/jobs", methods=["POST"])
+@route_cors(allow_origin="*")
+async def create_job():
+    values = await request.get_json(silent=True) or await request.values
+    if not values.get("context"):
+        return jsonify({"error": "context is required"}), 400
+    try:
+        params = _job_params(values)
+    except ValueError:
+        return jsonify({"error": "budget must be a number of seconds"}), 400
+    job_id = await asyncio.to_thread(get_article_jobs().enqueue, params)
+    response = jsonify({"id": job_id, "status": "queued"})
+    response.status_code = 202
+    response.headers["Location"] = url_for("article_jobs_async.get_job", job_id=job_id)
+    return response
+
+
+@bp.route("/jobs/<job_id>")
+@route_cors(allow_origin="*")
+async def get_job(job_id):
+    job = await asyncio.to_thread(get_article_jobs().get, job_id)
+    if job is None:
+        return jsonify({"error": "no such job"}), 404
+    return jsonify(job)
+
+
+@bp.route("/jobs/<job_id>/events")
+@route_cors(allow_origin="*")
+async def get_job_events(job_id):
+    if await asyncio.to_thread(get_article_jobs().get, job_id) is None:
+        return jsonify({"error": "no such job"}), 404
+    after = _events_after(request.args, request.headers)
+    # a waiting stream only costs the event loop a task here, so it waits unless told not to
+    wait = _wants_wait(request.args, True)
+    sse = _wants_sse(request.args.get("format"), request.headers.get("Accept"))
+
+    async def stream():
+        nonlocal after
+        deadline = time.monotonic() + EVENTS_MAX_SECONDS
+        while True:
+            job = await asyncio.to_thread(get_article_jobs().get, job_id)
+            if job is None:
+                return
+            for seq, type, contents in await asyncio.to_thread(get_article_jobs().events, job_id, after):
+                yield _create_sse_response(job_id, seq, type, contents) if sse else _create_json_response(type, contents)
+                after = seq
+            if job["status"] in ("succeeded", "failed"):
+                if sse:
+                    yield _create_sse_response(job_id, None, "done" if job["status"] == "succeeded" else "error", job["error"])
+                return
+            if not wait or time.monotonic() > deadline:
+                return
+            await asyncio.sleep(EVENTS_POLL_SECONDS)
+
+    if sse:
+        return Response(stream(), mimetype="text/event-stream", headers=SSE_HEADERS)
+    return Response(stream(), mimetype="application/json")
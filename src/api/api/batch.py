@@ -0,0 +1,128 @@
+import sys
+import json
+import time
+import argparse
+import threading
+import contextlib
+from concurrent import futures
+
+from api.agents import orchestrator
+from api.agents.product import product
+from api.agents.researcher import researcher
+from api.timings import Recorder
+from api.gateway import prioritized
+
+
+def run_row(row, stream_writer=False, budget=None):
+    """Generate one article and return its output row, with status "failed" and the error if it raised"""
+    output = {"request": row.get("request"), "instructions": row.get("instructions")}
+    started = time.perf_counter()
+    try:
+        if not row.get("request"):
+            raise ValueError("row has no request")
+        # batch rows give way to interactive requests sharing the Azure OpenAI quota
+        with prioritized("batch"):
+            for type, contents in orchestrator.write_article(
+                row["request"], row.get("instructions", ""), stream_writer=stream_writer, budget=budget
+            ):
+                if type == "writer":
+                    output["article"] = contents["article"]
+                elif type == "editor":
+                    output["editor"] = contents
+                elif type == "revision_stop":
+                    output["revision_stop"] = contents
+                elif type == "compaction":
+                    output["writer_tokens_saved"] = output.get("writer_tokens_saved", 0) + contents["tokens_saved"]
+        output["status"] = "succeeded"
+    except Exception as e:
+        output["status"] = "failed"
+        output["error"] = str(e)
+    output["seconds"] = time.perf_counter() - started
+    return output
+
+
+def run_batch(rows, out, concurrency=4, stream_writer=False, budget=None):
+    """Run every row through write_article on concurrency threads, writing each
+    output row to out as a JSON line as soon as it finishes, and return the report.
+
+    All rows share the process's agents, Bing client and result caches, so repeated
+    searches and embeddings across the batch are served from the caches."""
+    recorder = Recorder()
+    lock = threading.Lock()
+    failures = []
+
+    def finished(output):
+        with lock:
+            out.write(json.dumps(output) + "\n")
+            out.flush()
+            if output["status"] == "failed":
+                failures.append({"request": output["request"], "error": output["error"]})
+                print(f"Failed: {output['request']}: {output['error']}", file=sys.stderr)
+            else:
+                recorder.observe("article", output["seconds"])
+
+    started = time.perf_counter()
+    with recorder.stages(), futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = [executor.submit(run_row, row, stream_writer, budget) for row in rows]
+        for future in futures.as_completed(pending):
+            finished(future.result())
+    wall = time.perf_counter() - started
+
+    latencies = recorder.summary()
+    completed = len(rows) - len(failures)
+    return {
+        "rows": len(rows),
+        "completed": completed,
+        "failed": len(failures),
+        "wall_seconds": wall,
+        "articles_per_minute": completed / wall * 60 if wall else 0.0,
+        "article": latencies.pop("article", {"count": 0}),
+        "stages": latencies,
+        "failures": failures,
+        "caches": {"bing": researcher.search_cache.stats(), "embeddings": product.embedding_cache.stats()},
+    }
+
+
+def print_report(report, file):
+    print(f"{report['completed']} of {report['rows']} articles in {report['wall_seconds']:.1f}s "
+          f"({report['articles_per_minute']:.1f}/min), {report['failed']} failed", file=file)
+    print(f"{'':12} {'count':>6} {'p50':>8} {'p95':>8} {'p99':>8}", file=file)
+    for name, summary in list(report["stages"].items()) + [("article", report["article"])]:
+        if summary["count"]:
+            print(f"{name:12} {summary['count']:>6} {summary['p50']:>8.3f} {summary['p95']:>8.3f} {summary['p99']:>8.3f}",
+                  file=file)
+
+
+if __name__ == "__main__":
+    from api.logging import init_logging
+    from api.agents import registry
+
+    parser = argparse.ArgumentParser(description="Generate an article for every request/instructions row of a JSONL file")
+    parser.add_argument("input", help="JSONL file of request/instructions rows")
+    parser.add_argument("--output", default="-", help="JSONL file for the articles, default stdout")
+    parser.add_argument("--concurrency", type=int, default=4, help="number of rows to run at once")
+    parser.add_argument("--stream", action="store_true", help="use the streaming writer")
+    parser.add_argument("--budget", type=float, help="per-article latency budget in seconds")
+    parser.add_argument("--report", help="also write the report to this JSON file")
+    args = parser.parse_args()
+
+    with open(args.input) as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+
+    init_logging()
+    registry.warm_up()
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        # the pipeline prints every stage's output; keep stdout for the articles
+        with contextlib.redirect_stdout(sys.stderr):
+            report = run_batch(rows, out, concurrency=args.concurrency, stream_writer=args.stream, budget=args.budget)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print_report(report, sys.stderr)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    if report["failed"]:
+        sys.exit(1)
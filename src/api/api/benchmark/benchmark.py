@@ -0,0 +1,232 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import contextlib
+import tracemalloc
+from pathlib import Path
+from datetime import datetime, timezone
+from concurrent import futures
+
+from api.benchmark import standins
+from api.timings import Recorder
+from api.agents import orchestrator, orchestrator_async
+from api.agents.product import product
+from api.agents.researcher import researcher
+
+folder = Path(__file__).parent.absolute().as_posix()
+
+
+def clear_caches():
+    researcher.search_cache.clear()
+    product.embedding_cache.clear()
+
+
+class RunTimer:
+    """Timings for one write_article run, taken from the events it yields"""
+
+    def __init__(self, recorder, cold):
+        self.recorder = recorder
+        self.cold = cold
+
+    def start(self):
+        if self.cold:
+            clear_caches()
+        self.started = time.perf_counter()
+        self.first_event = None
+        self.first_article = None
+        self.tokens_saved = 0
+
+    def event(self, event):
+        now = time.perf_counter() - self.started
+        if self.first_event is None:
+            self.first_event = now
+            self.recorder.observe("first_event", now)
+        if self.first_article is None and event[0] in ("writer_delta", "writer"):
+            self.first_article = now
+            self.recorder.observe("first_article_text", now)
+        if event[0] == "compaction":
+            self.tokens_saved += event[1]["tokens_saved"]
+
+    def finish(self):
+        self.recorder.observe("total", time.perf_counter() - self.started)
+        self.recorder.observe("writer_tokens_saved", self.tokens_saved)
+
+
+def run_threaded(inputs, runs, concurrency, stream_writer, budget, recorder, cold):
+    """Run write_article runs times on concurrency threads, returning the number that failed"""
+
+    def run_once(i):
+        row = inputs[i % len(inputs)]
+        timer = RunTimer(recorder, cold)
+        timer.start()
+        for event in orchestrator.write_article(
+            row["request"], row["instructions"], stream_writer=stream_writer, budget=budget
+        ):
+            timer.event(event)
+        timer.finish()
+
+    failed = 0
+    with futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in futures.as_completed([executor.submit(run_once, i) for i in range(runs)]):
+            try:
+                future.result()
+            except Exception as e:
+                failed += 1
+                print(f"Run failed: {str(e)}", file=sys.__stderr__)
+    return failed
+
+
+async def run_async(inputs, runs, concurrency, stream_writer, budget, recorder, cold):
+    """Run the asyncio write_article runs times, at most concurrency at once"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_once(i):
+        row = inputs[i % len(inputs)]
+        async with semaphore:
+            timer = RunTimer(recorder, cold)
+            timer.start()
+            async for event in orchestrator_async.write_article(
+                row["request"], row["instructions"], stream_writer=stream_writer, budget=budget
+            ):
+                timer.event(event)
+            timer.finish()
+
+    results = await asyncio.gather(*[run_once(i) for i in range(runs)], return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"Run failed: {str(result)}", file=sys.__stderr__)
+    return sum(1 for result in results if isinstance(result, Exception))
+
+
+def benchmark(inputs, runs=10, concurrency=1, stream_writer=False, use_async=False,
+              latency_scale=1.0, cold=True, trace_memory=False, budget=None):
+    """Drive write_article against the offline stand-ins and return the results as a dict"""
+    standins.install(latency=standins.latency_profile(latency_scale))
+    recorder = Recorder()
+
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    # the pipeline prints every stage's output; keep it out of the report
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), recorder.stages():
+        if use_async:
+            failed = asyncio.run(run_async(inputs, runs, concurrency, stream_writer, budget, recorder, cold))
+        else:
+            failed = run_threaded(inputs, runs, concurrency, stream_writer, budget, recorder, cold)
+    wall = time.perf_counter() - started
+
+    memory = {"peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+    if trace_memory:
+        memory["peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+
+    latencies = recorder.summary()
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "runs": runs,
+            "concurrency": concurrency,
+            "stream_writer": stream_writer,
+            "async": use_async,
+            "latency_scale": latency_scale,
+            "cold_cache": cold,
+            "budget": budget,
+        },
+        "wall_seconds": wall,
+        "completed": runs - failed,
+        "failed": failed,
+        "throughput_runs_per_minute": (runs - failed) / wall * 60 if wall else 0.0,
+        "time_to_first_event": latencies.pop("first_event", {"count": 0}),
+        "time_to_first_article_text": latencies.pop("first_article_text", {"count": 0}),
+        "total": latencies.pop("total", {"count": 0}),
+        "writer_tokens_saved_per_run": latencies.pop("writer_tokens_saved", {"count": 0}),
+        "stages": latencies,
+        "memory": memory,
+        "bing": (researcher.get_async_bing_client() if use_async else researcher.get_bing_client()).stats(),
+        "caches": {"bing": researcher.search_cache.stats(), "embeddings": product.embedding_cache.stats()},
+    }
+
+
+# latency changes smaller than this are timer noise, whatever they are as a fraction
+MIN_LATENCY_CHANGE = 0.01
+
+
+def compare(results, baseline, tolerance):
+    """Lines describing every p95 latency or throughput that got worse than baseline by more than tolerance"""
+    regressions = []
+
+    def check(name, current, previous, higher_is_better=False):
+        if not previous or current is None:
+            return
+        if not higher_is_better and current - previous < MIN_LATENCY_CHANGE:
+            return
+        change = (current - previous) / previous
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append(f"{name}: {previous:.3f} -> {current:.3f} ({change:+.0%})")
+
+    for metric in ("time_to_first_event", "time_to_first_article_text", "total"):
+        check(f"{metric} p95", results[metric].get("p95"), baseline.get(metric, {}).get("p95"))
+    for stage, summary in results["stages"].items():
+        check(f"{stage} p95", summary.get("p95"), baseline.get("stages", {}).get(stage, {}).get("p95"))
+    check("throughput", results["throughput_runs_per_minute"], baseline.get("throughput_runs_per_minute"), True)
+    return regressions
+
+
+def print_report(results):
+    print(f"{results['completed']} runs in {results['wall_seconds']:.1f}s "
+          f"({results['throughput_runs_per_minute']:.1f}/min), {results['failed']} failed")
+    rows = [("first event", results["time_to_first_event"]), ("first article text", results["time_to_first_article_text"])]
+    rows += [(stage, summary) for stage, summary in results["stages"].items()]
+    rows.append(("total", results["total"]))
+    print(f"{'':20} {'count':>6} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for name, summary in rows:
+        if summary["count"]:
+            print(f"{name:20} {summary['count']:>6} {summary['p50']:>8.3f} {summary['p95']:>8.3f} {summary['p99']:>8.3f}")
+    for name, value in results["memory"].items():
+        print(f"{name}: {value:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the article pipeline against offline stand-ins")
+    parser.add_argument("--inputs", default=folder + "/../evaluate/eval_inputs.jsonl",
+                        help="JSONL of request/instructions rows, used round robin")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--stream", action="store_true", help="stream the writer's output")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="drive the asyncio pipeline")
+    parser.add_argument("--latency-scale", type=float, default=1.0,
+                        help="multiply every injected latency, e.g. 0.1 for a quick run")
+    parser.add_argument("--budget", type=float, help="per-article latency budget in seconds")
+    parser.add_argument("--warm-cache", action="store_true", help="keep the Bing and embedding caches between runs")
+    parser.add_argument("--trace-memory", action="store_true", help="also report the peak traced Python heap")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against the results JSON of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="fractional change against the baseline reported as a regression")
+    args = parser.parse_args()
+
+    with open(args.inputs) as f:
+        inputs = [json.loads(line) for line in f if line.strip()]
+
+    results = benchmark(
+        inputs, runs=args.runs, concurrency=args.concurrency, stream_writer=args.stream,
+        use_async=args.use_async, latency_scale=args.latency_scale, cold=not args.warm_cache,
+        trace_memory=args.trace_memory, budget=args.budget,
+    )
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"Regression: {line}")
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,232 @@
+import json
+import time
+import random
+import asyncio
+import hashlib
+from pathlib import Path
+from types import SimpleNamespace
+
+from api.agents import registry
+from api.agents.product import product
+from api.agents.researcher.bing import BingClient, AsyncBingClient, DEFAULT_QPS, set_bing_client
+
+folder = Path(__file__).parent.absolute().as_posix()
+
+# (mean seconds, jitter seconds) per stand-in, roughly what the live services take
+DEFAULT_LATENCY = {
+    "researcher": (2.5, 0.5),
+    "writer_first_token": (0.8, 0.2),
+    "writer_chunk": (0.02, 0.01),
+    "editor": (1.5, 0.3),
+    "bing": (0.4, 0.15),
+    "embedding": (0.15, 0.05),
+    "search": (0.12, 0.04),
+}
+
+
+class Latency:
+    """Injected delay of mean seconds, give or take up to jitter, never negative"""
+
+    def __init__(self, mean=0.0, jitter=0.0):
+        self.mean = mean
+        self.jitter = jitter
+
+    def sample(self):
+        return max(0.0, self.mean + random.uniform(-self.jitter, self.jitter))
+
+    def sleep(self):
+        time.sleep(self.sample())
+
+    async def sleep_async(self):
+        await asyncio.sleep(self.sample())
+
+
+def latency_profile(scale=1.0, overrides=None):
+    """Latency for every stand-in from DEFAULT_LATENCY, scaled by scale, with (mean, jitter) overrides by name"""
+    settings = dict(DEFAULT_LATENCY)
+    settings.update(overrides or {})
+    return {name: Latency(mean * scale, jitter * scale) for name, (mean, jitter) in settings.items()}
+
+
+def load_recordings(path=None):
+    with open(path or folder + "/recordings.json") as f:
+        return json.load(f)
+
+
+def _copy(value):
+    # every caller gets its own copy, as it would from a real response
+    return json.loads(json.dumps(value))
+
+
+class ReplayAgent:
+    """Stands in for a loaded prompty, answering every call with the recorded response"""
+
+    def __init__(self, response, latency):
+        self.response = response
+        self.latency = latency
+
+    def __call__(self, **inputs):
+        self.latency.sleep()
+        return _copy(self.response)
+
+
+class AsyncReplayAgent(ReplayAgent):
+    async def __call__(self, **inputs):
+        await self.latency.sleep_async()
+        return _copy(self.response)
+
+
+class ReplayStream:
+    """Stands in for a streaming prompty: the recorded text arrives in chunk_size pieces,
+    the first after first_token and each of the rest after chunk"""
+
+    def __init__(self, text, first_token, chunk, chunk_size=4):
+        self.chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        self.first_token = first_token
+        self.chunk = chunk
+
+    def __call__(self, **inputs):
+        self.first_token.sleep()
+        for i, piece in enumerate(self.chunks):
+            if i:
+                self.chunk.sleep()
+            yield piece
+
+    def complete(self):
+        """Wait as long as the whole stream would take and return the full text, for the non-streaming writer"""
+        time.sleep(self.first_token.sample() + sum(self.chunk.sample() for _ in self.chunks[1:]))
+        return "".join(self.chunks)
+
+
+class AsyncReplayStream(ReplayStream):
+    async def __call__(self, **inputs):
+        return self._stream()
+
+    async def _stream(self):
+        await self.first_token.sleep_async()
+        for i, piece in enumerate(self.chunks):
+            if i:
+                await self.chunk.sleep_async()
+            yield piece
+
+    async def complete(self):
+        await asyncio.sleep(self.first_token.sample() + sum(self.chunk.sample() for _ in self.chunks[1:]))
+        return "".join(self.chunks)
+
+
+class ReplayBingClient(BingClient):
+    """BingClient that answers from recorded responses by path instead of calling Bing.
+
+    The rate limiter and request counters still apply, so stats() reads the same as
+    it does against the live service."""
+
+    def __init__(self, responses, latency, qps=DEFAULT_QPS):
+        super().__init__("https://offline.invalid/", "", qps=qps)
+        self.responses = responses
+        self.latency = latency
+
+    def _replay(self, path):
+        if path not in self.responses:
+            raise ValueError(f"No recorded Bing response for {path}")
+        return _copy(self.responses[path])
+
+    def get(self, path, params=None):
+        self._count("limiter_wait_seconds", self.limiter.acquire())
+        start = time.monotonic()
+        self.latency.sleep()
+        self._observe_latency(time.monotonic() - start, path)
+        return self._replay(path)
+
+
+class AsyncReplayBingClient(ReplayBingClient, AsyncBingClient):
+    async def get(self, path, params=None):
+        self._count("limiter_wait_seconds", await self.limiter.acquire_async())
+        start = time.monotonic()
+        await self.latency.sleep_async()
+        self._observe_latency(time.monotonic() - start, path)
+        return self._replay(path)
+
+    async def close(self):
+        pass
+
+
+class ReplayOpenAI:
+    """Stands in for the Azure OpenAI client's embeddings API.
+
+    Each input gets a unit vector seeded from its text, so the same text always
+    embeds the same way."""
+
+    def __init__(self, dimensions, latency):
+        self.dimensions = dimensions
+        self.latency = latency
+        self.embeddings = self
+
+    def _embed(self, input):
+        inputs = [input] if isinstance(input, str) else list(input)
+        data = []
+        for text in inputs:
+            rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+            vector = [rng.gauss(0, 1) for _ in range(self.dimensions)]
+            norm = sum(v * v for v in vector) ** 0.5
+            data.append(SimpleNamespace(embedding=[v / norm for v in vector]))
+        return SimpleNamespace(data=data)
+
+    def create(self, input, model=None, **kwargs):
+        self.latency.sleep()
+        return self._embed(input)
+
+
+class AsyncReplayOpenAI(ReplayOpenAI):
+    async def create(self, input, model=None, **kwargs):
+        await self.latency.sleep_async()
+        return self._embed(input)
+
+
+class ReplaySearch:
+    """Stands in for Azure AI Search, returning the recorded product documents for every query"""
+
+    def __init__(self, documents, latency):
+        self.documents = documents
+        self.latency = latency
+
+    def retrieve_documentation(self, request, index_name, embedding):
+        self.latency.sleep()
+        return _copy(self.documents)
+
+    async def retrieve_documentation_async(self, request, index_name, embedding):
+        await self.latency.sleep_async()
+        return _copy(self.documents)
+
+
+def install(recordings=None, latency=None):
+    """Point every agent, Bing, embeddings and product search at the stand-ins for the rest of the process.
+
+    Both the threaded and the asyncio pipelines are covered. recordings defaults to
+    recordings.json next to this file and latency to latency_profile()."""
+    recordings = recordings or load_recordings()
+    latency = latency or latency_profile()
+
+    writer = ReplayStream(recordings["writer"], latency["writer_first_token"], latency["writer_chunk"])
+    async_writer = AsyncReplayStream(recordings["writer"], latency["writer_first_token"], latency["writer_chunk"])
+
+    def write(**inputs):
+        return writer.complete()
+
+    async def write_async(**inputs):
+        return await async_writer.complete()
+
+    registry.set_agent("researcher", ReplayAgent(recordings["researcher"], latency["researcher"]))
+    registry.set_agent("researcher", AsyncReplayAgent(recordings["researcher"], latency["researcher"]), is_async=True)
+    registry.set_agent("writer", write)
+    registry.set_agent("writer", write_async, is_async=True)
+    registry.set_agent("writer_stream", writer)
+    registry.set_agent("writer_stream", async_writer, is_async=True)
+    registry.set_agent("editor", ReplayAgent(recordings["editor"], latency["editor"]))
+    registry.set_agent("editor", AsyncReplayAgent(recordings["editor"], latency["editor"]), is_async=True)
+
+    set_bing_client(ReplayBingClient(recordings["bing"], latency["bing"]))
+    set_bing_client(AsyncReplayBingClient(recordings["bing"], latency["bing"]))
+
+    product.set_openai_client(ReplayOpenAI(recordings["embedding_dimensions"], latency["embedding"]))
+    product.set_openai_client(AsyncReplayOpenAI(recordings["embedding_dimensions"], latency["embedding"]), is_async=True)
+    product.set_search_backend(ReplaySearch(recordings["products"], latency["search"]))
@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import functools
+from collections import OrderedDict
+
+
+def normalize_text(text):
+    """Normalize free text for use in a cache key"""
+    return " ".join(str(text).lower().split())
+
+
+class SqliteStore:
+    """On-disk cache tier so warm entries survive a worker restart.
+
+    Expired rows are deleted when they are read, and every COMPACT_INTERVAL seconds
+    the whole file is swept: expired rows go, then the least recently used rows
+    until the values fit in max_bytes."""
+
+    COMPACT_INTERVAL = 60
+
+    def __init__(self, path, max_bytes=128 * 1024 * 1024):
+        self.lock = threading.Lock()
+        self.path = path
+        self.max_bytes = max_bytes
+        self.compacted = 0.0
+        self._conn = None
+        self._pid = None
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            # files written before the tier was capped lack the columns eviction needs
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(cache)")}
+            if "used" not in columns:
+                self.conn.execute("ALTER TABLE cache ADD COLUMN used REAL NOT NULL DEFAULT 0")
+            if "size" not in columns:
+                self.conn.execute("ALTER TABLE cache ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+                self.conn.execute("UPDATE cache SET size = length(value)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS cache_used ON cache (used)")
+
+    @property
+    def conn(self):
+        # a connection inherited across a fork (gunicorn preload_app) must not be used, so each process opens its own
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key):
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None, 0
+            if row[1] <= now:
+                self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None, 0
+            self.conn.execute("UPDATE cache SET used = ? WHERE key = ?", (now, key))
+        return row
+
+    def set(self, key, value, expires):
+        """Store value, returning how many rows a sweep evicted to stay under max_bytes"""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires, used, size) VALUES (?, ?, ?, ?, ?)",
+                (key, value, expires, now, len(value)),
+            )
+        if now - self.compacted >= self.COMPACT_INTERVAL:
+            return self.compact(now)
+        return 0
+
+    def compact(self, now=None):
+        """Delete expired rows, then the least recently used until the rest fit in max_bytes.
+        Returns how many rows were evicted for space"""
+        now = time.time() if now is None else now
+        with self.lock, self.conn:
+            self.compacted = now
+            self.conn.execute("DELETE FROM cache WHERE expires <= ?", (now,))
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            evict = []
+            for key, size in self.conn.execute("SELECT key, size FROM cache ORDER BY used"):
+                if total <= self.max_bytes:
+                    break
+                evict.append((key,))
+                total -= size
+            self.conn.executemany("DELETE FROM cache WHERE key = ?", evict)
+        return len(evict)
+
+    def delete(self, key):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+
+class ResultCache:
+    """Thread-safe TTL cache with LRU eviction, capped by the size of the stored values.
+
+    Values are kept as JSON so every hit hands back a fresh copy and the memory cap
+    can be measured. When a path is given, entries are also written to SQLite and
+    read back on a memory miss; the file is capped at max_disk_bytes, by default
+    four times the memory cap."""
+
+    def __init__(self, name, ttl=3600, max_bytes=32 * 1024 * 1024, path=None, max_disk_bytes=None):
+        self.name = name
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.store = SqliteStore(path, max_disk_bytes or 4 * max_bytes) if path else None
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "disk_hits": 0, "evictions": 0, "disk_evictions": 0}
+
+    def _drop(self, key):
+        value, _ = self.entries.pop(key)
+        self.size -= len(value)
+
+    def get(self, key):
+        """Return (hit, value) for key"""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > now:
+                    self.entries.move_to_end(key)
+                    self.counters["hits"] += 1
+                    return True, json.loads(value)
+                self._drop(key)
+
+        if self.store is not None:
+            value, expires = self.store.get(key)
+            if value is not None and expires > now:
+                with self.lock:
+                    self.counters["hits"] += 1
+                    self.counters["disk_hits"] += 1
+                    self._put(key, value, expires)
+                return True, json.loads(value)
+
+        with self.lock:
+            self.counters["misses"] += 1
+        return False, None
+
+    def _put(self, key, value, expires):
+        if key in self.entries:
+            self._drop(key)
+        if len(value) > self.max_bytes:
+            return
+        self.entries[key] = (value, expires)
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            self._drop(next(iter(self.entries)))
+            self.counters["evictions"] += 1
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        value = json.dumps(value)
+        with self.lock:
+            self._put(key, value, expires)
+        if self.store is not None:
+            evicted = self.store.set(key, value, expires)
+            if evicted:
+                with self.lock:
+                    self.counters["disk_evictions"] += evicted
+
+    def clear(self):
+        """Drop every in-memory entry; the on-disk tier is left alone"""
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["entries"] = len(self.entries)
+            stats["bytes"] = self.size
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+def cached(cache, key, ttl=None):
+    """Decorator that memoizes fn in cache, using key(*args, **kwargs) as the cache key"""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            cache_key = key(*args, **kwargs)
+            hit, value = cache.get(cache_key)
+            if hit:
+                return value
+            value = fn(*args, **kwargs)
+            cache.set(cache_key, value, ttl)
+            return value
+
+        return wrapper
+
+    return decorator
+
+
+def cached_async(cache, key, ttl=None):
+    """cached() for coroutine functions"""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            cache_key = key(*args, **kwargs)
+            hit, value = cache.get(cache_key)
+            if hit:
+                return value
+            value = await fn(*args, **kwargs)
+            cache.set(cache_key, value, ttl)
+            return value
+
+        return wrapper
+
+    return decorator
@@ -1,7 +1,11 @@
 # https://github.com/Azure-Samples/contoso-chat/blob/may-2024-updates/evaluations/evaluate-chat-flow-sdk.ipynb
 import os
 import json
+import argparse
+import threading
+import collections
 import concurrent.futures
+import jsonlines
 from pathlib import Path
 from datetime import datetime
 from promptflow.core import AzureOpenAIModelConfiguration
@@ -72,9 +76,50 @@ def run_orchestrator(request, instructions):
         "response": json.dumps(response),
     }
 
-def evaluate_orchestrator(model_config, data_path):
-     
-     
+def row_key(row):
+    return (row["request"], row.get("instructions"))
+
+def match_completed(data, completed_rows):
+    """Split input rows into completed results and rows still to run.
+
+    Results are matched on request and instructions. Results from runs that
+    didn't record instructions are matched on request alone."""
+    completed = collections.defaultdict(list)
+    by_request = collections.defaultdict(list)
+    for result in completed_rows:
+        if "instructions" in result:
+            completed[row_key(result)].append(result)
+        else:
+            by_request[result["request"]].append(result)
+    eval_results = []
+    pending = []
+    for row in data:
+        if completed[row_key(row)]:
+            eval_results.append(completed[row_key(row)].pop(0))
+        elif by_request[row["request"]]:
+            eval_results.append({**by_request[row["request"]].pop(0), "instructions": row.get("instructions")})
+        else:
+            pending.append(row)
+    return eval_results, pending
+
+def read_completed(path):
+    """Rows already scored in a previous run, for resume"""
+    completed = []
+    if not os.path.exists(path):
+        return completed
+    with jsonlines.open(path) as reader:
+        for row in reader.iter(skip_invalid=True):
+            # older runs wrote every result as a single list on one line
+            completed.extend(row if isinstance(row, list) else [row])
+    return completed
+
+def evaluate_orchestrator(model_config, data_path, concurrency=4, resume=False):
+    """Generate and score an article for every input row.
+
+    At most concurrency rows run at once. Each row's eval data and scores are
+    appended to eval_data.jsonl and eval_results.jsonl as soon as it finishes, so
+    with resume=True a re-run skips the rows a previous, interrupted run already
+    completed. Rows that fail are not written and are retried on resume."""
     writer_evaluator = ArticleEvaluator(model_config)
 
     data = []
@@ -82,31 +127,52 @@ def evaluate_orchestrator(model_config, data_path):
         for line in f:
             data.append(json.loads(line))
 
-    eval_data = []
-    eval_results = []
+    data_file = folder + '/eval_data.jsonl'
+    results_file = folder + '/eval_results.jsonl'
+
+    # match completed results to input rows; results for rows no longer in the input are left out
+    eval_results, pending = match_completed(data, read_completed(results_file) if resume else [])
+    if resume:
+        print(f"Resuming: {len(data) - len(pending)} rows already done, {len(pending)} to run")
+
+    mode = 'a' if resume else 'w'
+    lock = threading.Lock()
 
-    results = []
-    futures = []
     def evaluate_row(request, instructions):
-        result = { "request": request }
+        result = { "request": request, "instructions": instructions }
         print("Running orchestrator...")
-        eval_data = run_orchestrator(request, instructions)
+        row_data = run_orchestrator(request, instructions)
         print("Evaluating results...")
-        eval_result = writer_evaluator(query=eval_data["query"], context=eval_data["context"], response=eval_data["response"])
+        eval_result = writer_evaluator(query=row_data["query"], context=row_data["context"], response=row_data["response"])
         result.update(eval_result)
         print("Evaluation results: ", eval_result)
-        eval_results.append(result)
-
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        for row in data:
-            futures.append(executor.submit(evaluate_row, row["request"], row["instructions"]))
-        for future in futures:
-            results.append(future.result())
 
-    # write out eval data to a file so we can re-run evaluation on it
-    with jsonlines.open(folder + '/eval_data.jsonl', 'w') as writer:
-        for row in eval_data:
-            writer.write(row)
+        # write out eval data as we go so we can re-run evaluation on it
+        with lock:
+            data_writer.write(row_data)
+            results_writer.write(result)
+            eval_results.append(result)
+
+    failed = 0
+    with jsonlines.open(data_file, mode, flush=True) as data_writer, \
+            jsonlines.open(results_file, mode, flush=True) as results_writer:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {
+                executor.submit(evaluate_row, row["request"], row["instructions"]): row
+                for row in pending
+            }
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"Error evaluating {futures[future]['request']!r}: {str(e)}")
+
+    if failed:
+        print(f"{failed} rows failed; run again with --resume to retry them")
+    if not eval_results:
+        print("No evaluation results")
+        return eval_results
 
     import pandas as pd
 
@@ -114,7 +180,7 @@ def evaluate_orchestrator(model_config, data_path):
     results_df = pd.DataFrame.from_dict(eval_results)
     print(results_df)
 
-    mean_df = results_df.drop("request", axis=1).mean()
+    mean_df = results_df.drop(["request", "instructions"], axis=1, errors="ignore").mean()
     print("\nAverage scores:")
     print(mean_df)
 
@@ -123,8 +189,6 @@ def evaluate_orchestrator(model_config, data_path):
         file.write("\n\nAverages scores:\n\n")
     mean_df.to_markdown(folder + '/eval_results.md', 'a')
 
-    with jsonlines.open(folder + '/eval_results.jsonl', 'w') as writer:
-        writer.write(eval_results)
     print(f"::set-output name=gpt_relevance::{mean_df['gpt_relevance']}")
     print(f"::set-output name=gpt_fluency::{mean_df['gpt_fluency']}")
     print(f"::set-output name=gpt_coherence::{mean_df['gpt_coherence']}")
@@ -134,8 +198,14 @@ def evaluate_orchestrator(model_config, data_path):
 
 if __name__ == "__main__":
     import time
-    import jsonlines
-    
+
+    parser = argparse.ArgumentParser(description="Generate articles for eval_inputs.jsonl and score them")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("EVAL_CONCURRENCY", "4")),
+                        help="number of rows to run at once")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip rows already in eval_results.jsonl and append to it")
+    args = parser.parse_args()
+
     # Initialize Azure OpenAI Connection
     model_config = AzureOpenAIModelConfiguration(
         azure_deployment=os.environ["AZURE_OPENAI_DEPLOYMENT_NAME_4o"],   
@@ -147,7 +217,8 @@ if __name__ == "__main__":
     print(f"Starting evaluate...")
     print(os.environ["BING_SEARCH_ENDPOINT"])
     print("value: ", os.environ["BING_SEARCH_KEY"], len(os.environ["BING_SEARCH_KEY"]))
-    eval_result = evaluate_orchestrator(model_config, data_path=folder +"/eval_inputs.jsonl")
+    eval_result = evaluate_orchestrator(model_config, data_path=folder +"/eval_inputs.jsonl",
+                                        concurrency=args.concurrency, resume=args.resume)
 
     end=time.time()
     print(f"Finished evaluate in {end - start}s")
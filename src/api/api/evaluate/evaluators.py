@@ -1,11 +1,19 @@
 import os
+import re
 import json
-from threading import Thread
+import time
+import math
+import queue
+import random
+import threading
+import contextvars
+from concurrent import futures
 from opentelemetry import trace
 from promptflow.client import load_flow
 from opentelemetry.trace import set_span_in_context
 from promptflow.core import AzureOpenAIModelConfiguration
 from promptflow.evals.evaluators import RelevanceEvaluator, GroundednessEvaluator, FluencyEvaluator, CoherenceEvaluator
+from api.gateway import gateway, prioritized
 
 
 
@@ -50,38 +58,110 @@ patch_evaluator(GroundednessEvaluator, "custom_groundness.prompty")
 patch_evaluator(FluencyEvaluator, "custom_fluency.prompty")
 patch_evaluator(CoherenceEvaluator, "custom_coherence.prompty")
 
+# metric name in the fused prompty -> key the per-metric evaluators return
+FUSED_METRICS = {
+    "relevance": "gpt_relevance",
+    "fluency": "gpt_fluency",
+    "coherence": "gpt_coherence",
+    "groundedness": "gpt_groundedness",
+}
+
+
+def parse_score(value):
+    """Read a 1-5 score the way the promptflow evaluators do: first digit, NaN if there is none"""
+    match = re.search(r"\d", str(value)) if value is not None else None
+    return float(match.group()) if match else math.nan
+
+
 class ArticleEvaluator:
-    def __init__(self, model_config):
+    """Scores an article for relevance, fluency, coherence and groundedness.
+
+    mode "sequential" runs the four evaluators one after the other, "concurrent"
+    runs them in parallel, and "fused" asks for all four scores in a single call
+    to custom_fused.prompty. Every mode returns the same gpt_* keys."""
+
+    MODES = ("sequential", "concurrent", "fused")
+
+    def __init__(self, model_config, mode=None):
+        self.mode = mode or os.getenv("EVAL_MODE", "sequential")
+        if self.mode not in self.MODES:
+            raise ValueError(f"Unknown evaluation mode: {self.mode}")
+
+        if self.mode == "fused":
+            if model_config.api_version is None:
+                model_config.api_version = "2024-02-15-preview"
+            prompty_path = os.path.join(os.path.dirname(__file__), "custom_fused.prompty")
+            print(f"Loaded prompt file from: {prompty_path}")
+            flow = load_flow(source=prompty_path, model={"configuration": model_config})
+            self._flow = gateway.wrap(flow, model_config.azure_deployment, max_tokens=60)
+            return
+
+        # each evaluator answers with a single digit
         self.evaluators = [
-            RelevanceEvaluator(model_config),
-            FluencyEvaluator(model_config),
-            CoherenceEvaluator(model_config),
-            GroundednessEvaluator(model_config),
+            gateway.wrap(evaluator, model_config.azure_deployment, max_tokens=1)
+            for evaluator in (
+                RelevanceEvaluator(model_config),
+                FluencyEvaluator(model_config),
+                CoherenceEvaluator(model_config),
+                GroundednessEvaluator(model_config),
+            )
         ]
+        self.executor = None
+        if self.mode == "concurrent":
+            self.executor = futures.ThreadPoolExecutor(
+                max_workers=len(self.evaluators), thread_name_prefix="evaluator"
+            )
 
     def __call__(self, *, query: str, context: str, response: str, **kwargs):
+        if self.mode == "fused":
+            return self._fused(query, context, response)
+
+        if self.executor is None:
+            results = [
+                evaluator(question=query, context=context, answer=response)
+                for evaluator in self.evaluators
+            ]
+        else:
+            # copy the context per evaluator so their spans stay under run_evaluators
+            pending = [
+                self.executor.submit(
+                    contextvars.copy_context().run, evaluator,
+                    question=query, context=context, answer=response
+                )
+                for evaluator in self.evaluators
+            ]
+            results = [future.result() for future in pending]
+
         output = {}
-        for evaluator in self.evaluators:
-            result = evaluator(
-                question=query,
-                context=context,
-                answer=response,
-            )
+        for result in results:
             output.update(result)
         return output
 
-def evaluate_article(data, trace_context):
+    def _fused(self, query, context, response):
+        scores = self._flow(question=query, context=context, answer=response)
+        if isinstance(scores, str):
+            try:
+                scores = json.loads(scores)
+            except ValueError:
+                print(f"Fused evaluation returned invalid JSON: {scores}")
+                scores = {}
+        return {key: parse_score(scores.get(metric)) for metric, key in FUSED_METRICS.items()}
+
+def get_model_configuration():
+    return AzureOpenAIModelConfiguration(
+        azure_deployment=os.environ["AZURE_OPENAI_DEPLOYMENT_NAME_4o"],
+        api_version=os.environ["AZURE_OPENAI_API_VERSION"],
+        azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"]
+    )
+
+def evaluate_article(data, trace_context, evaluator=None):
     print("starting offline evals")
 
     tracer = trace.get_tracer(__name__)
     with tracer.start_as_current_span("run_evaluators", context=trace_context) as span:
         span.set_attribute("inputs", json.dumps(data))
-        configuration = AzureOpenAIModelConfiguration(
-            azure_deployment=os.environ["AZURE_OPENAI_DEPLOYMENT_NAME_4o"],
-            api_version=os.environ["AZURE_OPENAI_API_VERSION"],
-            azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"]
-        )
-        evaluator = ArticleEvaluator(configuration)
+        if evaluator is None:
+            evaluator = ArticleEvaluator(get_model_configuration())
         print("query",data['query'])
 
         print("context",data['context'])
@@ -93,6 +173,97 @@ def evaluate_article(data, trace_context):
         print("results: ", results_json)
         
 
+class EvaluationWorker:
+    """Bounded queue of online evaluations served by a fixed pool of threads.
+
+    Each thread builds one ArticleEvaluator and reuses it for every article. Only a
+    sample of articles is evaluated. When the queue is full, new work is dropped
+    (policy "drop") or the caller waits for room (policy "block"), so evaluation
+    can't pile up unbounded behind the serving process."""
+
+    def __init__(self, workers=1, queue_size=16, sampling_rate=1.0, policy="drop"):
+        self.workers = workers
+        self.sampling_rate = sampling_rate
+        self.policy = policy
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.threads = []
+        self.counters = {"submitted": 0, "sampled_out": 0, "dropped": 0, "completed": 0, "failed": 0}
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def _start(self):
+        with self.lock:
+            if self.threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._serve, name=f"evaluation-{i}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def _serve(self):
+        # interactive article generation gets the Azure OpenAI quota first
+        with prioritized("evaluation"):
+            self._serve_queue()
+
+    def _serve_queue(self):
+        evaluator = None
+        while True:
+            data, trace_context, enqueued = self.queue.get()
+            lag = time.monotonic() - enqueued
+            with self.lock:
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+            try:
+                if evaluator is None:
+                    evaluator = ArticleEvaluator(get_model_configuration())
+                evaluate_article(data, trace_context, evaluator)
+                self._count("completed")
+                print(f"Evaluation done after {lag:.1f}s in queue, {self.queue.qsize()} still queued")
+            except Exception as e:
+                print(f"Error evaluating article: {str(e)}")
+                self._count("failed")
+            finally:
+                self.queue.task_done()
+
+    def submit(self, data, trace_context):
+        """Queue an article for evaluation. Returns False if it was sampled out or dropped"""
+        if random.random() >= self.sampling_rate:
+            self._count("sampled_out")
+            return False
+
+        self._start()
+        item = (data, trace_context, time.monotonic())
+        try:
+            self.queue.put(item, block=self.policy == "block")
+        except queue.Full:
+            self._count("dropped")
+            print(f"Evaluation queue full ({self.queue.maxsize}), dropping evaluation")
+            return False
+        self._count("submitted")
+        return True
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["queue_depth"] = self.queue.qsize()
+            stats["queue_capacity"] = self.queue.maxsize
+            stats["last_lag_seconds"] = self.last_lag
+            stats["max_lag_seconds"] = self.max_lag
+        return stats
+
+
+evaluation_worker = EvaluationWorker(
+    workers=int(os.getenv("EVAL_WORKERS", "1")),
+    queue_size=int(os.getenv("EVAL_QUEUE_SIZE", "16")),
+    sampling_rate=float(os.getenv("EVAL_SAMPLING_RATE", "1.0")),
+    policy=os.getenv("EVAL_QUEUE_POLICY", "drop"),
+)
+
 def evaluate_article_in_background(request, instructions, research, products, article):
     eval_data = {
         "query": json.dumps({
@@ -106,8 +277,7 @@ def evaluate_article_in_background(request, instructions, research, products, ar
         "response": json.dumps(article)
     }
 
-    # propagate trace context to the new thread
+    # propagate trace context to the evaluation worker
     span = trace.get_current_span()
     trace_context = set_span_in_context(span)
-    thread = Thread(target=evaluate_article, args=(eval_data, trace_context,))
-    thread.start()
+    evaluation_worker.submit(eval_data, trace_context)
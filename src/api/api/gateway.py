@@ -0,0 +1,240 @@
+import os
+import json
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import functools
+import threading
+import contextlib
+import contextvars
+
+from api.logging import log_output
+from api.metrics import GATEWAY_WAIT_SECONDS, GATEWAY_QUEUE_DEPTH, GATEWAY_THROTTLES
+
+# lower goes first when a deployment's budget is short
+PRIORITIES = {"interactive": 0, "batch": 1, "evaluation": 2}
+
+# priority of the Azure OpenAI calls made from the current context; copied into
+# worker threads along with the rest of the context
+priority = contextvars.ContextVar("openai_priority", default="interactive")
+
+# how often asyncio callers look again while they wait their turn
+ASYNC_POLL_SECONDS = 0.05
+
+
+@contextlib.contextmanager
+def prioritized(level):
+    """Make the Azure OpenAI calls in this block at priority level"""
+    if level not in PRIORITIES:
+        raise ValueError(f"Unknown priority: {level}")
+    token = priority.set(level)
+    try:
+        yield
+    finally:
+        priority.reset(token)
+
+
+def estimate_tokens(inputs, max_tokens=0, base_tokens=0):
+    """Tokens a call counts against TPM, estimated the way Azure OpenAI's rate limiter
+    does: about four characters of prompt per token, plus the most it may generate"""
+    return base_tokens + len(json.dumps(inputs, default=str)) // 4 + max_tokens
+
+
+class RateBudget:
+    """Budget of per_minute units refilled continuously.
+
+    Azure OpenAI enforces quotas over short windows, not the whole minute, so only a
+    sixth of the minute's budget (ten seconds' worth) can be spent in a burst."""
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, per_minute / 6.0)
+        self.available = self.capacity
+        self.updated = time.monotonic()
+
+    def delay(self, amount, now):
+        """Seconds until amount can be spent; a call larger than a burst only waits for a full one"""
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+        needed = min(amount, self.capacity)
+        return 0.0 if self.available >= needed else (needed - self.available) / self.rate
+
+    def take(self, amount):
+        self.available -= amount
+
+
+class DeploymentQueue:
+    """Callers waiting on one deployment, let through in priority order as its budgets allow.
+
+    tpm and rpm of 0 leave that budget unlimited. After a throttle the whole
+    deployment pauses, so queued calls wait instead of failing too."""
+
+    def __init__(self, name, tpm=0, rpm=0):
+        self.name = name
+        self.tokens = RateBudget(tpm) if tpm else None
+        self.requests = RateBudget(rpm) if rpm else None
+        self.paused_until = 0.0
+        self.waiting = []
+        self.tickets = itertools.count()
+        self.condition = threading.Condition()
+
+    def _next(self, ticket, tokens):
+        """Under the lock: 0 once ticket has taken its budget, else seconds to wait, None until notified"""
+        if self.waiting[0] is not ticket:
+            return None
+        now = time.monotonic()
+        delay = self.paused_until - now
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.delay(tokens, now))
+        if self.requests is not None:
+            delay = max(delay, self.requests.delay(1, now))
+        if delay > 0:
+            return delay
+        heapq.heappop(self.waiting)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+        if self.requests is not None:
+            self.requests.take(1)
+        self.condition.notify_all()
+        return 0.0
+
+    def _enqueue(self, level):
+        ticket = (PRIORITIES[level], next(self.tickets))
+        with self.condition:
+            heapq.heappush(self.waiting, ticket)
+        GATEWAY_QUEUE_DEPTH.labels(deployment=self.name).inc()
+        return ticket
+
+    def _abandon(self, ticket):
+        with self.condition:
+            if ticket in self.waiting:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                self.condition.notify_all()
+
+    def acquire(self, tokens, level):
+        """Wait for this call's turn and budget. Returns the seconds spent waiting"""
+        started = time.monotonic()
+        ticket = self._enqueue(level)
+        try:
+            with self.condition:
+                while True:
+                    delay = self._next(ticket, tokens)
+                    if delay == 0:
+                        break
+                    self.condition.wait(delay)
+        finally:
+            self._abandon(ticket)
+            GATEWAY_QUEUE_DEPTH.labels(deployment=self.name).dec()
+        return time.monotonic() - started
+
+    async def acquire_async(self, tokens, level):
+        started = time.monotonic()
+        ticket = self._enqueue(level)
+        try:
+            while True:
+                with self.condition:
+                    delay = self._next(ticket, tokens)
+                if delay == 0:
+                    break
+                await asyncio.sleep(min(delay or ASYNC_POLL_SECONDS, ASYNC_POLL_SECONDS))
+        finally:
+            self._abandon(ticket)
+            GATEWAY_QUEUE_DEPTH.labels(deployment=self.name).dec()
+        return time.monotonic() - started
+
+    def pause(self, seconds):
+        with self.condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.condition.notify_all()
+
+
+def _throttle_delay(error, attempt):
+    """Seconds to hold the deployment after a 429 anywhere in error's chain, or None if it wasn't one"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError":
+            response = getattr(error, "response", None)
+            retry_after = response.headers.get("retry-after") if response is not None else None
+            try:
+                return max(0.0, float(retry_after))
+            except (TypeError, ValueError):
+                return random.uniform(0, min(60, 2 ** attempt))
+        error = error.__cause__ or error.__context__
+    return None
+
+
+class Gateway:
+    """Process-wide gate in front of every Azure OpenAI call.
+
+    Each deployment has its own TPM and RPM budgets and queue. Calls wait their
+    turn in priority order, and a throttled call holds the deployment for its
+    Retry-After and goes back in the queue, up to max_throttle_retries times."""
+
+    def __init__(self, budgets=None, max_throttle_retries=5):
+        self.budgets = budgets or {}
+        self.max_throttle_retries = max_throttle_retries
+        self.queues = {}
+        self.lock = threading.Lock()
+
+    def queue(self, deployment):
+        with self.lock:
+            if deployment not in self.queues:
+                budget = self.budgets.get(deployment, {})
+                self.queues[deployment] = DeploymentQueue(deployment, budget.get("tpm", 0), budget.get("rpm", 0))
+            return self.queues[deployment]
+
+    def _throttled(self, queue, error, attempt):
+        delay = _throttle_delay(error, attempt)
+        if delay is None or attempt == self.max_throttle_retries:
+            raise error
+        GATEWAY_THROTTLES.labels(deployment=queue.name).inc()
+        log_output("Deployment %s throttled, holding its queue for %.1fs", queue.name, delay)
+        queue.pause(delay)
+
+    def call(self, deployment, tokens, fn, *args, **kwargs):
+        """Call fn once deployment's budgets allow tokens more, at the current priority"""
+        queue = self.queue(deployment)
+        level = priority.get()
+        for attempt in range(self.max_throttle_retries + 1):
+            waited = queue.acquire(tokens, level)
+            GATEWAY_WAIT_SECONDS.labels(deployment=deployment, priority=level).observe(waited)
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                self._throttled(queue, e, attempt)
+
+    async def call_async(self, deployment, tokens, fn, *args, **kwargs):
+        queue = self.queue(deployment)
+        level = priority.get()
+        for attempt in range(self.max_throttle_retries + 1):
+            waited = await queue.acquire_async(tokens, level)
+            GATEWAY_WAIT_SECONDS.labels(deployment=deployment, priority=level).observe(waited)
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as e:
+                self._throttled(queue, e, attempt)
+
+    def wrap(self, fn, deployment, max_tokens=0, base_tokens=0, is_async=False):
+        """Route every call of fn, a prompty or evaluator taking keyword inputs, through the gateway"""
+        if is_async:
+            @functools.wraps(fn)
+            async def wrapper(**inputs):
+                tokens = estimate_tokens(inputs, max_tokens, base_tokens)
+                return await self.call_async(deployment, tokens, fn, **inputs)
+        else:
+            @functools.wraps(fn)
+            def wrapper(**inputs):
+                return self.call(deployment, estimate_tokens(inputs, max_tokens, base_tokens), fn, **inputs)
+        return wrapper
+
+
+def _budgets():
+    # e.g. {"gpt-4o": {"tpm": 80000, "rpm": 480}}; deployments left out are unlimited
+    return json.loads(os.getenv("AZURE_OPENAI_BUDGETS", "{}"))
+
+
+gateway = Gateway(_budgets(), max_throttle_retries=int(os.getenv("AZURE_OPENAI_MAX_THROTTLE_RETRIES", "5")))
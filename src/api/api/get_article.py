@@ -1,13 +1,23 @@
+import os
 import json
+import time
 
 from flask import Blueprint, request, stream_with_context, Response
 from opentelemetry import trace
-from api.agents.orchestrator import write_article
+from api.runs import RunStore, article_key, start_in_thread
+from api.metrics import ACTIVE_STREAMS, FIRST_EVENT_SECONDS
 
 from flask_cors import cross_origin
 
 bp = Blueprint("names", __name__)
 
+# identical requests arriving together share one pipeline run, and finished runs are
+# replayed to later requests until they expire
+article_runs = RunStore(
+    ttl=float(os.getenv("ARTICLE_CACHE_TTL_SECONDS", "600")),
+    max_runs=int(os.getenv("ARTICLE_CACHE_MAX_RUNS", "100")),
+)
+
 def _create_json_response(type, contents):
     return ">>>" + json.dumps({
         "type": type,
@@ -15,20 +25,103 @@ def _create_json_response(type, contents):
     })
 
 
+def _create_sse_response(run_id, seq, type, contents):
+    """One Server-Sent Event; events with a seq get the id "<run id>:<seq>" a reconnect resumes from"""
+    data = json.dumps({"type": type, "contents": contents, "run_id": run_id, "seq": seq})
+    event_id = f"id: {run_id}:{seq}\n" if seq is not None else ""
+    return f"{event_id}data: {data}\n\n"
+
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def _wants_sse(format, accept):
+    return format == "sse" or "text/event-stream" in (accept or "")
+
+
+def _resume_point(last_event_id):
+    """The run and position a Last-Event-ID picks up from, or (None, 0) if its run is gone"""
+    run_id, _, seq = (last_event_id or "").partition(":")
+    run = article_runs.get(run_id) if run_id and seq.isdigit() else None
+    if run is None:
+        return None, 0
+    return run, int(seq) + 1
+
+
+def _json_stream(results, started):
+    ACTIVE_STREAMS.inc()
+    try:
+        first = True
+        for result in results:
+            if first:
+                FIRST_EVENT_SECONDS.observe(time.perf_counter() - started)
+                first = False
+            yield _create_json_response(*result)
+    finally:
+        ACTIVE_STREAMS.dec()
+
+
+def _sse_stream(run, position, started):
+    """Stream run from position as SSE, closing with a "done" or "error" event that has no id,
+    so a client reconnecting after it replays nothing"""
+    ACTIVE_STREAMS.inc()
+    try:
+        seq = position
+        try:
+            for event in run.subscribe(position):
+                if seq == position:
+                    FIRST_EVENT_SECONDS.observe(time.perf_counter() - started)
+                yield _create_sse_response(run.id, seq, *event)
+                seq += 1
+        except Exception as e:
+            yield _create_sse_response(run.id, None, "error", str(e))
+        else:
+            yield _create_sse_response(run.id, None, "done", None)
+    finally:
+        ACTIVE_STREAMS.dec()
+
+
 # Route to call sales prompty that takes in a customer id and a question
 @bp.route("/get_article")
 @cross_origin()
-@stream_with_context
 def get_article():
+    started = time.perf_counter()
     context = request.args.get("context")
     instructions = request.args.get("instructions")
+    # stream=true forwards the article as "writer_delta" events while it is written
+    stream_writer = request.args.get("stream", "false").lower() == "true"
+    # cache=false always runs a fresh pipeline
+    use_cache = request.args.get("cache", "true").lower() != "false"
+    # budget=<seconds> stops editor revisions before they would overrun it
+    budget = request.args.get("budget", type=float)
+    # the pipeline, and promptflow with it, is imported on first use; api.startup loads it before serving
+    from api.agents.orchestrator import write_article
 
     evaluate = False
     span = trace.get_current_span()
-    if (span.is_recording):
+    if (span.is_recording()):
         evaluate = True
 
-    for result in write_article(context, instructions, evaluate):
-        yield _create_json_response(*result)
+    def start(run):
+        start_in_thread(run, write_article(context, instructions, evaluate, stream_writer=stream_writer, budget=budget))
+
+    # format=sse (or Accept: text/event-stream) streams Server-Sent Events that carry the
+    # run id and sequence number, and a reconnect with Last-Event-ID resumes the same run
+    if _wants_sse(request.args.get("format"), request.headers.get("Accept")):
+        run, position = _resume_point(request.headers.get("Last-Event-ID"))
+        if run is None:
+            if use_cache:
+                run = article_runs.get_or_start(article_key(context, instructions, stream_writer, budget), start)
+            else:
+                run = article_runs.start(start)
+        return Response(
+            stream_with_context(_sse_stream(run, position, started)), mimetype="text/event-stream", headers=SSE_HEADERS
+        )
+
+    if use_cache:
+        run = article_runs.get_or_start(article_key(context, instructions, stream_writer, budget), start)
+        results = run.subscribe()
+    else:
+        results = write_article(context, instructions, evaluate, stream_writer=stream_writer, budget=budget)
 
-    return Response(get_article(), mimetype="application/json")
+    return Response(stream_with_context(_json_stream(results, started)), mimetype="application/json")
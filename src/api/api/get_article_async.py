@@ -0,0 +1,85 @@
+import time
+
+from quart import Blueprint, request, Response
+from quart_cors import route_cors
+from opentelemetry import trace
+from api.get_article import (
+    _create_json_response, _create_sse_response, _resume_point, _wants_sse, article_runs, SSE_HEADERS,
+)
+from api.runs import article_key, start_task
+from api.metrics import ACTIVE_STREAMS, FIRST_EVENT_SECONDS
+
+bp = Blueprint("names_async", __name__)
+
+
+# Same contract as api.get_article, served from the asyncio pipeline
+@bp.route("/get_article")
+@route_cors(allow_origin="*")
+async def get_article():
+    started = time.perf_counter()
+    context = request.args.get("context")
+    instructions = request.args.get("instructions")
+    # stream=true forwards the article as "writer_delta" events while it is written
+    stream_writer = request.args.get("stream", "false").lower() == "true"
+    # cache=false always runs a fresh pipeline
+    use_cache = request.args.get("cache", "true").lower() != "false"
+    # budget=<seconds> stops editor revisions before they would overrun it
+    budget = request.args.get("budget", type=float)
+    # the pipeline, and promptflow with it, is imported on first use; api.startup loads it before serving
+    from api.agents.orchestrator_async import write_article
+
+    evaluate = False
+    span = trace.get_current_span()
+    if (span.is_recording()):
+        evaluate = True
+
+    def start(run):
+        start_task(run, write_article(context, instructions, evaluate, stream_writer=stream_writer, budget=budget))
+
+    # format=sse works as in api.get_article, resuming from Last-Event-ID
+    if _wants_sse(request.args.get("format"), request.headers.get("Accept")):
+        run, position = _resume_point(request.headers.get("Last-Event-ID"))
+        if run is None:
+            if use_cache:
+                run = article_runs.get_or_start(article_key(context, instructions, stream_writer, budget), start)
+            else:
+                run = article_runs.start(start)
+
+        async def sse_stream():
+            ACTIVE_STREAMS.inc()
+            try:
+                seq = position
+                try:
+                    async for event in run.subscribe_async(position):
+                        if seq == position:
+                            FIRST_EVENT_SECONDS.observe(time.perf_counter() - started)
+                        yield _create_sse_response(run.id, seq, *event)
+                        seq += 1
+                except Exception as e:
+                    yield _create_sse_response(run.id, None, "error", str(e))
+                else:
+                    yield _create_sse_response(run.id, None, "done", None)
+            finally:
+                ACTIVE_STREAMS.dec()
+
+        return Response(sse_stream(), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+    if use_cache:
+        run = article_runs.get_or_start(article_key(context, instructions, stream_writer, budget), start)
+        results = run.subscribe_async()
+    else:
+        results = write_article(context, instructions, evaluate, stream_writer=stream_writer, budget=budget)
+
+    async def stream():
+        ACTIVE_STREAMS.inc()
+        try:
+            first = True
+            async for result in results:
+                if first:
+                    FIRST_EVENT_SECONDS.observe(time.perf_counter() - started)
+                    first = False
+                yield _create_json_response(*result)
+        finally:
+            ACTIVE_STREAMS.dec()
+
+    return Response(stream(), mimetype="application/json")
@@ -0,0 +1,71 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+
+def profile(module, warm_up=False):
+    """Import module in a fresh interpreter under -X importtime, the way gunicorn.conf.py has
+    it imported, and return {"module", "warm_up", "total_ms", "error", "imports": {name:
+    {"self_ms", "cumulative_ms"}}}. warm_up also times the imports api.startup.warm_up makes,
+    which is what the gunicorn master pays before forking workers"""
+    code = f"import {module}"
+    if warm_up:
+        code += "; import api.startup; api.startup.warm_up()"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, env=dict(os.environ, API_WARM_UP_AT_IMPORT="false"),
+    )
+    imports = {}
+    error = None
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            # the header row
+            continue
+        name = fields[2].strip()
+        imports[name] = {"self_ms": int(fields[0]) / 1000, "cumulative_ms": int(fields[1]) / 1000}
+    if result.returncode != 0:
+        # the last line that isn't importtime's own output, the exception
+        errors = [line for line in result.stderr.splitlines() if line.strip() and not line.startswith("import time:")]
+        error = errors[-1] if errors else "import failed"
+    total = sum(times["self_ms"] for times in imports.values())
+    return {"module": module, "warm_up": warm_up, "total_ms": total, "error": error, "imports": imports}
+
+
+def print_profile(report, top, file):
+    warm_up = " and warm-up" if report["warm_up"] else ""
+    print(f"import {report['module']}{warm_up}: {report['total_ms']:.0f}ms", file=file)
+    if report["error"]:
+        print(f"  failed: {report['error']}", file=file)
+    slowest = sorted(report["imports"].items(), key=lambda item: item[1]["cumulative_ms"], reverse=True)[:top]
+    print(f"  {'cumulative':>10} {'self':>8}  module", file=file)
+    for name, times in slowest:
+        print(f"  {times['cumulative_ms']:>8.0f}ms {times['self_ms']:>6.0f}ms  {name}", file=file)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure how long importing each module takes in a fresh interpreter")
+    parser.add_argument("modules", nargs="*", default=["api.app"], help="modules to import, default api.app")
+    parser.add_argument("--top", type=int, default=20, help="slowest imports to list per module")
+    parser.add_argument("--warm-up", action="store_true", help="also profile the imports api.startup.warm_up makes")
+    parser.add_argument("--output", help="also write the full profiles to this JSON file")
+    args = parser.parse_args()
+
+    reports = [profile(module, args.warm_up) for module in args.modules]
+    for report in reports:
+        print_profile(report, args.top, sys.stdout)
+    if args.output:
+        with open(args.output, "w") as f:
+            # the slowest imports are what a baseline is compared on, the rest is noise
+            json.dump({
+                "python": sys.version.split()[0],
+                "profiles": [
+                    dict(report, imports=dict(sorted(
+                        report["imports"].items(), key=lambda item: item[1]["cumulative_ms"], reverse=True
+                    )[:args.top])) for report in reports
+                ],
+            }, f, indent=2)
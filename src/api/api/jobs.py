@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import contextlib
+
+from api.logging import log_output
+
+STATUSES = ("queued", "running", "succeeded", "failed")
+
+
+class JobQueue:
+    """Persistent queue of pipeline jobs and their events in SQLite.
+
+    Every process pointed at the same file shares the queue: HTTP workers enqueue
+    jobs and read their events, pipeline workers in this or other processes claim
+    queued jobs one at a time and append events as they run. A running job whose
+    worker stops sending events for stale_after seconds is put back in the queue,
+    up to max_attempts times, and finished jobs are deleted after ttl seconds."""
+
+    def __init__(self, path, ttl=86400, stale_after=600, max_attempts=2):
+        self.ttl = ttl
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        # set when a job is enqueued, so workers in this process don't wait out their poll interval
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+        self.path = path
+        self._conn = None
+        self._pid = None
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, params TEXT NOT NULL, "
+                "created REAL NOT NULL, started REAL, finished REAL, heartbeat REAL, error TEXT, "
+                "attempts INTEGER NOT NULL DEFAULT 0)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS events (job_id TEXT NOT NULL, seq INTEGER NOT NULL, type TEXT NOT NULL, "
+                "contents TEXT NOT NULL, PRIMARY KEY (job_id, seq))"
+            )
+
+    @property
+    def conn(self):
+        # each process opens its own connection, one inherited across a fork is unsafe to use
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._pid = os.getpid()
+        return self._conn
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self.lock:
+            # IMMEDIATE takes the write lock up front, so two processes can't claim the same job
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def enqueue(self, params):
+        """Queue a job for params and return its id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._transaction() as conn:
+            expired = "SELECT id FROM jobs WHERE status IN ('succeeded', 'failed') AND finished < ?"
+            conn.execute(f"DELETE FROM events WHERE job_id IN ({expired})", (now - self.ttl,))
+            conn.execute("DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND finished < ?", (now - self.ttl,))
+            conn.execute(
+                "INSERT INTO jobs (id, status, params, created) VALUES (?, 'queued', ?, ?)",
+                (job_id, json.dumps(params), now),
+            )
+        self.wakeup.set()
+        return job_id
+
+    def _recover(self, conn, now):
+        stale = conn.execute(
+            "SELECT id, attempts FROM jobs WHERE status = 'running' AND heartbeat < ?", (now - self.stale_after,)
+        ).fetchall()
+        for job_id, attempts in stale:
+            # the job starts over, so its partial events go
+            conn.execute("DELETE FROM events WHERE job_id = ?", (job_id,))
+            if attempts >= self.max_attempts:
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', finished = ?, error = ? WHERE id = ?",
+                    (now, "Worker stopped responding", job_id),
+                )
+            else:
+                conn.execute("UPDATE jobs SET status = 'queued' WHERE id = ?", (job_id,))
+            log_output("Job %s stalled on attempt %d", job_id, attempts)
+
+    def claim(self):
+        """Mark the oldest queued job running and return (id, attempt, params), or None if there is none.
+
+        attempt fences this run of the job: once the job is put back in the queue and
+        claimed again, appending or finishing with the old attempt does nothing"""
+        now = time.time()
+        with self._transaction() as conn:
+            self._recover(conn, now)
+            row = conn.execute(
+                "SELECT id, params FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started = ?, heartbeat = ?, attempts = attempts + 1 WHERE id = ?",
+                (now, now, row[0]),
+            )
+            attempt = conn.execute("SELECT attempts FROM jobs WHERE id = ?", (row[0],)).fetchone()[0]
+        return row[0], attempt, json.loads(row[1])
+
+    def append(self, job_id, attempt, seq, event):
+        """Add an event to attempt's run of the job. Returns False if the attempt no longer owns the job"""
+        type, contents = event
+        with self._transaction() as conn:
+            owned = conn.execute(
+                "UPDATE jobs SET heartbeat = ? WHERE id = ? AND attempts = ? AND status = 'running'",
+                (time.time(), job_id, attempt),
+            ).rowcount
+            if not owned:
+                return False
+            conn.execute(
+                "INSERT INTO events (job_id, seq, type, contents) VALUES (?, ?, ?, ?)",
+                (job_id, seq, type, json.dumps(contents)),
+            )
+        return True
+
+    def finish(self, job_id, attempt, error=None):
+        """Mark attempt's run of the job finished. Returns False if the attempt no longer owns the job"""
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = ?, finished = ?, error = ? WHERE id = ? AND attempts = ? AND status = 'running'",
+                ("failed" if error is not None else "succeeded", time.time(), error, job_id, attempt),
+            ).rowcount > 0
+
+    def get(self, job_id):
+        """The job's status as a dict, or None if there is no such job"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT id, status, created, started, finished, error, attempts FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            events = self.conn.execute("SELECT COUNT(*) FROM events WHERE job_id = ?", (job_id,)).fetchone()[0]
+        keys = ("id", "status", "created", "started", "finished", "error", "attempts")
+        return dict(zip(keys, row), events=events)
+
+    def events(self, job_id, after=-1):
+        """The job's events with a sequence number above after, as (seq, type, contents)"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT seq, type, contents FROM events WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, after)
+            ).fetchall()
+        return [(seq, type, json.loads(contents)) for seq, type, contents in rows]
+
+    def stats(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        stats = dict.fromkeys(STATUSES, 0)
+        stats.update(rows)
+        return stats
+
+
+class JobWorkers:
+    """Fixed pool of threads running queued jobs through run(params), which yields (type, contents) events"""
+
+    def __init__(self, jobs, run, workers=2, poll_interval=1.0):
+        self.jobs = jobs
+        self.run = run
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.threads = []
+
+    def start(self):
+        with self.lock:
+            if self.threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._serve, name=f"job-{i}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def _serve(self):
+        while True:
+            try:
+                job = self.jobs.claim()
+                if job is None:
+                    self.jobs.wakeup.wait(self.poll_interval)
+                    self.jobs.wakeup.clear()
+                    continue
+                self.run_job(*job)
+            except Exception as e:
+                # a job this worker couldn't record goes back in the queue once it is stale
+                log_output("Job worker error: %s", str(e))
+                time.sleep(self.poll_interval)
+
+    def run_job(self, job_id, attempt, params):
+        log_output("Job %s attempt %d started", job_id, attempt)
+        events = self.run(params)
+        error = None
+        try:
+            for seq, event in enumerate(events):
+                if not self.jobs.append(job_id, attempt, seq, event):
+                    log_output("Job %s attempt %d was handed to another worker, stopping it", job_id, attempt)
+                    events.close()
+                    return
+        except sqlite3.Error:
+            # the job's state is unknown, leave it to stale recovery
+            raise
+        except Exception as e:
+            log_output("Job %s failed: %s", job_id, str(e))
+            error = str(e)
+        if self.jobs.finish(job_id, attempt, error) and error is None:
+            log_output("Job %s finished", job_id)
@@ -0,0 +1,212 @@
+import sys
+import time
+import inspect
+import functools
+import contextlib
+
+from flask import Blueprint, Response
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from api.logging import log_output
+
+# Metrics are kept per worker process; scrape each worker, or run one worker per container
+
+# agent stages take seconds to minutes, so the buckets run well past the defaults
+STAGE_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 90, 120, 180, 300)
+
+STAGE_SECONDS = Histogram(
+    "article_stage_seconds", "Duration of each article pipeline stage", ["stage"], buckets=STAGE_BUCKETS
+)
+DEPENDENCY_SECONDS = Histogram(
+    "dependency_request_seconds", "Latency of calls to external services", ["dependency", "operation"],
+    buckets=STAGE_BUCKETS,
+)
+FIRST_EVENT_SECONDS = Histogram(
+    "get_article_first_event_seconds", "Time from a /get_article request to its first event", buckets=STAGE_BUCKETS
+)
+ACTIVE_STREAMS = Gauge("get_article_active_streams", "/get_article responses currently streaming")
+REVISION_ITERATIONS = Histogram(
+    "article_revision_iterations", "Editor revision iterations per article", buckets=(0, 1, 2, 3, 4, 5)
+)
+REVISION_STOPS = Counter("article_revision_stops", "Why articles stopped being revised", ["reason"])
+WRITER_TOKENS_SAVED = Counter("writer_context_tokens_saved", "Writer prompt tokens removed by research compaction")
+GATEWAY_WAIT_SECONDS = Histogram(
+    "azure_openai_queue_wait_seconds", "Time Azure OpenAI calls waited in the gateway for their turn",
+    ["deployment", "priority"], buckets=(0.01, 0.05) + STAGE_BUCKETS,
+)
+GATEWAY_QUEUE_DEPTH = Gauge("azure_openai_queue_depth", "Azure OpenAI calls waiting in the gateway", ["deployment"])
+GATEWAY_THROTTLES = Counter("azure_openai_throttles", "Azure OpenAI calls throttled with a 429", ["deployment"])
+
+
+# (histogram, listener) pairs told about every observation timed() makes, see watch
+_listeners = []
+
+
+@contextlib.contextmanager
+def watch(histogram, listener):
+    """Call listener(labels, seconds) for every duration timed() observes in histogram within this block"""
+    entry = (histogram, listener)
+    _listeners.append(entry)
+    try:
+        yield
+    finally:
+        _listeners.remove(entry)
+
+
+class _TimedMetric:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.metric = histogram.labels(**labels) if labels else histogram
+
+    def observe(self, seconds):
+        self.metric.observe(seconds)
+        for histogram, listener in list(_listeners):
+            if histogram is self.histogram:
+                listener(self.labels, seconds)
+
+
+def timed(histogram, **labels):
+    """Decorator observing each call's duration in histogram.
+
+    Calls that return a coroutine, a generator or an async generator are timed
+    until it is finished, so streaming stages count their whole stream. The
+    wrapper is the same kind of function as fn, so decorators stacked on top of
+    it, like promptflow's trace, still see a coroutine or generator function."""
+    metric = _TimedMetric(histogram, labels)
+
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                return await _await(metric, time.perf_counter(), fn(*args, **kwargs))
+            return wrapper
+
+        if inspect.isasyncgenfunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                async for item in _async_iterate(metric, time.perf_counter(), fn(*args, **kwargs)):
+                    yield item
+            return wrapper
+
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                return (yield from _iterate(metric, time.perf_counter(), fn(*args, **kwargs)))
+            return wrapper
+
+        # callables like prompties only show what they are by what they return
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = fn(*args, **kwargs)
+            if inspect.isawaitable(result):
+                return _await(metric, start, result)
+            if inspect.isasyncgen(result):
+                return _async_iterate(metric, start, result)
+            if inspect.isgenerator(result):
+                return _iterate(metric, start, result)
+            metric.observe(time.perf_counter() - start)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+async def _await(metric, start, awaitable):
+    try:
+        return await awaitable
+    finally:
+        metric.observe(time.perf_counter() - start)
+
+
+def _iterate(metric, start, generator):
+    try:
+        return (yield from generator)
+    finally:
+        metric.observe(time.perf_counter() - start)
+
+
+async def _async_iterate(metric, start, generator):
+    try:
+        async for item in generator:
+            yield item
+    finally:
+        metric.observe(time.perf_counter() - start)
+
+
+class StatsCollector:
+    """Exports the stats() dicts the app already keeps, read at scrape time.
+
+    Every key of a source becomes a metric named prefix_key, a counter if it is
+    listed in counters and a gauge otherwise. Sources sharing a prefix must use
+    the same label names."""
+
+    def __init__(self):
+        self.sources = []
+
+    def add(self, prefix, stats, counters=(), **labels):
+        self.sources.append((prefix, stats, set(counters), labels))
+
+    def collect(self):
+        families = {}
+        for prefix, stats, counters, labels in self.sources:
+            try:
+                values = stats()
+            except Exception as e:
+                log_output("Failed to collect %s stats: %s", prefix, str(e))
+                continue
+            for key, value in values.items():
+                name = f"{prefix}_{key}"
+                if name not in families:
+                    family = CounterMetricFamily if key in counters else GaugeMetricFamily
+                    families[name] = family(name, f"{prefix} {key.replace('_', ' ')}", labels=list(labels))
+                families[name].add_metric(list(labels.values()), value)
+        return list(families.values())
+
+
+stats = StatsCollector()
+REGISTRY.register(stats)
+
+
+def _loaded(module, read):
+    """Stats read(module) once module is imported, {} until then, so watching doesn't import it"""
+    def stats():
+        loaded = sys.modules.get(module)
+        return read(loaded) if loaded is not None else {}
+    return stats
+
+
+def watch_app_stats():
+    """Export the caches, Bing clients, article run store, job queue and evaluation queue"""
+    from api.get_article import article_runs
+    from api.article_jobs import job_stats
+
+    # the agents and promptflow.evals are imported on first use, until then there is nothing to report
+    researcher = "api.agents.researcher.researcher"
+    product = "api.agents.product.product"
+    bing = "api.agents.researcher.bing"
+    cache_counters = ("hits", "misses", "disk_hits", "evictions", "disk_evictions")
+    stats.add("result_cache", _loaded(researcher, lambda m: m.search_cache.stats()), cache_counters, cache="bing")
+    stats.add("result_cache", _loaded(product, lambda m: m.embedding_cache.stats()), cache_counters, cache="embeddings")
+
+    bing_counters = ("requests", "errors", "retries", "throttles", "limiter_wait_seconds", "latency_seconds_total")
+    stats.add("bing_client", _loaded(bing, lambda m: m._client.stats() if m._client else {}), bing_counters, client="sync")
+    stats.add("bing_client", _loaded(bing, lambda m: m._async_client.stats() if m._async_client else {}), bing_counters, client="async")
+
+    stats.add("article_runs", article_runs.stats, ("started", "coalesced", "replayed", "resumed"))
+    stats.add("article_jobs", job_stats)
+    stats.add(
+        "evaluation", _loaded("api.evaluate.evaluators", lambda m: m.evaluation_worker.stats()),
+        ("submitted", "sampled_out", "dropped", "completed", "failed"),
+    )
+
+
+bp = Blueprint("metrics", __name__)
+
+
+@bp.route("/metrics")
+def metrics():
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
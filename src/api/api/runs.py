@@ -0,0 +1,200 @@
+import time
+import uuid
+import asyncio
+import hashlib
+import threading
+import contextvars
+from collections import OrderedDict
+
+from api.cache import normalize_text
+from api.logging import log_output
+
+
+class Run:
+    """One pipeline run's event stream, buffered so any number of subscribers can follow it.
+
+    Events are appended by whoever drives the pipeline (a thread or an asyncio task)
+    and every subscriber reads the same list from its own position, so late joiners
+    first replay what they missed and then follow along live."""
+
+    def __init__(self, key):
+        self.key = key
+        # clients resume a run by id; the position in events is each event's sequence number
+        self.id = uuid.uuid4().hex
+        self.events = []
+        self.done = False
+        self.error = None
+        self.finished_at = None
+        self.condition = threading.Condition()
+        self.waiters = []
+
+    def _wake(self):
+        self.condition.notify_all()
+        for loop, event in self.waiters:
+            loop.call_soon_threadsafe(event.set)
+        self.waiters = []
+
+    def publish(self, event):
+        with self.condition:
+            self.events.append(event)
+            self._wake()
+
+    def finish(self, error=None):
+        with self.condition:
+            self.done = True
+            self.error = error
+            self.finished_at = time.monotonic()
+            self._wake()
+
+    def subscribe(self, start=0):
+        """Yield events from position start until the run finishes"""
+        index = start
+        while True:
+            with self.condition:
+                while index >= len(self.events) and not self.done:
+                    self.condition.wait()
+                events = self.events[index:]
+                done, error = self.done, self.error
+            for event in events:
+                yield event
+            index += len(events)
+            if done and index >= len(self.events):
+                if error is not None:
+                    raise error
+                return
+
+    async def subscribe_async(self, start=0):
+        """subscribe() for asyncio callers; waits without blocking the event loop"""
+        index = start
+        while True:
+            with self.condition:
+                events = self.events[index:]
+                done, error = self.done, self.error
+                if not events and not done:
+                    wakeup = asyncio.Event()
+                    self.waiters.append((asyncio.get_running_loop(), wakeup))
+            for event in events:
+                yield event
+            index += len(events)
+            if done and index >= len(self.events):
+                if error is not None:
+                    raise error
+                return
+            if not events:
+                await wakeup.wait()
+
+
+def start_in_thread(run, events):
+    """Drive a run from a generator of events on a background thread.
+
+    The pipeline keeps going when the request that started it disconnects, so the
+    other subscribers still get the full stream. The caller's context is copied so
+    trace spans opened by the pipeline keep their parent."""
+    def drive():
+        try:
+            for event in events:
+                run.publish(event)
+        except Exception as e:
+            log_output("Run %s failed: %s", run.key, str(e))
+            run.finish(e)
+        else:
+            run.finish()
+
+    ctx = contextvars.copy_context()
+    threading.Thread(target=ctx.run, args=(drive,), daemon=True).start()
+
+
+def start_task(run, events):
+    """Drive a run from an async generator of events on the running event loop"""
+    async def drive():
+        try:
+            async for event in events:
+                run.publish(event)
+        except Exception as e:
+            log_output("Run %s failed: %s", run.key, str(e))
+            run.finish(e)
+        else:
+            run.finish()
+
+    return asyncio.get_running_loop().create_task(drive())
+
+
+class RunStore:
+    """Coalesces identical in-flight requests onto one run and keeps finished runs for replay.
+
+    Finished runs are kept for ttl seconds, at most max_runs of them, oldest evicted
+    first. Runs that fail are dropped straight away so the next request retries.
+    Every run can also be looked up by its id for as long as it is kept."""
+
+    def __init__(self, ttl=600, max_runs=100):
+        self.ttl = ttl
+        self.max_runs = max_runs
+        self.runs = OrderedDict()
+        self.by_id = {}
+        self.lock = threading.Lock()
+        self.counters = {"started": 0, "coalesced": 0, "replayed": 0, "resumed": 0}
+
+    def _expire(self):
+        now = time.monotonic()
+        for key, run in list(self.runs.items()):
+            if run.done and (run.error is not None or now - run.finished_at > self.ttl):
+                self._remove(key)
+        finished = [key for key, run in self.runs.items() if run.done]
+        for key in finished[:max(0, len(finished) - self.max_runs)]:
+            self._remove(key)
+
+    def _remove(self, key):
+        run = self.runs.pop(key)
+        del self.by_id[run.id]
+
+    def _add(self, key):
+        run = Run(key)
+        # runs that are never coalesced are stored under their own id
+        run.key = key or run.id
+        self.runs[run.key] = run
+        self.by_id[run.id] = run
+        self.counters["started"] += 1
+        return run
+
+    def get_or_start(self, key, start):
+        """Return the live or cached run for key, calling start(run) to begin a new one"""
+        with self.lock:
+            self._expire()
+            run = self.runs.get(key)
+            if run is not None:
+                self.counters["replayed" if run.done else "coalesced"] += 1
+                self.runs.move_to_end(key)
+                return run
+            run = self._add(key)
+        start(run)
+        return run
+
+    def start(self, start):
+        """Begin a new run that is never coalesced with others but can still be resumed by id"""
+        with self.lock:
+            self._expire()
+            run = self._add(None)
+        start(run)
+        return run
+
+    def get(self, run_id):
+        """The live or cached run with run_id, or None once it has expired"""
+        with self.lock:
+            self._expire()
+            run = self.by_id.get(run_id)
+            if run is not None:
+                self.counters["resumed"] += 1
+            return run
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["in_flight"] = sum(1 for run in self.runs.values() if not run.done)
+            stats["cached"] = sum(1 for run in self.runs.values() if run.done)
+        return stats
+
+
+def article_key(context, instructions, *options):
+    """Cache key for an article request: normalized inputs plus anything that changes the event stream"""
+    parts = [normalize_text(context or ""), normalize_text(instructions or "")] + [str(o) for o in options]
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
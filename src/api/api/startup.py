@@ -0,0 +1,100 @@
+import os
+import time
+import threading
+
+from flask import Blueprint, jsonify
+
+from api.logging import log_output
+
+# gunicorn.conf.py turns this off and runs warm_up and start_worker from its server hooks
+# instead, so importing the app stays cheap and, with preload_app, the master warms up once
+WARM_UP_AT_IMPORT = os.getenv("API_WARM_UP_AT_IMPORT", "true").lower() == "true"
+
+_ready = threading.Event()
+_steps = {}
+_lock = threading.Lock()
+
+
+def _step(name, fn):
+    started = time.perf_counter()
+    try:
+        fn()
+        result = {"ok": True}
+    except Exception as e:
+        log_output("Warm-up step %s failed: %s", name, str(e))
+        result = {"ok": False, "error": str(e)}
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    with _lock:
+        _steps[name] = result
+
+
+def _load_tokenizer():
+    from api.agents.writer import compaction
+    compaction._get_encoding()
+
+
+def _import_pipeline(is_async):
+    import api.agents.orchestrator  # noqa: F401
+    if is_async:
+        import api.agents.orchestrator_async  # noqa: F401
+
+
+def _load_agents(is_async):
+    from api.agents import registry
+    registry.warm_up(is_async=is_async)
+
+
+def _import_evaluators():
+    import api.evaluate.evaluators  # noqa: F401
+
+
+def warm_up(is_async=False):
+    """Load what forked workers can share: the pipeline and promptflow, every agent's prompty,
+    the writer's tokenizer and, when articles are evaluated, promptflow.evals. With preload
+    this runs in the gunicorn master"""
+    _step("pipeline", lambda: _import_pipeline(is_async))
+    # jobs run on the threaded pipeline, whichever app takes the requests
+    _step("agents", lambda: _load_agents(False))
+    if is_async:
+        _step("agents_async", lambda: _load_agents(True))
+    _step("tokenizer", _load_tokenizer)
+    # articles are only evaluated when traces go to Application Insights
+    if os.getenv("APPLICATIONINSIGHTS_CONNECTION_STRING"):
+        _step("evaluators", _import_evaluators)
+
+
+def start_worker():
+    """Finish starting this process: fetch its Azure credentials, start the /jobs pipeline
+    workers and report ready. Credentials and threads don't survive a fork, so every worker
+    does this itself"""
+    from api.agents.product import product
+    from api.article_jobs import get_job_workers
+
+    _step("credentials", product.acquire_token)
+    # pipeline workers for /jobs run alongside the HTTP workers, see ARTICLE_JOB_WORKERS
+    get_job_workers().start()
+    _ready.set()
+    log_output("Ready, warm-up took %s", {name: step["seconds"] for name, step in readiness()[0]["steps"].items()})
+
+
+def readiness():
+    """The /ready body and status: 503 until start_worker has run in this process.
+    A step that failed is reported but doesn't hold readiness back, the first request retries it"""
+    with _lock:
+        steps = dict(_steps)
+    ready = _ready.is_set()
+    return {"ready": ready, "steps": steps}, 200 if ready else 503
+
+
+bp = Blueprint("startup", __name__)
+
+
+@bp.route("/ready")
+def ready():
+    body, status = readiness()
+    return jsonify(body), status
+
+
+@bp.route("/live")
+def live():
+    return jsonify({"live": True})
@@ -0,0 +1,40 @@
+import threading
+import contextlib
+
+import numpy as np
+
+from api.metrics import watch, STAGE_SECONDS
+
+PERCENTILES = (50, 95, 99)
+
+
+def summarize(samples):
+    if not samples:
+        return {"count": 0}
+    values = np.array(samples)
+    summary = {"count": len(samples), "mean": float(values.mean()), "max": float(values.max())}
+    for p in PERCENTILES:
+        summary[f"p{p}"] = float(np.percentile(values, p))
+    return summary
+
+
+class Recorder:
+    """Collects latency samples by name from any number of threads or tasks"""
+
+    def __init__(self):
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        with self.lock:
+            self.samples.setdefault(name, []).append(seconds)
+
+    @contextlib.contextmanager
+    def stages(self):
+        """Record every pipeline stage timed into STAGE_SECONDS within this block, by stage"""
+        with watch(STAGE_SECONDS, lambda labels, seconds: self.observe(labels["stage"], seconds)):
+            yield
+
+    def summary(self):
+        with self.lock:
+            return {name: summarize(samples) for name, samples in sorted(self.samples.items())}
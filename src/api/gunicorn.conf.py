@@ -1,4 +1,40 @@
+import os
+
 bind = "0.0.0.0:5000"
-workers = 1
-threads = 1
-timeout = 120
\ No newline at end of file
+timeout = 120
+
+# API_SERVER_MODE=async serves the asyncio pipeline from an ASGI worker, where one
+# process holds many concurrent article streams. The default keeps the synchronous app.
+is_async = os.getenv("API_SERVER_MODE", "sync") == "async"
+if is_async:
+    wsgi_app = "api.app_async:app"
+    worker_class = "uvicorn.workers.UvicornWorker"
+    workers = int(os.getenv("GUNICORN_WORKERS", "1"))
+else:
+    wsgi_app = "api.app:app"
+    workers = 1
+    # article streams and /jobs event streams each hold a thread for as long as they last,
+    # so keep enough threads that the probes and other requests still get one
+    worker_class = "gthread"
+    threads = int(os.getenv("GUNICORN_THREADS", "16"))
+
+# import the app and load the pipeline and its prompties once in the master; workers,
+# including ones restarted later, fork with all of it already in memory
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+# importing the app only builds it; the hooks below warm it up
+os.environ["API_WARM_UP_AT_IMPORT"] = "false"
+
+
+def when_ready(server):
+    # runs in the master before any worker is forked
+    if preload_app:
+        from api import startup
+        startup.warm_up(is_async)
+
+
+def post_worker_init(worker):
+    from api import startup
+    if not preload_app:
+        startup.warm_up(is_async)
+    # credentials and background threads don't survive a fork, so each worker starts its own
+    startup.start_worker()
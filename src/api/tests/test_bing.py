@@ -0,0 +1,183 @@
+import json
+import time
+import asyncio
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from api.agents.researcher.bing import BingClient, AsyncBingClient, TokenBucket
+
+
+class StubBing:
+    """Local HTTP server answering each request with the next scripted (status, headers) response"""
+
+    def __init__(self):
+        self.responses = []
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests.append((time.monotonic(), self.path, dict(self.headers)))
+                status, headers = stub.responses.pop(0) if stub.responses else (200, {})
+                body = json.dumps({"path": self.path}).encode("utf-8")
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.endpoint = f"http://127.0.0.1:{self.server.server_address[1]}/v7.0"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    stub = StubBing()
+    yield stub
+    stub.close()
+
+
+def _client(stub, cls=BingClient, **kwargs):
+    settings = dict(qps=1000, max_retries=3, backoff=0.01, timeout=5)
+    settings.update(kwargs)
+    return cls(stub.endpoint, "test-key", **settings)
+
+
+def test_sends_the_key_and_returns_json(stub):
+    client = _client(stub)
+    assert client.get("search", {"q": "tents"}) == {"path": "/v7.0/search?q=tents"}
+    assert stub.requests[0][2]["Ocp-Apim-Subscription-Key"] == "test-key"
+    stats = client.stats()
+    assert (stats["requests"], stats["errors"], stats["retries"], stats["throttles"]) == (1, 0, 0, 0)
+
+
+def test_retries_server_errors(stub):
+    stub.responses = [(503, {}), (500, {})]
+    client = _client(stub)
+    assert client.get("search")["path"] == "/v7.0/search"
+    stats = client.stats()
+    assert (stats["requests"], stats["errors"], stats["retries"]) == (3, 2, 2)
+
+
+def test_honours_retry_after_seconds(stub):
+    stub.responses = [(429, {"Retry-After": "0.3"})]
+    client = _client(stub)
+    client.get("search")
+    first, second = stub.requests[0][0], stub.requests[1][0]
+    assert second - first >= 0.3
+    assert (client.stats()["throttles"], client.stats()["retries"]) == (1, 1)
+
+
+def test_honours_retry_after_dates(stub):
+    client = _client(stub)
+
+    class Response:
+        headers = {"Retry-After": formatdate(time.time() + 30, usegmt=True)}
+
+    assert 25 < client._retry_delay(Response(), 0) <= 30
+
+
+def test_gives_up_after_max_retries(stub):
+    stub.responses = [(429, {"Retry-After": "0"})] * 3
+    client = _client(stub, max_retries=2)
+    with pytest.raises(requests.HTTPError):
+        client.get("search")
+    assert len(stub.requests) == 3
+    assert client.stats()["throttles"] == 3
+
+
+def test_client_errors_are_not_retried(stub):
+    stub.responses = [(401, {})]
+    client = _client(stub)
+    with pytest.raises(requests.HTTPError):
+        client.get("search")
+    assert len(stub.requests) == 1
+
+
+def test_token_bucket_spaces_out_requests(stub):
+    client = _client(stub, qps=10)
+    started = time.monotonic()
+    for _ in range(15):
+        client.get("search")
+    # a burst of ten, then one every tenth of a second
+    assert time.monotonic() - started >= 0.4
+    assert client.stats()["limiter_wait_seconds"] > 0.3
+
+
+def test_token_bucket_reserves_in_order():
+    bucket = TokenBucket(rate=2, capacity=1)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.5, abs=0.05)
+    assert bucket.reserve() == pytest.approx(1.0, abs=0.05)
+
+
+def test_async_client_retries_and_counts(stub):
+    stub.responses = [(429, {"Retry-After": "0.2"}), (502, {})]
+
+    async def search():
+        client = _client(stub, AsyncBingClient)
+        try:
+            return client, await client.get("search", {"q": "boots"})
+        finally:
+            await client.close()
+
+    client, result = asyncio.run(search())
+    assert result == {"path": "/v7.0/search?q=boots"}
+    assert stub.requests[1][0] - stub.requests[0][0] >= 0.2
+    stats = client.stats()
+    assert (stats["requests"], stats["throttles"], stats["errors"], stats["retries"]) == (3, 1, 1, 2)
+
+
+def test_async_client_gives_up_after_max_retries(stub):
+    stub.responses = [(503, {})] * 2
+
+    async def search():
+        client = _client(stub, AsyncBingClient, max_retries=1)
+        try:
+            await client.get("search")
+        finally:
+            await client.close()
+
+    with pytest.raises(Exception) as error:
+        asyncio.run(search())
+    assert getattr(error.value, "status", None) == 503
+    assert len(stub.requests) == 2
+
+
+def test_stops_retrying_at_max_elapsed(stub):
+    stub.responses = [(429, {"Retry-After": "5"})]
+    client = _client(stub, max_elapsed=1)
+    started = time.monotonic()
+    with pytest.raises(requests.HTTPError):
+        client.get("search")
+    assert time.monotonic() - started < 1
+    assert len(stub.requests) == 1
+
+
+def test_async_client_stops_retrying_at_max_elapsed(stub):
+    stub.responses = [(503, {"Retry-After": "5"})]
+
+    async def search():
+        client = _client(stub, AsyncBingClient, max_elapsed=1)
+        try:
+            await client.get("search")
+        finally:
+            await client.close()
+
+    with pytest.raises(Exception):
+        asyncio.run(search())
+    assert len(stub.requests) == 1
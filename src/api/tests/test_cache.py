@@ -0,0 +1,64 @@
+import time
+import sqlite3
+
+from api.cache import ResultCache, SqliteStore
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ResultCache("test", max_bytes=20)
+    cache.set("a", "x" * 8)
+    cache.set("b", "y" * 8)
+    cache.get("a")
+    cache.set("c", "z" * 8)
+    assert cache.get("a") == (True, "x" * 8)
+    assert cache.get("b") == (False, None)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    path = str(tmp_path / "cache.db")
+    ResultCache("test", path=path).set("a", {"n": 1})
+    cache = ResultCache("test", path=path)
+    assert cache.get("a") == (True, {"n": 1})
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_expired_rows_are_deleted_when_read(tmp_path):
+    store = SqliteStore(str(tmp_path / "cache.db"))
+    store.set("a", '"x"', time.time() - 1)
+    assert store.get("a") == (None, 0)
+    assert store.conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] == 0
+
+
+def test_compact_drops_expired_then_least_recently_used(tmp_path):
+    store = SqliteStore(str(tmp_path / "cache.db"), max_bytes=20)
+    now = time.time()
+    store.set("expired", "e" * 10, now - 1)
+    for key in ("a", "b", "c"):
+        store.set(key, key * 10, now + 60)
+        time.sleep(0.01)
+    store.get("a")
+    assert store.compact() == 1
+    keys = {row[0] for row in store.conn.execute("SELECT key FROM cache")}
+    assert keys == {"a", "c"}
+
+
+def test_set_sweeps_the_file_every_interval(tmp_path):
+    cache = ResultCache("test", max_bytes=10, path=str(tmp_path / "cache.db"), max_disk_bytes=25)
+    cache.store.COMPACT_INTERVAL = 0
+    for key in "abcde":
+        cache.set(key, key * 10)
+    assert cache.store.conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] == 2
+    assert cache.stats()["disk_evictions"] == 3
+
+
+def test_files_from_before_the_cap_are_upgraded(tmp_path):
+    path = str(tmp_path / "cache.db")
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("CREATE TABLE cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)")
+        conn.execute("INSERT INTO cache VALUES ('a', '\"old\"', ?)", (time.time() + 60,))
+    conn.close()
+    cache = ResultCache("test", path=path)
+    assert cache.get("a") == (True, "old")
+    assert cache.store.conn.execute("SELECT size FROM cache").fetchone()[0] == 5
@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+from api.agents.writer import compaction
+
+
+@pytest.fixture(autouse=True)
+def length_tokens(monkeypatch):
+    # count tokens from length, so results don't depend on downloading the tokenizer
+    monkeypatch.setattr(compaction, "_encoding", None)
+    monkeypatch.setattr(compaction, "_encoding_failed", True)
+
+
+def _item(name, description, url):
+    return {"name": name, "description": description, "url": url}
+
+
+def test_drops_repeated_urls_across_categories():
+    research = {
+        "web": [_item("Tents", "alpine tents for winter camping", "https://a.example/tents")],
+        "news": [_item("Tents again", "completely different words here", "https://a.example/tents")],
+        "entities": [],
+    }
+    compacted, _, report = compaction.compact("tents", "", research, [], budget=0)
+    assert [item["name"] for item in compacted["web"] + compacted["news"]] == ["Tents"]
+    assert report["duplicates_dropped"] == 1
+
+
+def test_drops_near_duplicate_descriptions():
+    research = {
+        "web": [
+            _item("One", "lightweight alpine tent sleeps four hikers", "https://a.example/1"),
+            _item("Two", "lightweight alpine tent sleeps four hikers easily", "https://b.example/2"),
+            _item("Three", "waterproof hiking boots for rocky trails", "https://c.example/3"),
+        ],
+        "news": [], "entities": [],
+    }
+    compacted, _, report = compaction.compact("tents", "", research, [], budget=0)
+    assert [item["name"] for item in compacted["web"]] == ["One", "Three"]
+    assert report["duplicates_dropped"] == 1
+
+
+def test_ranks_items_by_how_much_of_the_request_they_cover():
+    research = {
+        "web": [
+            _item("Boots", "waterproof boots for rocky trails", "https://a.example/boots"),
+            _item("Tents", "winter tents for alpine camping trips", "https://a.example/tents"),
+        ],
+        "news": [], "entities": [],
+    }
+    # one research item fits in the budget, and it should be the one about the request
+    entry = dict(research["web"][1])
+    budget = compaction.count_tokens(json.dumps(entry)) + 1
+    compacted, _, report = compaction.compact("winter alpine tents", "camping trips", research, [], budget=budget)
+    assert [item["name"] for item in compacted["web"]] == ["Tents"]
+    assert report["over_budget_dropped"] == 1
+
+
+def test_keeps_the_top_product_and_counts_those_over_budget():
+    products = [{"id": str(i), "title": f"Product {i}", "content": "x" * 400} for i in range(3)]
+    research = {"web": [_item("Tents", "tents", "https://a.example/tents")], "news": [], "entities": []}
+    compacted, kept, report = compaction.compact("tents", "", research, products, budget=10)
+    assert [product["id"] for product in kept] == ["0"]
+    assert compacted["web"] == []
+    assert report["products_dropped"] == 2
+    assert report["over_budget_dropped"] == 3
+
+
+def test_truncates_descriptions_and_products():
+    research = {"web": [_item("Tents", "word " * 1000, "https://a.example/tents")], "news": [], "entities": []}
+    products = [{"id": "1", "content": "y" * 10000}]
+    compacted, kept, _ = compaction.compact("tents", "", research, products, budget=0)
+    assert compacted["web"][0]["description"].endswith("...")
+    assert len(compacted["web"][0]["description"]) <= compaction.SNIPPET_TOKENS * 4 + 3
+    assert len(kept[0]["content"]) <= compaction.PRODUCT_TOKENS * 4 + 3
+
+
+def test_report_counts_tokens_before_and_after():
+    research = {"web": [_item("Tents", "word " * 1000, "https://a.example/tents")], "news": [], "entities": []}
+    _, _, report = compaction.compact("tents", "", research, [], budget=500)
+    assert report["budget"] == 500
+    assert report["tokens_after"] < report["tokens_before"]
+    assert report["tokens_saved"] == report["tokens_before"] - report["tokens_after"]
+
+
+def test_disabled_passes_research_through(monkeypatch):
+    monkeypatch.setattr(compaction, "ENABLED", False)
+    research = {"web": [_item("Tents", "word " * 1000, "https://a.example/tents")], "news": [], "entities": []}
+    compacted, _, report = compaction.compact("tents", "", research, [], budget=10)
+    assert compacted is research
+    assert report["tokens_saved"] == 0
@@ -0,0 +1,22 @@
+from api.evaluate.evaluate import match_completed
+
+
+def test_resume_matches_request_and_instructions():
+    data = [{"request": "tents", "instructions": "short"}, {"request": "tents", "instructions": "long"}]
+    done, pending = match_completed(data, [{"request": "tents", "instructions": "long", "score": 4}])
+    assert done == [{"request": "tents", "instructions": "long", "score": 4}]
+    assert pending == [data[0]]
+
+
+def test_resume_matches_results_without_instructions_on_request():
+    data = [{"request": "tents", "instructions": "short"}, {"request": "boots", "instructions": "short"}]
+    done, pending = match_completed(data, [{"request": "tents", "score": 3}])
+    assert done == [{"request": "tents", "instructions": "short", "score": 3}]
+    assert pending == [data[1]]
+
+
+def test_resume_uses_each_result_once():
+    data = [{"request": "tents", "instructions": "a"}, {"request": "tents", "instructions": "b"}]
+    done, pending = match_completed(data, [{"request": "tents", "score": 3}])
+    assert len(done) == 1
+    assert pending == [data[1]]
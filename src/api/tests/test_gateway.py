@@ -0,0 +1,124 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from api.gateway import Gateway, DeploymentQueue, RateBudget, prioritized, estimate_tokens, _throttle_delay
+
+
+class Throttled(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after=None):
+        super().__init__("429")
+        self.response = type("Response", (), {"headers": {"retry-after": retry_after} if retry_after else {}})()
+
+
+def test_rate_budget_allows_a_burst_then_waits():
+    budget = RateBudget(per_minute=60)
+    now = time.monotonic()
+    assert budget.delay(10, now) == 0
+    budget.take(10)
+    assert budget.delay(1, now) == pytest.approx(1.0)
+    # a call bigger than a burst only waits for a full one
+    assert budget.delay(100, now + 10) == 0
+
+
+def test_queued_calls_go_in_priority_order():
+    queue = DeploymentQueue("gpt", rpm=120)
+    for _ in range(20):
+        queue.acquire(0, "interactive")  # spend the burst, then one call every half second
+    order, threads = [], []
+
+    def call(level):
+        queue.acquire(0, level)
+        order.append(level)
+
+    for level in ("evaluation", "batch", "interactive"):
+        thread = threading.Thread(target=call, args=(level,))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join(10)
+    assert order == ["interactive", "batch", "evaluation"]
+
+
+def test_throttled_calls_hold_the_deployment_and_retry():
+    gateway = Gateway(max_throttle_retries=2)
+    attempts = []
+
+    def call():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise Throttled("0.2")
+        return "ok"
+
+    assert gateway.call("gpt", 10, call) == "ok"
+    assert attempts[1] - attempts[0] >= 0.2
+
+
+def test_throttled_calls_give_up_after_max_retries():
+    gateway = Gateway(max_throttle_retries=1)
+    calls = []
+
+    def call():
+        calls.append(1)
+        raise Throttled("0")
+
+    with pytest.raises(Throttled):
+        gateway.call("gpt", 10, call)
+    assert len(calls) == 2
+
+
+def test_other_errors_are_not_retried():
+    gateway = Gateway()
+    calls = []
+
+    def call():
+        calls.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        gateway.call("gpt", 10, call)
+    assert len(calls) == 1
+
+
+def test_throttles_are_found_in_the_cause_chain():
+    try:
+        try:
+            raise Throttled("3")
+        except Throttled as e:
+            raise RuntimeError("prompty failed") from e
+    except RuntimeError as e:
+        assert _throttle_delay(e, 0) == 3.0
+    assert _throttle_delay(ValueError(), 0) is None
+    assert 0 <= _throttle_delay(Throttled(), 2) <= 4
+
+
+def test_wrap_routes_async_calls_through_the_gateway():
+    gateway = Gateway({"gpt": {"rpm": 60}}, max_throttle_retries=1)
+    attempts = []
+
+    async def prompty(**inputs):
+        attempts.append(inputs)
+        if len(attempts) == 1:
+            raise Throttled("0.1")
+        return inputs["question"]
+
+    wrapped = gateway.wrap(prompty, "gpt", max_tokens=100, is_async=True)
+    assert asyncio.run(wrapped(question="tents?")) == "tents?"
+    assert len(attempts) == 2
+
+
+def test_priority_levels_are_checked():
+    with prioritized("batch"):
+        pass
+    with pytest.raises(ValueError):
+        with prioritized("urgent"):
+            pass
+
+
+def test_estimate_tokens_counts_prompt_and_completion():
+    assert estimate_tokens({"q": "x" * 400}, max_tokens=50, base_tokens=10) > 150
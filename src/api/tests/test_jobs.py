@@ -0,0 +1,98 @@
+import time
+import sqlite3
+
+from api.jobs import JobQueue, JobWorkers
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_job_runs_through_its_states(tmp_path):
+    jobs = JobQueue(str(tmp_path / "jobs.db"))
+    job_id = jobs.enqueue({"n": 1})
+    assert jobs.get(job_id)["status"] == "queued"
+
+    claimed_id, attempt, params = jobs.claim()
+    assert (claimed_id, attempt, params) == (job_id, 1, {"n": 1})
+    assert jobs.claim() is None
+    assert jobs.append(job_id, attempt, 0, ("message", "hello"))
+    assert jobs.finish(job_id, attempt)
+
+    job = jobs.get(job_id)
+    assert (job["status"], job["events"]) == ("succeeded", 1)
+    assert jobs.events(job_id) == [(0, "message", "hello")]
+    assert jobs.stats()["succeeded"] == 1
+
+
+def test_stale_attempt_is_fenced_off(tmp_path):
+    jobs = JobQueue(str(tmp_path / "jobs.db"), stale_after=0.05)
+    job_id = jobs.enqueue({})
+    _, first, _ = jobs.claim()
+    assert jobs.append(job_id, first, 0, ("message", "first"))
+    time.sleep(0.1)
+
+    # the first attempt went quiet, so the job is queued again and claimed anew
+    _, second, _ = jobs.claim()
+    assert second == first + 1
+    assert jobs.events(job_id) == []
+    assert jobs.append(job_id, second, 0, ("message", "second"))
+
+    # the old attempt still running can't add events or finish the job
+    assert not jobs.append(job_id, first, 1, ("message", "late"))
+    assert not jobs.finish(job_id, first, "late failure")
+    assert jobs.finish(job_id, second)
+    assert jobs.get(job_id)["status"] == "succeeded"
+    assert jobs.events(job_id) == [(0, "message", "second")]
+
+
+def test_stale_job_fails_after_max_attempts(tmp_path):
+    jobs = JobQueue(str(tmp_path / "jobs.db"), stale_after=0.01, max_attempts=1)
+    job_id = jobs.enqueue({})
+    jobs.claim()
+    time.sleep(0.05)
+    assert jobs.claim() is None
+    job = jobs.get(job_id)
+    assert (job["status"], job["error"]) == ("failed", "Worker stopped responding")
+
+
+def test_workers_record_failures(tmp_path):
+    jobs = JobQueue(str(tmp_path / "jobs.db"))
+
+    def run(params):
+        yield ("message", params["n"])
+        if params["n"] == 2:
+            raise ValueError("bad row")
+
+    workers = JobWorkers(jobs, run, workers=1, poll_interval=0.01)
+    workers.start()
+    ok, bad = jobs.enqueue({"n": 1}), jobs.enqueue({"n": 2})
+    _wait_for(lambda: jobs.get(bad)["status"] == "failed")
+    assert jobs.get(ok)["status"] == "succeeded"
+    assert jobs.get(bad)["error"] == "bad row"
+
+
+def test_worker_survives_database_errors(tmp_path):
+    jobs = JobQueue(str(tmp_path / "jobs.db"))
+    append = jobs.append
+    failures = []
+
+    def flaky_append(*args):
+        if not failures:
+            failures.append(args)
+            raise sqlite3.OperationalError("database is locked")
+        return append(*args)
+
+    jobs.append = flaky_append
+    workers = JobWorkers(jobs, lambda params: iter([("message", params)]), workers=1, poll_interval=0.01)
+    workers.start()
+    first = jobs.enqueue({"n": 1})
+    _wait_for(lambda: failures)
+    second = jobs.enqueue({"n": 2})
+    _wait_for(lambda: jobs.get(second)["status"] == "succeeded")
+    # the first job is left running for stale recovery, and the thread carried on
+    assert jobs.get(first)["status"] == "running"
+    assert workers.threads[0].is_alive()
@@ -0,0 +1,29 @@
+import os
+import json
+
+import numpy as np
+
+from api.agents.product.local_index import LocalIndex
+
+
+def _index(tmp_path, vectors):
+    embeddings = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1 if vectors else 0)
+    np.save(os.path.join(tmp_path, "embeddings.npy"), embeddings)
+    with open(os.path.join(tmp_path, "metadata.json"), "w") as f:
+        json.dump([{"id": str(i)} for i in range(len(vectors))], f)
+    return LocalIndex(str(tmp_path))
+
+
+def test_returns_the_closest_rows_in_order(tmp_path):
+    index = _index(tmp_path, [[1, 0], [0, 1], [0.6, 0.8]])
+    assert [d["id"] for d in index.search([0, 2], k=2)] == ["1", "2"]
+
+
+def test_clamps_k_to_the_catalog(tmp_path):
+    index = _index(tmp_path, [[1, 0], [0, 1]])
+    assert [d["id"] for d in index.search([1, 0], k=5)] == ["0", "1"]
+    assert index.search([1, 0], k=0) == []
+
+
+def test_empty_catalog_finds_nothing(tmp_path):
+    assert _index(tmp_path, []).search([1, 0], k=3) == []
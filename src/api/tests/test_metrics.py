@@ -0,0 +1,77 @@
+import asyncio
+import inspect
+
+from prometheus_client import CollectorRegistry, Histogram
+
+from api.metrics import timed
+
+
+def _histogram():
+    registry = CollectorRegistry()
+    histogram = Histogram("test_seconds", "test", ["stage"], registry=registry)
+    return histogram, lambda: registry.get_sample_value("test_seconds_count", {"stage": "s"})
+
+
+def test_coroutine_functions_stay_coroutine_functions():
+    histogram, count = _histogram()
+
+    @timed(histogram, stage="s")
+    async def stage(x):
+        await asyncio.sleep(0)
+        return x
+
+    # promptflow's trace picks its async wrapper with iscoroutinefunction
+    assert inspect.iscoroutinefunction(stage)
+    assert asyncio.run(stage(1)) == 1
+    assert count() == 1
+
+
+def test_async_generators_are_timed_over_the_whole_stream():
+    histogram, count = _histogram()
+
+    @timed(histogram, stage="s")
+    async def stream():
+        yield 1
+        yield 2
+
+    async def consume():
+        return [item async for item in stream()]
+
+    assert inspect.isasyncgenfunction(stream)
+    assert asyncio.run(consume()) == [1, 2]
+    assert count() == 1
+
+
+def test_generators_and_plain_functions():
+    histogram, count = _histogram()
+
+    @timed(histogram, stage="s")
+    def stream():
+        yield 1
+        return "done"
+
+    @timed(histogram, stage="s")
+    def call():
+        return 2
+
+    assert inspect.isgeneratorfunction(stream)
+    generator = stream()
+    assert count() == 0
+    assert list(generator) == [1]
+    assert call() == 2
+    assert count() == 2
+
+
+def test_callables_returning_awaitables_are_timed_when_awaited():
+    histogram, count = _histogram()
+
+    async def answer():
+        return 3
+
+    class Agent:
+        def __call__(self):
+            return answer()
+
+    timed_agent = timed(histogram, stage="s")(Agent())
+    assert asyncio.run(timed_agent()) == 3
+    assert count() == 1
@@ -0,0 +1,128 @@
+import time
+import threading
+
+from api.agents import orchestrator
+
+
+def _sleep(seconds, result):
+    time.sleep(seconds)
+    return result
+
+
+def test_fan_out_yields_results_as_they_finish():
+    results = list(orchestrator.fan_out([
+        ("slow", _sleep, (0.2, "slow"), 5, None),
+        ("fast", _sleep, (0.01, "fast"), 5, None),
+    ]))
+    assert results == [("fast", "fast"), ("slow", "slow")]
+
+
+def test_fan_out_falls_back_on_timeout():
+    started = time.monotonic()
+    results = dict(orchestrator.fan_out([
+        ("hangs", _sleep, (2, "late"), 0.1, "fallback"),
+        ("quick", _sleep, (0, "quick"), 5, None),
+    ]))
+    assert results == {"hangs": "fallback", "quick": "quick"}
+    assert time.monotonic() - started < 1
+
+
+def test_concurrent_runs_do_not_time_each_other_out():
+    # every run's branches would queue behind the others' on a shared pool
+    outcomes = []
+
+    def run(i):
+        outcomes.append(dict(orchestrator.fan_out([
+            ("researcher", _sleep, (0.3, i), 0.6, "fallback"),
+            ("products", _sleep, (0.3, i), 0.6, "fallback"),
+        ])))
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all("fallback" not in outcome.values() for outcome in outcomes)
+    assert len(outcomes) == 8
+
+
+def test_timed_out_research_does_not_leak_into_revisions(monkeypatch):
+    seen = []
+
+    def get_research(request, instructions, feedback, memo=None):
+        if feedback == "No Feedback":
+            # the first round finishes, and records its results, after it timed out
+            time.sleep(0.3)
+            memo.add({"function": "find_information", "arguments": {"query": "late"}, "result": []})
+        else:
+            time.sleep(0.4)
+            seen.append(memo.entries())
+        return {"web": [], "entities": [], "news": []}
+
+    def run_writer(*args, **kwargs):
+        yield ("writer", {"article": "article", "feedback": "feedback"})
+
+    editor_responses = iter([
+        '{"decision": "accept", "researchFeedback": "more", "editorFeedback": "more"}',
+        '{"decision": "reject", "researchFeedback": "", "editorFeedback": ""}',
+    ])
+    monkeypatch.setattr(orchestrator, "RESEARCH_TIMEOUT", 0.1)
+    monkeypatch.setattr(orchestrator, "get_research", get_research)
+    monkeypatch.setattr(orchestrator, "get_products", lambda request: [])
+    monkeypatch.setattr(orchestrator, "run_writer", run_writer)
+    monkeypatch.setattr(orchestrator, "get_editor", lambda article, feedback: next(editor_responses))
+
+    events = list(orchestrator.write_article("tents", "short"))
+    assert ("researcher", {"web": [], "entities": [], "news": []}) in events
+    assert seen == [[]]
+
+
+REVISE = {"decision": "accept", "researchFeedback": "more", "editorFeedback": "more"}
+DONE = {"decision": "reject", "researchFeedback": "", "editorFeedback": ""}
+
+
+def _policy(budget=None, max_iterations=2, elapsed=0.0, **stages):
+    policy = orchestrator.RevisionPolicy(budget, max_iterations)
+    policy.started -= elapsed
+    for stage, seconds in stages.items():
+        policy.observe(stage, seconds)
+    return policy
+
+
+def test_revision_estimate_sums_the_stages_then_uses_the_last_round():
+    policy = _policy(researcher=10, products=5, writer=20, editor=3)
+    assert policy.estimate() == 33
+    policy.observe_iteration(40)
+    assert policy.estimate() == 40
+    policy.observe_iteration(12)
+    assert policy.estimate() == 33
+
+
+def test_revision_stops_when_the_editor_is_done():
+    assert _policy().stop_reason(DONE) == "editor_done"
+    assert _policy().stop_reason({"decision": "Accept feedback"}) is None
+
+
+def test_revision_stops_after_max_iterations():
+    policy = _policy(max_iterations=1, writer=1)
+    assert policy.stop_reason(REVISE) is None
+    policy.observe_iteration(1)
+    assert policy.stop_reason(REVISE) == "max_iterations"
+
+
+def test_revision_stops_before_overrunning_the_budget():
+    assert _policy(budget=60, elapsed=20, researcher=10, writer=20, editor=5).stop_reason(REVISE) is None
+    assert _policy(budget=60, elapsed=30, researcher=10, writer=20, editor=5).stop_reason(REVISE) == "budget"
+    # no budget, or a budget of 0, only caps revisions by count
+    assert _policy(budget=0, elapsed=1000, writer=1000).stop_reason(REVISE) is None
+
+
+def test_revision_stop_event_reports_the_run():
+    policy = _policy(budget=60, elapsed=30, researcher=10, writer=20, editor=5)
+    kind, details = policy.stop_event(policy.stop_reason(REVISE))
+    assert kind == "revision_stop"
+    assert details["reason"] == "budget"
+    assert details["iterations"] == 0
+    assert details["next_iteration_seconds"] == 35
+    assert details["budget_seconds"] == 60
+    assert details["elapsed_seconds"] >= 30
@@ -0,0 +1,59 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from api.cache import ResultCache
+from api.agents.product import product
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.inputs = []
+
+    def create(self, input, model):
+        self.inputs.append(input)
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[float(len(self.inputs)), 0.0])])
+
+
+class FakeAsyncEmbeddings(FakeEmbeddings):
+    async def create(self, input, model):
+        return FakeEmbeddings.create(self, input, model)
+
+
+@pytest.fixture
+def embeddings(monkeypatch):
+    monkeypatch.setattr(product, "embedding_cache", ResultCache("embeddings", ttl=60))
+    sync, async_ = FakeEmbeddings(), FakeAsyncEmbeddings()
+    product.set_openai_client(SimpleNamespace(embeddings=sync))
+    product.set_openai_client(SimpleNamespace(embeddings=async_), is_async=True)
+    yield sync, async_
+    product.set_openai_client(None)
+    product.set_openai_client(None, is_async=True)
+
+
+def test_requests_differing_in_case_and_spacing_share_an_embedding(embeddings):
+    sync, _ = embeddings
+    first = product.get_embedding("Warm  winter tents")
+    assert product.get_embedding("  warm winter TENTS ") == first
+    assert sync.inputs == ["Warm  winter tents"]
+    assert product.embedding_cache.stats()["hits"] == 1
+
+
+def test_different_requests_are_embedded_separately(embeddings):
+    sync, _ = embeddings
+    assert product.get_embedding("tents") != product.get_embedding("boots")
+    assert len(sync.inputs) == 2
+
+
+def test_sync_and_async_share_the_cache(embeddings):
+    _, async_ = embeddings
+    first = asyncio.run(product.get_embedding_async("Tents"))
+    assert product.get_embedding("tents") == first
+    assert asyncio.run(product.get_embedding_async("TENTS")) == first
+    assert async_.inputs == ["Tents"]
+
+
+def test_cache_key_includes_the_model():
+    assert product._embedding_key("ada", "Tents ") == product._embedding_key("ada", "tents")
+    assert product._embedding_key("ada", "tents") != product._embedding_key("other", "tents")
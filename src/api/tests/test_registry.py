@@ -0,0 +1,59 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from api.agents import registry
+
+
+@pytest.fixture
+def prompty(tmp_path, monkeypatch):
+    path = tmp_path / "agent.prompty"
+    path.write_text("version 1")
+    loads = []
+
+    def load(path, model):
+        text = open(path).read()
+        loads.append(text)
+        return lambda **inputs: text
+
+    monkeypatch.setattr(registry, "AGENTS", {"agent": (str(path), load, {"max_tokens": 10})})
+    monkeypatch.setattr(registry, "_loaded", {})
+    monkeypatch.setattr(registry, "get_model_configuration", lambda: SimpleNamespace(azure_deployment="gpt"))
+    return path, loads
+
+
+def test_agents_are_loaded_once(prompty):
+    _, loads = prompty
+    agent = registry.get_agent("agent")
+    assert registry.get_agent("agent") is agent
+    assert agent(question="tents?") == "version 1"
+    assert loads == ["version 1"]
+
+
+def test_agents_reload_when_the_prompty_changes(prompty):
+    path, loads = prompty
+    first = registry.get_agent("agent")
+    path.write_text("version 2")
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+    second = registry.get_agent("agent")
+    assert second is not first
+    assert second() == "version 2"
+    assert registry.get_agent("agent") is second
+    assert loads == ["version 1", "version 2"]
+
+
+def test_overrides_take_the_place_of_the_prompty(prompty):
+    _, loads = prompty
+    registry.set_agent("agent", "stand-in")
+    try:
+        assert registry.get_agent("agent") == "stand-in"
+    finally:
+        registry.set_agent("agent", None)
+    assert loads == []
+
+
+def test_unknown_agents_are_refused():
+    with pytest.raises(KeyError):
+        registry.get_agent("nobody")
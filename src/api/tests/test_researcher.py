@@ -0,0 +1,79 @@
+import json
+import time
+import threading
+
+from api.agents.researcher import researcher
+
+
+def _plan(*calls):
+    return [
+        {"id": str(i), "function": name, "arguments": json.dumps(args)}
+        for i, (name, args) in enumerate(calls)
+    ]
+
+
+def _sleeper(seconds):
+    def find(query):
+        time.sleep(seconds)
+        return query
+    return find
+
+
+def test_results_come_back_in_plan_order():
+    functions = {"slow": _sleeper(0.1), "fast": _sleeper(0)}
+    research = researcher.execute_tool_calls(
+        _plan(("slow", {"query": "a"}), ("fast", {"query": "b"})), functions, timeout=5
+    )
+    assert [entry["result"] for entry in research] == ["a", "b"]
+
+
+def test_a_call_that_times_out_is_dropped():
+    functions = {"hangs": _sleeper(2), "fast": _sleeper(0)}
+    started = time.monotonic()
+    research = researcher.execute_tool_calls(
+        _plan(("hangs", {"query": "a"}), ("fast", {"query": "b"})), functions, timeout=0.2
+    )
+    assert [entry["result"] for entry in research] == ["b"]
+    assert time.monotonic() - started < 1
+
+
+def test_queued_calls_get_their_own_timeout(monkeypatch):
+    # with one thread, the second call only starts once the first returns
+    monkeypatch.setattr(researcher, "TOOL_CALL_CONCURRENCY", 1)
+    functions = {"find": _sleeper(0.3)}
+    research = researcher.execute_tool_calls(
+        _plan(("find", {"query": "a"}), ("find", {"query": "b"})), functions, timeout=0.4
+    )
+    assert [entry["result"] for entry in research] == ["a", "b"]
+
+
+def test_concurrent_plans_do_not_starve_each_other():
+    functions = {"find": _sleeper(0.2)}
+    kept = []
+
+    def run(i):
+        plan = _plan(*[("find", {"query": f"{i}-{n}"}) for n in range(4)])
+        kept.append(len(researcher.execute_tool_calls(plan, functions, timeout=0.5)))
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert kept == [4, 4, 4]
+
+
+def test_memo_answers_repeated_calls():
+    calls = []
+
+    def find(query):
+        calls.append(query)
+        return query
+
+    memo = researcher.ResearchMemo()
+    plan = _plan(("find", {"query": "a"}))
+    researcher.execute_tool_calls(plan, {"find": find}, memo=memo)
+    research = researcher.execute_tool_calls(plan, {"find": find}, memo=memo)
+    assert calls == ["a"]
+    assert memo.reused == 1
+    assert [entry["result"] for entry in research] == ["a"]
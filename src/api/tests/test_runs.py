@@ -0,0 +1,111 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from api.runs import Run, RunStore, start_in_thread, start_task, article_key
+
+
+def _starter(events, gate=None, started=None):
+    def generate():
+        if gate is not None:
+            gate.wait(5)
+        yield from events
+
+    def start(run):
+        if started is not None:
+            started.append(run)
+        start_in_thread(run, generate())
+    return start
+
+
+def test_identical_requests_share_one_run():
+    store = RunStore()
+    gate, started = threading.Event(), []
+    first = store.get_or_start("key", _starter(["a", "b"], gate, started))
+    second = store.get_or_start("key", _starter(["x"], gate, started))
+    assert first is second
+    assert len(started) == 1
+    gate.set()
+    assert list(first.subscribe()) == list(second.subscribe()) == ["a", "b"]
+    stats = store.stats()
+    assert (stats["started"], stats["coalesced"]) == (1, 1)
+
+
+def test_finished_runs_are_replayed_until_they_expire():
+    store = RunStore(ttl=0.2)
+    run = store.get_or_start("key", _starter(["a"]))
+    assert list(run.subscribe()) == ["a"]
+    assert store.get_or_start("key", _starter(["b"])) is run
+    assert store.stats()["replayed"] == 1
+    time.sleep(0.3)
+    fresh = store.get_or_start("key", _starter(["b"]))
+    assert fresh is not run
+    assert list(fresh.subscribe()) == ["b"]
+
+
+def test_failed_runs_are_dropped():
+    def failing():
+        yield "a"
+        raise RuntimeError("boom")
+
+    store = RunStore()
+    run = store.get_or_start("key", lambda run: start_in_thread(run, failing()))
+    with pytest.raises(RuntimeError):
+        list(run.subscribe())
+    assert store.get_or_start("key", _starter(["b"])) is not run
+    assert store.get(run.id) is None
+
+
+def test_cached_runs_are_capped():
+    store = RunStore(max_runs=2)
+    runs = [store.get_or_start(str(i), _starter([i])) for i in range(3)]
+    for run in runs:
+        list(run.subscribe())
+    store.get_or_start("3", _starter([3]))
+    assert store.get(runs[0].id) is None
+    assert store.get(runs[2].id) is runs[2]
+
+
+def test_runs_resume_by_id_from_a_position():
+    store = RunStore()
+    run = store.start(_starter(["a", "b", "c"]))
+    assert store.get(run.id) is run
+    assert list(run.subscribe(start=1)) == ["b", "c"]
+    assert store.stats()["resumed"] == 1
+    # uncoalesced runs are never handed out for a key
+    assert store.get_or_start(None, _starter(["x"])) is not run
+
+
+def test_late_subscribers_replay_then_follow():
+    run = Run("key")
+    run.publish("a")
+    received = []
+    reader = threading.Thread(target=lambda: received.extend(run.subscribe()))
+    reader.start()
+    run.publish("b")
+    run.finish()
+    reader.join(5)
+    assert received == ["a", "b"]
+
+
+def test_async_subscribers_follow_a_task():
+    async def events():
+        for event in ("a", "b"):
+            await asyncio.sleep(0.01)
+            yield event
+
+    async def follow():
+        run = Run("key")
+        task = start_task(run, events())
+        received = [event async for event in run.subscribe_async()]
+        await task
+        return received
+
+    assert asyncio.run(follow()) == ["a", "b"]
+
+
+def test_article_key_normalizes_inputs():
+    assert article_key(" Tents ", "Short", True) == article_key("tents", "short", True)
+    assert article_key("tents", "short", True) != article_key("tents", "short", False)
@@ -0,0 +1,22 @@
+from api.metrics import timed, STAGE_SECONDS
+from api.timings import Recorder, summarize
+
+
+@timed(STAGE_SECONDS, stage="test_stage")
+def stage():
+    return 1
+
+
+def test_recorder_collects_stage_timings_only_while_watching():
+    recorder = Recorder()
+    with recorder.stages():
+        stage()
+        stage()
+    stage()
+    assert recorder.summary()["test_stage"]["count"] == 2
+
+
+def test_summarize():
+    assert summarize([]) == {"count": 0}
+    summary = summarize([1.0, 2.0, 3.0])
+    assert (summary["count"], summary["max"], summary["p50"]) == (3, 3.0, 2.0)
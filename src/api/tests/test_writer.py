@@ -0,0 +1,43 @@
+from api.agents.writer.writer import ArticleStreamSplitter
+
+
+def _split(chunks):
+    splitter = ArticleStreamSplitter()
+    released = [splitter.feed(chunk) for chunk in chunks]
+    return released, splitter.finish()
+
+
+def test_separator_split_across_chunks():
+    released, rest = _split(["The article", " ends -", "-", "- feedback follows"])
+    assert "".join(released) + rest == "The article ends "
+    # nothing after the separator is released
+    assert released[-1] == ""
+
+
+def test_separator_inside_one_chunk():
+    released, rest = _split(["Tents are great---Needs more detail", "more feedback"])
+    assert released == ["Tents are great", ""]
+    assert rest == ""
+
+
+def test_trailing_dashes_are_held_until_the_next_chunk():
+    splitter = ArticleStreamSplitter()
+    assert splitter.feed("Pack light -") == "Pack light "
+    assert splitter.feed("- and go") == "-- and go"
+
+
+def test_finish_releases_held_dashes():
+    released, rest = _split(["Pack light --"])
+    assert released == ["Pack light "]
+    assert rest == "--"
+
+    released, rest = _split(["Pack light -"])
+    assert released == ["Pack light "]
+    assert rest == "-"
+
+
+def test_stream_without_separator_is_all_article():
+    chunks = ["The best ", "tents for ", "winter camping."]
+    released, rest = _split(chunks)
+    assert "".join(released) + rest == "".join(chunks)
+    assert released == chunks